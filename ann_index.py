@@ -0,0 +1,383 @@
+"""
+Approximate nearest-neighbour indexes over the v3 CLIP image embeddings
+- ExactIndex: brute-force matmul over ImageIndex.matrix (reference / fallback)
+- IVFIndex: inverted-file index (k-means coarse quantizer, numpy only), `nprobe` knob
+- HNSWIndex: hnswlib graph index (optional dependency), `ef` knob
+
+All indexes are attached to an ImageIndex as listeners, so they are updated
+incrementally whenever image_index gains, replaces or loses an entry.
+"""
+
+import threading
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from vector_index import ImageIndex, top_k_rows, to_embedding_row
+
+# Optional imports
+try:
+    import hnswlib
+    HNSWLIB_AVAILABLE = True
+except ImportError:
+    HNSWLIB_AVAILABLE = False
+
+
+class ExactIndex:
+    """Brute-force search over the ImageIndex matrix (100% recall)"""
+
+    name = "exact"
+
+    def __init__(self, source: ImageIndex):
+        self.source = source
+
+    def add(self, file_id: str, vector: np.ndarray):
+        pass
+
+    def remove(self, file_id: str):
+        pass
+
+    def reset(self):
+        pass
+
+    def rebuild(self):
+        pass
+
+    def search(self, query, k: int, ef: Optional[int] = None, nprobe: Optional[int] = None) -> np.ndarray:
+        """Return the ImageIndex rows of the k nearest embeddings, best first"""
+        return top_k_rows(self.source.similarities(query), k)
+
+    def stats(self) -> dict:
+        return {"backend": self.name, "size": len(self.source)}
+
+
+class IVFIndex:
+    """
+    Inverted-file index: embeddings are bucketed by their nearest k-means
+    centroid and a query only scans the `nprobe` closest buckets.
+
+    Until `min_train_size` embeddings exist the index answers exactly. The
+    quantizer is retrained whenever the collection grows `retrain_factor`
+    times past the size it was last trained on. Training runs on a background
+    thread (`background=False` trains inline): until it finishes, new
+    embeddings go into the old buckets, or are searched exactly before the
+    first training, and the new centroids are swapped in afterwards.
+    """
+
+    name = "ivf"
+
+    def __init__(self, source: ImageIndex, nlist: Optional[int] = None, nprobe: int = 8,
+                 min_train_size: int = 2048, retrain_factor: float = 4.0, kmeans_iters: int = 10,
+                 background: bool = True):
+        self.source = source
+        self.fixed_nlist = nlist
+        self.default_nprobe = nprobe
+        self.min_train_size = min_train_size
+        self.retrain_factor = retrain_factor
+        self.kmeans_iters = kmeans_iters
+        self.background = background
+        self._lock = threading.RLock()
+        self.centroids: Optional[np.ndarray] = None
+        self.lists: List[set] = []
+        self._assignment: Dict[str, int] = {}
+        self._trained_size = 0
+        self._generation = 0  # bumped by reset(): a training started before it is discarded
+        self._trainer: Optional[threading.Thread] = None
+        self._collecting = False  # a training took its snapshot and has not installed it yet
+        self._changed_while_training: set = set()
+        self.trainings = 0
+
+    def add(self, file_id: str, vector: np.ndarray):
+        with self._lock:
+            if self._collecting:
+                self._changed_while_training.add(file_id)
+            if self.centroids is None:
+                if len(self.source) >= self.min_train_size:
+                    self._schedule_training()
+                return
+            if len(self.source) >= self._trained_size * self.retrain_factor:
+                self._schedule_training()
+            self._assign(file_id, vector)  # the current centroids keep serving meanwhile
+
+    def remove(self, file_id: str):
+        with self._lock:
+            if self._collecting:
+                self._changed_while_training.add(file_id)
+            self._unassign(file_id)
+
+    def reset(self):
+        with self._lock:
+            self.centroids = None
+            self.lists = []
+            self._assignment = {}
+            self._trained_size = 0
+            self._generation += 1
+
+    def rebuild(self):
+        """Re-index the whole source at once (after a bulk load)"""
+        with self._lock:
+            self.reset()
+            if len(self.source) >= self.min_train_size:
+                self._schedule_training()
+
+    @property
+    def training(self) -> bool:
+        trainer = self._trainer
+        return trainer is not None and trainer.is_alive()
+
+    def wait_for_training(self, timeout: Optional[float] = None) -> bool:
+        """Block until a background training finishes; False on timeout"""
+        trainer = self._trainer
+        if trainer is not None:
+            trainer.join(timeout)
+        return not self.training
+
+    def _schedule_training(self):
+        if self.training:
+            return  # the running training reconciles whatever changes meanwhile
+        if not self.background:
+            self.train()
+            return
+        self._trainer = threading.Thread(target=self.train, name="ivf-train", daemon=True)
+        self._trainer.start()
+
+    def train(self):
+        """
+        (Re)build the coarse quantizer from every embedding in the source. k-means
+        runs on a snapshot without holding any lock; embeddings added or removed
+        meanwhile are re-assigned when the new buckets are installed.
+        """
+        with self.source.lock:
+            matrix = self.source.matrix.copy()
+            ids = list(self.source.ids)
+            with self._lock:
+                generation = self._generation
+                self._collecting = True
+                self._changed_while_training = set()
+        if not ids:
+            with self._lock:
+                self._collecting = False
+                if generation == self._generation:
+                    self.reset()
+            return
+
+        try:
+            centroids, labels = self._kmeans(matrix)
+        except BaseException:
+            with self._lock:
+                self._collecting = False  # keep serving (and updating) the current buckets
+                self._changed_while_training = set()
+            raise
+        lists = [set() for _ in range(centroids.shape[0])]
+        assignment = {}
+        for file_id, label in zip(ids, labels):
+            lists[int(label)].add(file_id)
+            assignment[file_id] = int(label)
+
+        with self.source.lock, self._lock:
+            self._collecting = False
+            if generation != self._generation:
+                self._changed_while_training = set()
+                return  # the index was reset while training
+            self.centroids, self.lists, self._assignment = centroids, lists, assignment
+            self._trained_size = len(ids)
+            for file_id in self._changed_while_training:
+                if self.source.row_of(file_id) is not None:
+                    self._assign(file_id, self.source.embedding_of(file_id))
+                else:
+                    self._unassign(file_id)
+            self._changed_while_training = set()
+            self.trainings += 1
+
+    def _kmeans(self, matrix: np.ndarray):
+        """Centroids (nlist x dim) and the bucket of every row"""
+        n = matrix.shape[0]
+        nlist = self.fixed_nlist or max(1, int(np.sqrt(n)))
+        nlist = min(nlist, n)
+        rng = np.random.default_rng(0)
+        sample = matrix[rng.choice(n, size=min(n, nlist * 64), replace=False)]
+        centroids = sample[rng.choice(sample.shape[0], size=nlist, replace=False)].copy()
+        for _ in range(self.kmeans_iters):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            for c in range(nlist):
+                members = sample[labels == c]
+                if len(members):
+                    centroid = members.mean(axis=0)
+                    centroids[c] = centroid / max(np.linalg.norm(centroid), 1e-12)
+        centroids = centroids.astype(np.float32)
+        return centroids, np.argmax(matrix @ centroids.T, axis=1)
+
+    def search(self, query, k: int, ef: Optional[int] = None, nprobe: Optional[int] = None) -> np.ndarray:
+        query = to_embedding_row(query, self.source.dim)
+        with self._lock:
+            if self.centroids is None:
+                return top_k_rows(self.source.similarities(query), k)
+            nprobe = min(nprobe or self.default_nprobe, len(self.lists))
+            probe = top_k_rows(self.centroids @ query, nprobe)
+            candidate_ids = [fid for bucket in probe for fid in self.lists[int(bucket)]]
+        rows = self.source.rows_of(candidate_ids)
+        if len(rows) == 0:
+            return rows
+        sims = self.source.matrix[rows] @ query
+        return rows[top_k_rows(sims, k)]
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.name,
+            "size": len(self.source),
+            "trained": self.centroids is not None,
+            "training": self.training,
+            "trainings": self.trainings,
+            "nlist": len(self.lists),
+            "default_nprobe": self.default_nprobe,
+        }
+
+    def _unassign(self, file_id: str):
+        bucket = self._assignment.pop(file_id, None)
+        if bucket is not None:
+            self.lists[bucket].discard(file_id)
+
+    def _assign(self, file_id: str, vector: np.ndarray):
+        self._unassign(file_id)
+        bucket = int(np.argmax(self.centroids @ vector))
+        self.lists[bucket].add(file_id)
+        self._assignment[file_id] = bucket
+
+
+class HNSWIndex:
+    """Hierarchical navigable small-world graph index backed by hnswlib"""
+
+    name = "hnsw"
+
+    def __init__(self, source: ImageIndex, M: int = 16, ef_construction: int = 200,
+                 ef: int = 64, initial_capacity: int = 4096):
+        if not HNSWLIB_AVAILABLE:
+            raise RuntimeError("hnswlib is not installed - pip install hnswlib or use ANN_BACKEND=ivf")
+        self.source = source
+        self.M = M
+        self.ef_construction = ef_construction
+        self.default_ef = ef
+        self._initial_capacity = initial_capacity
+        self._lock = threading.RLock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._graph = hnswlib.Index(space="ip", dim=self.source.dim)
+            self._graph.init_index(max_elements=self._initial_capacity, ef_construction=self.ef_construction, M=self.M)
+            self._graph.set_ef(self.default_ef)
+            self._labels: Dict[str, int] = {}
+            self._file_ids: Dict[int, str] = {}
+            self._next_label = 0
+
+    def rebuild(self):
+        """Re-index the whole source with one batched insert (after a bulk load)"""
+        with self._lock:
+            self.reset()
+            file_ids = list(self.source.ids)
+            if not file_ids:
+                return
+            if len(file_ids) > self._graph.get_max_elements():
+                self._graph.resize_index(len(file_ids))
+            self._graph.add_items(np.ascontiguousarray(self.source.matrix), np.arange(len(file_ids)))
+            self._labels = {file_id: label for label, file_id in enumerate(file_ids)}
+            self._file_ids = dict(enumerate(file_ids))
+            self._next_label = len(file_ids)
+
+    def add(self, file_id: str, vector: np.ndarray):
+        with self._lock:
+            old_label = self._labels.get(file_id)
+            if old_label is not None:
+                self._graph.mark_deleted(old_label)
+                del self._file_ids[old_label]
+            if self._next_label >= self._graph.get_max_elements():
+                self._graph.resize_index(self._graph.get_max_elements() * 2)
+            label = self._next_label
+            self._next_label += 1
+            self._graph.add_items(vector.reshape(1, -1), np.array([label]))
+            self._labels[file_id] = label
+            self._file_ids[label] = file_id
+
+    def remove(self, file_id: str):
+        with self._lock:
+            label = self._labels.pop(file_id, None)
+            if label is not None:
+                self._graph.mark_deleted(label)
+                del self._file_ids[label]
+
+    def search(self, query, k: int, ef: Optional[int] = None, nprobe: Optional[int] = None) -> np.ndarray:
+        query = to_embedding_row(query, self.source.dim)
+        with self._lock:
+            size = len(self._labels)
+            if size == 0:
+                return np.empty(0, dtype=np.int64)
+            k = min(k, size)
+            # ef is a graph-wide setting in hnswlib, so it is set and reset under the lock
+            self._graph.set_ef(max(ef or self.default_ef, k))
+            try:
+                labels, _ = self._graph.knn_query(query, k=k)
+            finally:
+                self._graph.set_ef(self.default_ef)
+            file_ids = [self._file_ids[int(label)] for label in labels[0] if int(label) in self._file_ids]
+        return self.source.rows_of(file_ids)
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.name,
+            "size": len(self._labels),
+            "M": self.M,
+            "ef_construction": self.ef_construction,
+            "default_ef": self.default_ef,
+        }
+
+
+def create_ann_index(source: ImageIndex, backend: str = "exact", **options):
+    """Build the configured ANN backend and attach it to the ImageIndex"""
+    backend = (backend or "exact").lower()
+    if backend == "hnsw" and not HNSWLIB_AVAILABLE:
+        print("⚠️ hnswlib not available, falling back to IVF index")
+        backend = "ivf"
+
+    if backend == "hnsw":
+        index = HNSWIndex(source, **options)
+    elif backend == "ivf":
+        index = IVFIndex(source, **options)
+    else:
+        index = ExactIndex(source)
+
+    # Index whatever is already loaded, then follow future changes
+    index.rebuild()
+    source.add_listener(index)
+    return index
+
+
+def compare_with_exact(ann, queries: np.ndarray, k: int, ef: Optional[int] = None, nprobe: Optional[int] = None) -> dict:
+    """Recall@k and mean latency of an ANN index against brute force"""
+    exact = ExactIndex(ann.source)
+    recalls = []
+    exact_time = 0.0
+    ann_time = 0.0
+    for query in queries:
+        start = time.perf_counter()
+        truth = exact.search(query, k)
+        exact_time += time.perf_counter() - start
+
+        start = time.perf_counter()
+        approx = ann.search(query, k, ef=ef, nprobe=nprobe)
+        ann_time += time.perf_counter() - start
+
+        if len(truth):
+            recalls.append(len(set(truth.tolist()) & set(approx.tolist())) / len(truth))
+
+    count = max(1, len(queries))
+    return {
+        "backend": ann.name,
+        "k": k,
+        "ef": ef,
+        "nprobe": nprobe,
+        "queries": len(queries),
+        "recall_at_k": round(float(np.mean(recalls)), 4) if recalls else None,
+        "exact_ms": round(exact_time * 1000 / count, 3),
+        "ann_ms": round(ann_time * 1000 / count, 3),
+    }
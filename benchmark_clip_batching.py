@@ -0,0 +1,80 @@
+"""
+CPU throughput benchmark for batched CLIP image encoding
+- Direct: one forward pass per batch of N images, for several batch sizes
+- Coalesced: T threads submitting single images through BatchingEncoder
+  (the pattern the crawler uses), reporting the batch sizes that formed
+
+Usage:
+    python benchmark_clip_batching.py --images 64 --batch-sizes 1,2,4,8,16,32 --threads 8
+"""
+
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import torch
+from PIL import Image
+from transformers import CLIPModel, CLIPProcessor
+
+from clip_batch_encoder import BatchingEncoder, clip_image_batch_fn
+
+
+def synthetic_images(count, size=(640, 480), seed=0):
+    """Random RGB photos-sized images (the processor resizes/crops them like real ones)"""
+    rng = np.random.default_rng(seed)
+    return [Image.fromarray(rng.integers(0, 256, (size[1], size[0], 3), dtype=np.uint8)) for _ in range(count)]
+
+
+def bench_direct(encode_batch, images, batch_size):
+    encode_batch(images[:batch_size])  # warm-up
+    start = time.perf_counter()
+    for i in range(0, len(images), batch_size):
+        encode_batch(images[i:i + batch_size])
+    return len(images) / (time.perf_counter() - start)
+
+
+def bench_coalesced(encode_batch, images, batch_size, threads, max_wait):
+    encoder = BatchingEncoder(encode_batch, max_batch_size=batch_size, max_wait=max_wait)
+    encoder.encode(images[0])  # warm-up, starts the worker
+    encoder.batches = encoder.items = 0
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(encoder.encode, images))
+    elapsed = time.perf_counter() - start
+    stats = encoder.stats()
+    encoder.close()
+    return len(images) / elapsed, stats["avg_batch_size"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="openai/clip-vit-base-patch32")
+    parser.add_argument("--images", type=int, default=64)
+    parser.add_argument("--batch-sizes", default="1,2,4,8,16,32")
+    parser.add_argument("--threads", type=int, default=8, help="submitting threads for the coalesced run")
+    parser.add_argument("--max-wait-ms", type=float, default=30)
+    parser.add_argument("--torch-threads", type=int, default=0, help="torch.set_num_threads (0 = default)")
+    args = parser.parse_args()
+
+    if args.torch_threads:
+        torch.set_num_threads(args.torch_threads)
+    batch_sizes = [int(b) for b in args.batch_sizes.split(",")]
+
+    print(f"📦 Loading {args.model} on CPU ({torch.get_num_threads()} torch threads)")
+    model = CLIPModel.from_pretrained(args.model).eval()
+    processor = CLIPProcessor.from_pretrained(args.model)
+    encode_batch = clip_image_batch_fn(processor, model, "cpu")
+    images = synthetic_images(args.images)
+
+    print(f"\n{'batch':>6} {'direct img/s':>13} {'speedup':>8} {'coalesced img/s':>16} {'avg batch':>10}")
+    baseline = None
+    for batch_size in batch_sizes:
+        direct = bench_direct(encode_batch, images, batch_size)
+        baseline = baseline or direct
+        coalesced, avg_batch = bench_coalesced(encode_batch, images, batch_size, args.threads, args.max_wait_ms / 1000)
+        print(f"{batch_size:>6} {direct:>13.1f} {direct / baseline:>7.2f}x {coalesced:>16.1f} {avg_batch:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
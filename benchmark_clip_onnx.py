@@ -0,0 +1,119 @@
+"""
+CPU benchmark: PyTorch CLIP vs ONNX Runtime fp32 vs ONNX Runtime int8
+- Image tower: throughput (img/s) at several batch sizes
+- Text tower: single-query latency (p50 / p95 ms, the search path) and batch throughput
+- Agreement: min / mean cosine of each ONNX backend's embeddings against PyTorch
+  (how compatible new vectors are with the stored ones)
+
+Usage:
+    python benchmark_clip_onnx.py --images 64 --batch-sizes 1,8,32 --queries 50 --onnx-dir clip_onnx
+"""
+
+import argparse
+import time
+
+import numpy as np
+import torch
+from transformers import CLIPModel, CLIPProcessor
+
+from benchmark_clip_batching import synthetic_images
+from onnx_clip_backend import (PROBE_TEXTS, ONNXClipBackend, embedding_agreement, ensure_exported,
+                               torch_clip_embeddings)
+
+QUERIES = ["modern kitchen with purple island", "bright bedroom with wooden floor", "living room with grey sofa",
+           "bathroom with white tiles", "office with large windows", "kids room with bunk bed",
+           "balcony with plants", "dining table for eight people"]
+
+
+def torch_backend(model, processor):
+    """PyTorch path with the same encode_images / encode_texts interface as ONNXClipBackend"""
+    class TorchBackend:
+        name = "torch"
+
+        def encode_images(self, images):
+            return torch_clip_embeddings(model, processor, images=images)
+
+        def encode_texts(self, texts):
+            return torch_clip_embeddings(model, processor, texts=texts)
+    return TorchBackend()
+
+
+def bench_images(backend, images, batch_size):
+    backend.encode_images(images[:batch_size])  # warm-up
+    start = time.perf_counter()
+    for i in range(0, len(images), batch_size):
+        backend.encode_images(images[i:i + batch_size])
+    return len(images) / (time.perf_counter() - start)
+
+
+def bench_text_latency(backend, queries, repeats):
+    backend.encode_texts(queries[:1])  # warm-up
+    latencies = []
+    for i in range(repeats):
+        start = time.perf_counter()
+        backend.encode_texts([queries[i % len(queries)]])
+        latencies.append((time.perf_counter() - start) * 1000)
+    return np.percentile(latencies, 50), np.percentile(latencies, 95)
+
+
+def bench_text_throughput(backend, queries, batch_size=32, rounds=4):
+    batch = (queries * (batch_size // len(queries) + 1))[:batch_size]
+    backend.encode_texts(batch)
+    start = time.perf_counter()
+    for _ in range(rounds):
+        backend.encode_texts(batch)
+    return batch_size * rounds / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="openai/clip-vit-base-patch32")
+    parser.add_argument("--onnx-dir", default="clip_onnx")
+    parser.add_argument("--images", type=int, default=64)
+    parser.add_argument("--batch-sizes", default="1,8,32")
+    parser.add_argument("--queries", type=int, default=50, help="single-query text encodes for the latency run")
+    parser.add_argument("--threads", type=int, default=0, help="torch / onnxruntime intra-op threads (0 = default)")
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    batch_sizes = [int(b) for b in args.batch_sizes.split(",")]
+
+    print(f"📦 Loading {args.model} on CPU ({torch.get_num_threads()} torch threads)")
+    model = CLIPModel.from_pretrained(args.model).eval()
+    processor = CLIPProcessor.from_pretrained(args.model)
+    ensure_exported(model, args.model, args.onnx_dir, quantized=True)
+    backends = [torch_backend(model, processor)] + [
+        ONNXClipBackend(args.onnx_dir, processor, quantized=quantized, threads=args.threads or None)
+        for quantized in (False, True)
+    ]
+    images = synthetic_images(args.images)
+
+    reference = {"image": torch_clip_embeddings(model, processor, images=images[:16]),
+                 "text": torch_clip_embeddings(model, processor, texts=PROBE_TEXTS + QUERIES)}
+    print(f"\n{'backend':>10} {'image cos min/mean':>20} {'text cos min/mean':>19}")
+    for backend in backends[1:]:
+        image = embedding_agreement(reference["image"], backend.encode_images(images[:16]))
+        text = embedding_agreement(reference["text"], backend.encode_texts(PROBE_TEXTS + QUERIES))
+        print(f"{backend.name:>10} {image['min_cosine']:>9.4f}/{image['mean_cosine']:<10.4f}"
+              f" {text['min_cosine']:>8.4f}/{text['mean_cosine']:<10.4f}")
+
+    print(f"\n{'backend':>10} {'batch':>6} {'img/s':>8} {'speedup':>8}")
+    baseline = {}
+    for backend in backends:
+        for batch_size in batch_sizes:
+            rate = bench_images(backend, images, batch_size)
+            baseline.setdefault(batch_size, rate)
+            print(f"{backend.name:>10} {batch_size:>6} {rate:>8.1f} {rate / baseline[batch_size]:>7.2f}x")
+
+    print(f"\n{'backend':>10} {'query p50 ms':>13} {'p95 ms':>8} {'speedup':>8} {'texts/s (32)':>13}")
+    base_p50 = None
+    for backend in backends:
+        p50, p95 = bench_text_latency(backend, QUERIES, args.queries)
+        base_p50 = base_p50 or p50
+        print(f"{backend.name:>10} {p50:>13.1f} {p95:>8.1f} {base_p50 / p50:>7.2f}x"
+              f" {bench_text_throughput(backend, QUERIES):>13.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+Micro-batching encoder for CLIP image embeddings
+- Callers submit one decoded image at a time from any thread
+- A single worker thread collects submissions until `max_batch_size` images are
+  waiting or `max_wait` seconds have passed since the first one arrived
+- One forward pass per batch; row i of the output is routed back to the
+  caller that submitted image i
+- `encode_many` batches a list the caller already holds (e.g. an upload)
+"""
+
+import contextlib
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, List, Optional, Sequence
+
+_STOP = object()  # shutdown marker on the submission queue
+
+
+class BatchingEncoder:
+    """
+    Coalesce single-item encode calls into batched `encode_batch(items)` calls.
+
+    `encode_batch` receives a list of items and returns something indexable by
+    row (a tensor or array with one row per item, or a list).
+    """
+
+    def __init__(self, encode_batch: Callable[[List[Any]], Any], max_batch_size: int = 16,
+                 max_wait: float = 0.05, name: str = "clip-batch"):
+        self.encode_batch = encode_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait)
+        self.name = name
+        self.batches = 0
+        self.items = 0
+        self._queue: queue.Queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker: Optional[threading.Thread] = None
+
+    def submit(self, item) -> Future:
+        """Queue one item; the future resolves to its embedding row"""
+        future: Future = Future()
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._worker.start()
+            self._queue.put((item, future))
+        return future
+
+    def encode(self, item, timeout: Optional[float] = None):
+        """Encode one item, sharing a forward pass with concurrent callers"""
+        return self.submit(item).result(timeout)
+
+    def encode_many(self, items: Sequence) -> list:
+        """Encode a list in batches of max_batch_size; returns one row per item, in order"""
+        rows = []
+        for start in range(0, len(items), self.max_batch_size):
+            batch = list(items[start:start + self.max_batch_size])
+            outputs = self._run_batch(batch)
+            rows.extend(outputs[i] for i in range(len(batch)))
+        return rows
+
+    def close(self, timeout: Optional[float] = None):
+        """Finish queued work and stop the worker thread"""
+        with self._lock:
+            worker, self._worker = self._worker, None
+        if worker is not None:
+            self._queue.put(_STOP)
+            worker.join(timeout)
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": round(self.items / self.batches, 2) if self.batches else 0.0,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": round(self.max_wait * 1000, 1),
+        }
+
+    # ---------------------------
+    # worker
+    # ---------------------------
+    def _run_batch(self, items: List[Any]):
+        outputs = self.encode_batch(items)
+        with self._lock:
+            self.batches += 1
+            self.items += len(items)
+        return outputs
+
+    def _collect(self, first) -> tuple:
+        """Gather more submissions until the batch is full or the wait window closes"""
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                entry = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if entry is _STOP:
+                return batch, True
+            batch.append(entry)
+        return batch, False
+
+    def _wait_for_capacity(self):
+        """Called before each batch is collected; subclasses wait here while their backend is busy"""
+
+    def _dispatch(self, batch: List[tuple]):
+        """Encode one collected batch of (item, future) and resolve the futures"""
+        try:
+            outputs = self._run_batch([item for item, _ in batch])
+            for i, (_, future) in enumerate(batch):
+                future.set_result(outputs[i])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            first = self._queue.get()
+            if first is _STOP:
+                break
+            self._wait_for_capacity()  # submissions keep queuing meanwhile, so the batch fills up
+            batch, stopping = self._collect(first)
+            batch = [(item, future) for item, future in batch if future.set_running_or_notify_cancel()]
+            if batch:
+                self._dispatch(batch)
+
+
+def clip_image_batch_fn(clip_processor, clip_model, device="cpu", lock: Optional[threading.Lock] = None) -> Callable:
+    """
+    Build encode_batch for BatchingEncoder: PIL images -> L2-normalized CLIP
+    image embeddings (CPU tensor, one row per image). `lock` serializes model
+    access with other users of the same model.
+    """
+    import torch
+
+    def encode_images(images: List[Any]):
+        inputs = clip_processor(images=list(images), return_tensors="pt")
+        inputs = {k: v.to(device) for k, v in inputs.items()}
+        with lock or contextlib.nullcontext(), torch.no_grad():
+            features = clip_model.get_image_features(**inputs)
+        return (features / features.norm(dim=-1, keepdim=True)).cpu()
+
+    return encode_images
@@ -0,0 +1,466 @@
+"""
+Concurrent breadth-first Google Drive crawler
+- Folder listings run on a bounded thread pool (work queue, breadth-first)
+- Listings are paged (nextPageToken) with one combined images+subfolders query
+  per folder, and every page is handed downstream as soon as it arrives
+- Discovered images are handed to a processing callback on a second pool,
+  so downloads and model work overlap with listing instead of waiting on it
+- Same Samsung/backup skip rules and `max_images` semantics as the old
+  recursive crawl_drive_images
+- Incremental mode: the Drive changes feed (startPageToken) is turned into
+  adds/updates/deletes under the target folder, so a sync does not re-walk the tree
+"""
+
+import json
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+FOLDER_MIME_TYPE = "application/vnd.google-apps.folder"
+
+# File names containing any of these come from the Samsung / external-disk backup, not the shared drive
+BACKUP_KEYWORDS = ["סמסונג", "Samsung", "גיבוי", "backup", "מדיסק", "חיצוני"]
+
+
+def is_backup_file(file_name: str) -> bool:
+    return any(keyword in file_name for keyword in BACKUP_KEYWORDS)
+
+
+def subfolder_path(parent_path: str, name: str) -> str:
+    """Display path of a subfolder (top-level folders are not prefixed with 'Root')"""
+    return f"{parent_path}/{name}" if parent_path != "Root" else name
+
+
+def per_thread_service(service) -> Callable:
+    """
+    googleapiclient services are not thread-safe (one httplib2 connection), so
+    give every worker thread its own service built from the same credentials.
+    Falls back to the shared service if its credentials cannot be reused.
+    """
+    local = threading.local()
+
+    def get_service():
+        if not hasattr(local, "service"):
+            try:
+                from googleapiclient.discovery import build
+                local.service = build("drive", "v3", credentials=service._http.credentials, cache_discovery=False)
+            except Exception:
+                local.service = service
+        return local.service
+
+    return get_service
+
+
+def iter_folder_pages(service, folder_id: str, page_size: int = 1000,
+                      file_fields: str = "id,name,mimeType,parents,md5Checksum") -> Iterator[Tuple[List[dict], List[dict]]]:
+    """
+    Yield (images, subfolders) for each page of a folder listing.
+
+    One query returns both images and subfolders, only the needed fields are
+    requested, and nextPageToken is followed so large folders are not truncated.
+    """
+    query = (f"'{folder_id}' in parents and trashed=false and "
+             f"(mimeType contains 'image/' or mimeType='{FOLDER_MIME_TYPE}')")
+    page_token = None
+    while True:
+        results = service.files().list(
+            q=query,
+            fields=f"nextPageToken,files({file_fields})",
+            pageSize=page_size,
+            pageToken=page_token
+        ).execute()
+        files = results.get("files", [])
+        subfolders = [f for f in files if f.get("mimeType") == FOLDER_MIME_TYPE]
+        images = [f for f in files if f.get("mimeType") != FOLDER_MIME_TYPE]
+        yield images, subfolders
+        page_token = results.get("nextPageToken")
+        if not page_token:
+            return
+
+
+_FOLDER_DONE = object()  # end-of-folder marker on the page queue
+
+
+class DriveCrawler:
+    """
+    Breadth-first work-queue crawl of a Drive folder tree.
+
+    `process_image(service, file, folder_id, folder_path)` indexes one image and
+    returns True if it was added. `is_indexed(file_id)` lets already indexed
+    images be skipped; `prefetch_indexed(file_ids)` is called once per listing
+    page so those checks can be answered in bulk. Crawling stops once
+    `current_count()` reaches `max_images`; images are only dispatched while there is room for them, so the
+    limit is never overshot by in-flight work.
+
+    An optional `journal` (index_journal.IndexJournal) records every listed page,
+    completed folder and processed file, so an interrupted crawl can be resumed.
+    An optional `job` (indexing_jobs.IndexingJob) receives listing progress and
+    image outcomes; pausing it holds dispatch, cancelling it stops the crawl.
+    """
+
+    def __init__(self, service, process_image: Callable, is_indexed: Optional[Callable] = None,
+                 current_count: Optional[Callable] = None, max_images: Optional[int] = None,
+                 list_workers: int = 4, process_workers: int = 4,
+                 service_factory: Optional[Callable] = None, lister: Callable = iter_folder_pages,
+                 prefetch_indexed: Optional[Callable] = None, journal=None, job=None):
+        self.process_image = process_image
+        self.is_indexed = is_indexed
+        self.prefetch_indexed = prefetch_indexed
+        self.current_count = current_count or (lambda: self.stats["indexed"])
+        self.max_images = max_images
+        self.list_workers = max(1, list_workers)
+        self.process_workers = max(1, process_workers)
+        self.service_factory = service_factory or (lambda: service)
+        self.lister = lister
+        self.journal = journal
+        self.job = job
+        self.stats: Dict[str, int] = {"folders": 0, "images_found": 0, "skipped_backup": 0,
+                                      "skipped_indexed": 0, "indexed": 0, "failed": 0}
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._stopped = False
+        # Backpressure: never queue more than a few images per processing worker
+        self._slots = threading.BoundedSemaphore(self.process_workers * 4)
+
+    # ---------------------------
+    # budget (max_images)
+    # ---------------------------
+    def _limit_reached(self) -> bool:
+        return self.max_images is not None and self.current_count() >= self.max_images
+
+    def _reserve(self) -> bool:
+        """Claim room for one more image, waiting for in-flight work if it may still fail"""
+        if self.max_images is None:
+            return True
+        with self._cond:
+            while self._in_flight and self.current_count() + self._in_flight >= self.max_images:
+                self._cond.wait()
+            if self.current_count() >= self.max_images:
+                if not self._stopped:
+                    print(f"🛑 Reached limit of {self.max_images} images, stopping crawl")
+                self._stopped = True
+                return False
+            self._in_flight += 1
+            return True
+
+    def _release(self):
+        if self.max_images is None:
+            return
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify_all()
+
+    def _count(self, key: str):
+        with self._cond:
+            self.stats[key] += 1
+
+    def _report(self, outcome: str):
+        if self.job is not None:
+            self.job.image_done(outcome)
+
+    # ---------------------------
+    # stages
+    # ---------------------------
+    def _list(self, folder_id: str, folder_path: str, pages: queue.Queue):
+        """List one folder, putting each page on `pages` as it arrives, then an end marker"""
+        print(f"🔍 Crawling folder: {folder_path} (ID: {folder_id})")
+        error = None
+        try:
+            for images, subfolders in self.lister(self.service_factory(), folder_id):
+                pages.put((folder_id, folder_path, images, subfolders, None))
+                if self._stopped:
+                    break
+        except Exception as e:
+            error = e
+        pages.put((folder_id, folder_path, None, None, error or _FOLDER_DONE))
+
+    def _process(self, file: dict, folder_id: str, folder_path: str):
+        try:
+            if self.is_indexed and self.is_indexed(file["id"]):
+                print(f"   ⏭️ Skipping {file['name']} - already indexed")
+                self._count("skipped_indexed")
+                self._report("skipped")
+                if self.journal:
+                    self.journal.file_done(file["id"])
+                return
+            if self.process_image(self.service_factory(), file, folder_id, folder_path):
+                self._count("indexed")
+                self._report("indexed")
+                if self.journal:
+                    self.journal.file_done(file["id"])
+            else:  # failures are not journaled as done, so a resumed crawl retries them
+                self._count("failed")
+                self._report("failed")
+                if self.journal:
+                    self.journal.file_failed(file["id"])
+        except Exception as e:
+            print(f"   ❌ Failed to process {file.get('name')}: {e}")
+            self._count("failed")
+            self._report("failed")
+            if self.journal:
+                self.journal.file_failed(file["id"])
+        finally:
+            self._release()
+            self._slots.release()
+
+    def _dispatch(self, pool: ThreadPoolExecutor, file: dict, folder_id: str, folder_path: str, futures: set):
+        self._count("images_found")
+        if is_backup_file(file["name"]):
+            print(f"   ⏭️ Skipping Samsung backup file: {file['name']}")
+            self._count("skipped_backup")
+            self._report("skipped")
+            return
+        if self.job is not None and not self.job.wait_if_paused():  # blocks while the job is paused
+            if not self._stopped:
+                print("🛑 Indexing job cancelled, stopping crawl")
+            self._stopped = True
+            return
+        if not self._reserve():
+            return
+        self._slots.acquire()
+        futures.add(pool.submit(self._process, file, folder_id, folder_path))
+
+    def _prefetch(self, file_ids: List[str]):
+        if self.prefetch_indexed and file_ids and not self._stopped:
+            try:
+                self.prefetch_indexed(file_ids)
+            except Exception as e:
+                print(f"   ⚠️ Bulk indexed-check failed, checking per image: {e}")
+
+    def crawl(self, root_id: str, root_path: str, resume=None) -> Dict[str, int]:
+        """
+        Crawl root_id and everything below it; returns crawl statistics.
+        `resume` (index_journal.JournalState) continues an interrupted crawl instead:
+        only its pending folders are listed and its pending images processed.
+        """
+        if self._limit_reached():
+            print(f"🛑 Reached limit of {self.max_images} images, stopping crawl")
+            return dict(self.stats)
+
+        start_folders = resume.pending_folders if resume is not None else [(root_id, root_path)]
+        process_futures: set = set()
+        pages: queue.Queue = queue.Queue()
+        with ThreadPoolExecutor(max_workers=self.list_workers, thread_name_prefix="drive-list") as list_pool, \
+                ThreadPoolExecutor(max_workers=self.process_workers, thread_name_prefix="drive-process") as process_pool:
+            list_futures = [list_pool.submit(self._list, folder_id, folder_path, pages)
+                            for folder_id, folder_path in start_folders]
+            folders_open = len(list_futures)
+            if self.job is not None:
+                self.job.folders_queued(folders_open)
+
+            if resume is not None:
+                pending_images = resume.pending_images
+                print(f"♻️ Resuming crawl: {len(start_folders)} folders to list, {len(pending_images)} listed images to process")
+                if self.job is not None:
+                    self.job.images_listed(len(pending_images))
+                self._prefetch([file["id"] for file, _, _ in pending_images if not is_backup_file(file["name"])])
+                for file, folder_id, folder_path in pending_images:
+                    if self._stopped:
+                        break
+                    self._dispatch(process_pool, file, folder_id, folder_path, process_futures)
+
+            while folders_open:
+                folder_id, folder_path, images, subfolders, status = pages.get()
+                if status is not None:
+                    folders_open -= 1
+                    self._count("folders")
+                    if self.job is not None:
+                        self.job.folder_listed()
+                    if status is not _FOLDER_DONE:
+                        print(f"   ❌ Error crawling folder {folder_path}: {status}")
+                    elif self.journal and not self._stopped:
+                        self.journal.folder_listed(folder_id)
+                    continue
+                print(f"   📸 Found {len(images)} images and {len(subfolders)} subfolders in {folder_path}")
+                if self.journal:
+                    self.journal.folder_page(folder_id, folder_path, images, subfolders)
+                if self.job is not None:
+                    self.job.images_listed(len(images))
+
+                if self.job is not None and self.job.cancelled:
+                    self._stopped = True
+                if not self._stopped:
+                    for folder in subfolders:
+                        child_path = subfolder_path(folder_path, folder["name"])
+                        list_futures.append(list_pool.submit(self._list, folder["id"], child_path, pages))
+                        folders_open += 1
+                    if self.job is not None:
+                        self.job.folders_queued(len(subfolders))
+                self._prefetch([f["id"] for f in images if not is_backup_file(f["name"])])
+                for file in images:
+                    if self._stopped:
+                        break
+                    self._dispatch(process_pool, file, folder_id, folder_path, process_futures)
+                process_futures = {f for f in process_futures if not f.done()}
+
+                if self._stopped and list_futures:
+                    # Drop folders that have not started listing; running ones finish their current page
+                    folders_open -= sum(1 for f in list_futures if f.cancel())
+                    list_futures = []
+            wait(process_futures)
+
+        print(f"✅ Crawl finished: {self.stats}")
+        return dict(self.stats)
+
+
+# ---------------------------
+# incremental sync (changes feed)
+# ---------------------------
+CHANGE_FIELDS = ("nextPageToken,newStartPageToken,"
+                 "changes(fileId,removed,file(id,name,mimeType,parents,trashed,md5Checksum))")
+
+
+def get_start_page_token(service) -> str:
+    """Token marking "now" in the changes feed; store it before a full crawl"""
+    return service.changes().getStartPageToken(supportsAllDrives=True).execute()["startPageToken"]
+
+
+def iter_changes(service, page_token: str, page_size: int = 1000) -> Iterator[Tuple[List[dict], Optional[str]]]:
+    """Yield (changes, new_start_page_token) pages; the token is only set on the last page"""
+    while page_token:
+        results = service.changes().list(
+            pageToken=page_token,
+            fields=CHANGE_FIELDS,
+            pageSize=page_size,
+            spaces="drive",
+            includeItemsFromAllDrives=True,
+            supportsAllDrives=True
+        ).execute()
+        yield results.get("changes", []), results.get("newStartPageToken")
+        page_token = results.get("nextPageToken")
+
+
+class FolderPaths:
+    """Resolve folder ids to display paths under one root, with a lookup cache"""
+
+    def __init__(self, service, root_id: str, root_path: str):
+        self.service = service
+        self.root_id = root_id
+        self.root_path = root_path
+        self._folders: Dict[str, Optional[dict]] = {}
+
+    def _folder(self, folder_id: str) -> Optional[dict]:
+        if folder_id not in self._folders:
+            try:
+                self._folders[folder_id] = self.service.files().get(
+                    fileId=folder_id, fields="id,name,parents,trashed", supportsAllDrives=True).execute()
+            except Exception:
+                self._folders[folder_id] = None  # deleted or not visible to us
+        return self._folders[folder_id]
+
+    def remember(self, folder: dict):
+        """Use the folder resource from a change instead of fetching it again"""
+        self._folders[folder["id"]] = folder
+
+    def path_of(self, folder_id: str, include_trashed: bool = False) -> Optional[str]:
+        """Display path of folder_id, or None if it is not (or no longer) under the root"""
+        chain = []
+        seen = set()
+        while folder_id != self.root_id:
+            folder = self._folder(folder_id)
+            if folder is None or folder_id in seen or (folder.get("trashed") and not include_trashed):
+                return None
+            seen.add(folder_id)
+            chain.append(folder["name"])
+            parents = folder.get("parents") or []
+            if not parents:
+                return None
+            folder_id = parents[0]
+        path = self.root_path
+        for name in reversed(chain):
+            path = subfolder_path(path, name)
+        return path
+
+
+class DriveChanges:
+    """What a changes-feed sync has to apply to the index"""
+
+    def __init__(self):
+        self.upserts: Dict[str, Tuple[dict, str, str]] = {}  # file_id -> (file, folder_id, folder_path)
+        self.deletes: set = set()  # file_ids to drop (trashed, removed, moved out, now a backup file)
+        self.folders_to_crawl: Dict[str, str] = {}  # folder_id -> path (new, moved or renamed folders)
+        self.removed_folder_paths: set = set()  # trashed folders: drop everything indexed below them
+
+    def __len__(self):
+        return len(self.upserts) + len(self.deletes) + len(self.folders_to_crawl) + len(self.removed_folder_paths)
+
+    def summary(self) -> Dict[str, int]:
+        return {"upserts": len(self.upserts), "deletes": len(self.deletes),
+                "folders_to_crawl": len(self.folders_to_crawl), "removed_folders": len(self.removed_folder_paths)}
+
+
+def collect_drive_changes(service, page_token: str, root_id: str, root_path: str,
+                          page_size: int = 1000) -> Tuple[DriveChanges, str]:
+    """
+    Read the changes feed from page_token and classify every change under root_id.
+    Returns (changes, new_start_page_token). A later change to the same file wins.
+    """
+    paths = FolderPaths(service, root_id, root_path)
+    changes = DriveChanges()
+    new_token = page_token
+    for page, token in iter_changes(service, page_token, page_size):
+        for change in page:
+            file_id = change.get("fileId")
+            if not file_id:
+                continue  # shared-drive changes carry no file
+            file = change.get("file")
+            if change.get("removed") or file is None:
+                # Permanently deleted or access lost: we no longer know what it was
+                changes.upserts.pop(file_id, None)
+                changes.deletes.add(file_id)
+                continue
+
+            if file.get("mimeType") == FOLDER_MIME_TYPE:
+                paths.remember(file)
+                folder_path = paths.path_of(file_id, include_trashed=True)
+                if folder_path is None:
+                    changes.folders_to_crawl.pop(file_id, None)
+                    print(f"   ⚠️ Folder '{file.get('name')}' left the target folder; run a full crawl to drop its images")
+                elif file.get("trashed"):
+                    changes.folders_to_crawl.pop(file_id, None)
+                    changes.removed_folder_paths.add(folder_path)
+                else:
+                    changes.folders_to_crawl[file_id] = folder_path
+                continue
+
+            if not file.get("mimeType", "").startswith("image/"):
+                continue
+            parents = file.get("parents") or []
+            folder_path = paths.path_of(parents[0]) if parents and not file.get("trashed") else None
+            if folder_path is None or is_backup_file(file.get("name", "")):
+                changes.upserts.pop(file_id, None)
+                changes.deletes.add(file_id)
+            else:
+                changes.deletes.discard(file_id)
+                changes.upserts[file_id] = (file, parents[0], folder_path)
+        if token:
+            new_token = token
+
+    # Images inside a folder that will be crawled anyway need no separate upsert
+    def under(path, folder_path):
+        return path == folder_path or path.startswith(folder_path + "/")
+    crawl_paths = list(changes.folders_to_crawl.values())
+    for file_id, (_, _, folder_path) in list(changes.upserts.items()):
+        if any(under(folder_path, crawl_path) for crawl_path in crawl_paths):
+            del changes.upserts[file_id]
+    return changes, new_token
+
+
+def load_change_token(path: str, root_id: str) -> Optional[str]:
+    """Stored startPageToken for root_id, or None if there is none (full crawl needed)"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return state.get("start_page_token") if state.get("root_id") == root_id else None
+
+
+def save_change_token(path: str, root_id: str, token: str):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"root_id": root_id, "start_page_token": token, "saved_at": time.time()}, f)
+    os.replace(tmp_path, path)
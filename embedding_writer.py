@@ -0,0 +1,213 @@
+"""
+Write-behind buffer for Supabase upserts
+- `put` queues a row and returns immediately; a background thread flushes
+  batched upserts once `batch_size` rows are waiting or the oldest row is
+  `max_age` seconds old
+- Rows with the same key inside one batch are collapsed (last write wins),
+  since Postgres rejects an upsert that touches a row twice
+- Failed batches are retried with exponential backoff; a batch that still
+  fails is split in halves (one attempt each) down to the rows that fail on
+  their own, so one malformed row does not sink the rest of its batch
+- Rows that still fail are reported by key only (never the embedding payload)
+- `key_state` tells whether a key's row is still pending, failed or stored, and
+  changes before the callbacks run, so callers can pair it with them
+- `flush` waits for everything queued so far; `close` flushes and stops
+- Metrics: queue depth, rows/batches flushed, retries, failures, flush latency
+"""
+
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+class BufferedUpserter:
+    """Batch rows for `client.table(table).upsert(rows, on_conflict=...)` on a background thread"""
+
+    def __init__(self, client, table: str, key_column: str = "file_id", batch_size: int = 100,
+                 max_age: float = 2.0, max_retries: int = 4, backoff: float = 0.5, max_queue: int = 5000,
+                 on_flushed: Optional[Callable[[List[dict]], None]] = None,
+                 on_failed: Optional[Callable[[List[dict], Exception], None]] = None):
+        self.client = client
+        self.table = table
+        self.key_column = key_column
+        self.batch_size = max(1, batch_size)
+        self.max_age = max_age
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_queue = max(self.batch_size, max_queue)
+        self.on_flushed = on_flushed
+        self.on_failed = on_failed
+        self._rows: deque = deque()  # (enqueued_at, row)
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._queued_keys: Dict = {}  # key -> rows queued for it
+        self._in_flight_keys: set = set()
+        self._failed_keys: set = set()  # keys whose last write failed
+        self._flush_requested = 0
+        self._closed = False
+        self._metrics = {"queued_total": 0, "flushed_rows": 0, "flushed_batches": 0, "failed_rows": 0,
+                         "retries": 0, "split_batches": 0, "last_flush_ms": 0.0, "max_flush_ms": 0.0, "total_flush_ms": 0.0}
+        self._worker = threading.Thread(target=self._run, name=f"upsert-{table}", daemon=True)
+        self._worker.start()
+
+    def put(self, row: dict) -> None:
+        """Queue one row; only blocks if max_queue rows are already waiting"""
+        with self._cond:
+            if self._closed:
+                raise RuntimeError(f"writer for '{self.table}' is closed")
+            while len(self._rows) >= self.max_queue:
+                self._cond.wait()
+            self._rows.append((time.monotonic(), row))
+            key = row.get(self.key_column)
+            self._queued_keys[key] = self._queued_keys.get(key, 0) + 1
+            self._metrics["queued_total"] += 1
+            if len(self._rows) == 1 or len(self._rows) >= self.batch_size:
+                self._cond.notify_all()  # start the age timer / flush a full batch
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Flush everything queued so far; returns False on timeout"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            self._flush_requested += 1
+            self._cond.notify_all()
+            try:
+                while self._rows or self._in_flight:
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        return False
+                    self._cond.wait(remaining)
+                return True
+            finally:
+                self._flush_requested -= 1
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        """Flush remaining rows and stop the background thread"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._worker.join(timeout)
+
+    def key_state(self, key) -> str:
+        """
+        "pending" while a row for key is queued or being written, "failed" if its
+        last write failed, otherwise "stored" (also for keys never written).
+        """
+        with self._cond:
+            if key in self._queued_keys or key in self._in_flight_keys:
+                return "pending"
+            return "failed" if key in self._failed_keys else "stored"
+
+    def stats(self) -> dict:
+        with self._cond:
+            metrics = dict(self._metrics)
+            metrics["queue_depth"] = len(self._rows)
+            metrics["in_flight"] = self._in_flight
+        batches = metrics["flushed_batches"]
+        metrics["avg_flush_ms"] = round(metrics.pop("total_flush_ms") / batches, 1) if batches else 0.0
+        return metrics
+
+    # ---------------------------
+    # background flushing
+    # ---------------------------
+    def _due(self) -> bool:
+        if not self._rows:
+            return False
+        return (len(self._rows) >= self.batch_size or self._closed or self._flush_requested > 0
+                or time.monotonic() - self._rows[0][0] >= self.max_age)
+
+    def _take_batch(self) -> List[dict]:
+        batch: Dict = {}
+        while self._rows and len(batch) < self.batch_size:
+            _, row = self._rows.popleft()
+            key = row.get(self.key_column)
+            if self._queued_keys[key] > 1:
+                self._queued_keys[key] -= 1
+            else:
+                del self._queued_keys[key]
+            batch.pop(key, None)  # a later write of the same key replaces (and re-orders) the earlier one
+            batch[key] = row
+        self._in_flight = len(batch)
+        self._in_flight_keys = set(batch)
+        self._cond.notify_all()  # room in the queue for blocked put()s
+        return list(batch.values())
+
+    def _upsert(self, rows: List[dict], max_retries: Optional[int] = None) -> Optional[Exception]:
+        max_retries = self.max_retries if max_retries is None else max_retries
+        error = None
+        for attempt in range(max_retries + 1):
+            try:
+                self.client.table(self.table).upsert(rows, on_conflict=self.key_column).execute()
+                return None
+            except Exception as e:
+                error = e
+                if attempt < max_retries:
+                    with self._cond:
+                        self._metrics["retries"] += 1
+                    time.sleep(self.backoff * (2 ** attempt))
+        return error
+
+    def _isolate_failures(self, rows: List[dict], error: Exception) -> Tuple[List[dict], List[dict], Exception]:
+        """Bisect a batch that failed every retry: (stored rows, failing rows, last error)"""
+        if len(rows) == 1:
+            return [], rows, error
+        stored, failed = [], []
+        middle = len(rows) // 2
+        for half in (rows[:middle], rows[middle:]):
+            half_error = self._upsert(half, max_retries=0)
+            if half_error is None:
+                stored.extend(half)
+            else:
+                half_stored, half_failed, error = self._isolate_failures(half, half_error)
+                stored.extend(half_stored)
+                failed.extend(half_failed)
+        with self._cond:
+            self._metrics["split_batches"] += 1
+        return stored, failed, error
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._due():
+                    if self._closed and not self._rows:
+                        return
+                    timeout = None
+                    if self._rows:
+                        timeout = max(0.0, self.max_age - (time.monotonic() - self._rows[0][0]))
+                    self._cond.wait(timeout)
+                rows = self._take_batch()
+
+            start = time.perf_counter()
+            error = self._upsert(rows)
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            stored, failed = rows, []
+            if error is not None:
+                stored, failed, error = self._isolate_failures(rows, error)
+
+            with self._cond:
+                if error is None:
+                    self._metrics["flushed_batches"] += 1
+                    self._metrics["last_flush_ms"] = round(elapsed_ms, 1)
+                    self._metrics["max_flush_ms"] = round(max(self._metrics["max_flush_ms"], elapsed_ms), 1)
+                    self._metrics["total_flush_ms"] += elapsed_ms
+                self._metrics["flushed_rows"] += len(stored)
+                self._metrics["failed_rows"] += len(failed)
+                failed_keys = {row.get(self.key_column) for row in failed}
+                self._failed_keys.difference_update(self._in_flight_keys - failed_keys)
+                self._failed_keys.update(failed_keys)
+                self._in_flight_keys = set()
+            try:
+                if stored and self.on_flushed:
+                    self.on_flushed(stored)
+                if failed:
+                    keys = [row.get(self.key_column) for row in failed]
+                    print(f"❌ Failed to upsert {len(failed)} of {len(rows)} rows into {self.table} after "
+                          f"{self.max_retries} retries: {error} (keys: {keys[:5]}{'...' if len(keys) > 5 else ''})")
+                    if self.on_failed and error is not None:
+                        self.on_failed(failed, error)
+            except Exception as e:
+                print(f"⚠️ Upsert callback failed: {e}")
+            finally:
+                with self._cond:
+                    self._in_flight = 0
+                    self._cond.notify_all()
@@ -4,6 +4,8 @@ from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from typing import List
 import time
+import heapq
+import threading
 import asyncio
 import os
 import uuid
@@ -18,10 +20,28 @@ import torch
 import cv2
 import numpy as np
 from collections import Counter
-import pytesseract
 import ssl
 import urllib3
 from dotenv import load_dotenv
+from vector_index import ImageIndex, top_k_rows, diverse_top_k_rows
+from ann_index import ExactIndex, IVFIndex, create_ann_index, compare_with_exact
+from query_embedding_cache import QueryEmbeddingCache
+from index_snapshot import save_index_snapshot, load_index_snapshot
+from supabase_sync import iter_table_pages, iter_table_ids, parse_timestamp, rewind_timestamp, IndexedIdSet
+from embedding_writer import BufferedUpserter
+from hebrew_translator import PhraseTranslator
+from drive_crawler import (DriveCrawler, per_thread_service, get_start_page_token, collect_drive_changes,
+                           load_change_token, save_change_token)
+from clip_batch_encoder import BatchingEncoder, clip_image_batch_fn
+from indexing_pipeline import IndexingPipeline, PipelineStage
+from yolo_detector import YOLODetector, detection_labels
+from image_prep import IMAGE_MAX_SIDE, OCR_MAX_SIDE, PreparedImage, prepare_image
+from ocr_engine import OCRPool, ocr_available
+from model_worker_pool import ModelWorkerPool
+from onnx_clip_backend import load_clip_backend
+from feature_cache import FeatureCache
+from index_journal import IndexJournal, load_journal
+from indexing_jobs import JobManager, job_timer
 
 # Configure SSL context to handle Google Drive SSL issues
 ssl_context = ssl.create_default_context()
@@ -157,6 +177,17 @@ SCOPES = [
 TARGET_FOLDER_ID = '11kSHWn47cQqeRhtlVQ-4Uask7jr2fqjW'
 TARGET_FOLDER_NAME = 'Shared Locations Drive'
 
+# Drive crawl concurrency: folder listing threads / image download+index threads
+DRIVE_LIST_WORKERS = int(os.getenv("DRIVE_LIST_WORKERS", "4"))
+DRIVE_PROCESS_WORKERS = int(os.getenv("DRIVE_PROCESS_WORKERS", "16"))  # images in flight through the pipeline
+# Indexing pipeline: threads per stage and the bounded queue between stages
+INDEX_DOWNLOAD_WORKERS = int(os.getenv("INDEX_DOWNLOAD_WORKERS", "6"))
+INDEX_DECODE_WORKERS = int(os.getenv("INDEX_DECODE_WORKERS", "2"))
+INDEX_INFER_WORKERS = int(os.getenv("INDEX_INFER_WORKERS", "8"))  # also bounds how full CLIP batches get
+INDEX_PERSIST_WORKERS = int(os.getenv("INDEX_PERSIST_WORKERS", "4"))
+INDEX_QUEUE_SIZE = int(os.getenv("INDEX_QUEUE_SIZE", "8"))
+model_lock = threading.Lock()  # CLIP / YOLO are shared by all crawler threads
+
 # OpenAI API Configuration
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
 if OPENAI_API_KEY:
@@ -199,7 +230,52 @@ def clear_session(session_id: str):
         del auth_sessions[session_id]
 
 drive_service = None
-image_index = {}  # {file_id: {'name': str, 'embedding': tensor, 'objects': [], 'colors': []}}
+image_index = ImageIndex()  # {file_id: {'name': str, 'objects': [], 'colors': []}} + N x 512 embedding matrix
+# Approximate nearest-neighbour index over image_index embeddings (exact | ivf | hnsw)
+ANN_BACKEND = os.getenv("ANN_BACKEND", "ivf")
+ANN_CANDIDATES = int(os.getenv("ANN_CANDIDATES", "200"))  # neighbours re-scored per query
+ann_index = create_ann_index(image_index, ANN_BACKEND)
+# Memory-mapped on-disk copy of image_index for fast restarts ("" disables snapshots)
+INDEX_SNAPSHOT_DIR = os.getenv("INDEX_SNAPSHOT_DIR", "index_snapshot")
+# Delta syncs page by SUPABASE_SYNC_CURSOR (updated_at from supabase_image_embeddings_v3.sql; created_at
+# on a table without the migration, which only sees new rows) and re-read SUPABASE_SYNC_OVERLAP seconds
+# before the high-water mark for rows whose transaction committed late
+SUPABASE_SYNC_CURSOR = os.getenv("SUPABASE_SYNC_CURSOR", "updated_at")
+SUPABASE_SYNC_OVERLAP = float(os.getenv("SUPABASE_SYNC_OVERLAP", "120"))
+index_sync_state = {"synced_at": None, "snapshot_id": None, "cursor_column": SUPABASE_SYNC_CURSOR}  # Supabase high-water mark of image_index
+# Paged reads of image_embeddings
+SUPABASE_PAGE_SIZE = int(os.getenv("SUPABASE_PAGE_SIZE", "500"))
+EMBEDDING_COLUMNS = "file_id,file_name,embedding,objects,colors,folder,ocr_text,room_type"
+supabase_match_rpc = {"available": True}  # pgvector match_image_embeddings function installed
+indexed_file_ids = IndexedIdSet("image_embeddings")  # file_ids already stored in Supabase (preloaded per crawl)
+# Drive changes-feed position for incremental /index runs
+DRIVE_CHANGES_STATE = os.getenv("DRIVE_CHANGES_STATE", "drive_changes_token.json")
+# Background /index job; full crawls checkpoint to INDEX_JOURNAL_PATH and resume from it after a restart
+INDEX_JOURNAL_PATH = os.getenv("INDEX_JOURNAL_PATH", "index_journal.jsonl")
+INDEX_MAX_ATTEMPTS = int(os.getenv("INDEX_MAX_ATTEMPTS", "3"))  # failed tries before a resumed crawl gives up on a file
+
+def embedding_rows_stored(rows):
+    file_ids = [row["file_id"] for row in rows]
+    indexed_file_ids.update(file_ids)
+    if index_journal:
+        index_journal.rows_stored(file_ids)
+
+def embedding_rows_failed(rows, error):
+    if index_journal:
+        index_journal.rows_failed([row["file_id"] for row in rows])
+
+# Write-behind batched upserts into image_embeddings (indexing never waits on Supabase)
+embedding_writer = BufferedUpserter(
+    supabase, "image_embeddings", key_column="file_id",
+    batch_size=int(os.getenv("EMBEDDING_WRITE_BATCH", "100")),
+    max_age=float(os.getenv("EMBEDDING_WRITE_MAX_AGE", "2.0")),
+    on_flushed=embedding_rows_stored,
+    on_failed=embedding_rows_failed
+)
+
+# Files are journaled as done only once the writer reports their rows stored in Supabase
+index_journal = IndexJournal(INDEX_JOURNAL_PATH, row_state=embedding_writer.key_state) if INDEX_JOURNAL_PATH else None
+index_jobs = JobManager()  # start / pause / cancel / status of /index runs
 collected_images = {}  # Store selected images across searches
 search_feedback = {}   # Store search feedback for learning
 
@@ -523,21 +599,111 @@ HEBREW_ENGLISH_MAPPING = {
     
 }
 
+# Compiled once: single-pass longest-match translation of HEBREW_ENGLISH_MAPPING
+HEBREW_TRANSLATOR = PhraseTranslator(HEBREW_ENGLISH_MAPPING)
+
 # CLIP model via transformers
-clip_model = CLIPModel.from_pretrained("openai/clip-vit-base-patch32")
-clip_processor = CLIPProcessor.from_pretrained("openai/clip-vit-base-patch32")
+CLIP_MODEL_NAME = "openai/clip-vit-base-patch32"
+clip_model = CLIPModel.from_pretrained(CLIP_MODEL_NAME)
+clip_processor = CLIPProcessor.from_pretrained(CLIP_MODEL_NAME)
 clip_model.to(device)
 
+# CPU hosts can run both CLIP towers on ONNX Runtime: CLIP_BACKEND=onnx, or onnx-int8 for
+# int8 weights. Exported once to CLIP_ONNX_DIR; kept only if its embeddings match PyTorch's
+# within CLIP_ONNX_MIN_COSINE, otherwise CLIP stays on PyTorch.
+CLIP_BACKEND = os.getenv("CLIP_BACKEND", "torch")
+CLIP_ONNX_DIR = os.getenv("CLIP_ONNX_DIR", "clip_onnx")
+clip_onnx = load_clip_backend(
+    CLIP_BACKEND, CLIP_MODEL_NAME, clip_model, clip_processor, CLIP_ONNX_DIR,
+    min_cosine=float(os.getenv("CLIP_ONNX_MIN_COSINE", "0")) or None
+) if device == "cpu" else None
+CLIP_BACKEND_NAME = clip_onnx.name if clip_onnx is not None else "torch"  # what actually loaded
+
+# LRU of normalized text-query embeddings shared by every search path
+query_cache = QueryEmbeddingCache(
+    max_entries=int(os.getenv("QUERY_CACHE_SIZE", "2048")),
+    persist_path=os.getenv("QUERY_CACHE_PATH") or None,  # e.g. "query_cache.npz"
+    model_name=CLIP_MODEL_NAME,
+    backend=CLIP_BACKEND_NAME
+)
+
 # YOLOv8 model
 yolo_model = YOLO("yolov8n.pt")  # small model, replace with custom if needed
+yolo_detector = YOLODetector(
+    yolo_model,
+    imgsz=int(os.getenv("YOLO_IMGSZ", "640")),
+    conf=float(os.getenv("YOLO_CONF", "0.25")),
+    batch_size=int(os.getenv("YOLO_BATCH_SIZE", "8")),
+    lock=model_lock
+)
+
+# On CPU, image CLIP / YOLO run in worker processes that each load the models once
+# (MODEL_WORKERS=auto sizes the pool to the cores, 0 keeps inference in this process).
+# Keep INDEX_INFER_WORKERS >= the worker count so every worker has an image to work on.
+MODEL_WORKERS = os.getenv("MODEL_WORKERS", "auto")
+if device == "cpu" and MODEL_WORKERS != "0":
+    model_pool = ModelWorkerPool(
+        workers=None if MODEL_WORKERS == "auto" else int(MODEL_WORKERS),
+        threads_per_worker=int(os.getenv("MODEL_THREADS_PER_WORKER", "0")) or None,
+        loader_kwargs={"clip_model_name": CLIP_MODEL_NAME, "yolo_weights": "yolov8n.pt",
+                       "yolo_imgsz": yolo_detector.imgsz, "yolo_conf": yolo_detector.conf,
+                       "yolo_batch_size": yolo_detector.batch_size,
+                       "clip_backend": CLIP_BACKEND_NAME,
+                       "clip_onnx_dir": CLIP_ONNX_DIR}
+    )
+else:
+    model_pool = None
+
+if model_pool is not None:
+    # Micro-batched like the encoders below, each batch running in a worker process
+    clip_image_encoder = model_pool.encoder("clip", max_batch_size=int(os.getenv("CLIP_BATCH_SIZE", "8")),
+                                            max_wait=float(os.getenv("CLIP_BATCH_WAIT_MS", "30")) / 1000,
+                                            convert=torch.from_numpy)
+    yolo_batcher = model_pool.encoder("yolo", max_batch_size=yolo_detector.batch_size,
+                                      max_wait=float(os.getenv("YOLO_BATCH_WAIT_MS", "30")) / 1000)
+else:
+    # CLIP image embeddings: concurrent single-image callers share one forward pass per batch
+    if clip_onnx is not None:
+        onnx_backend = clip_onnx  # bound here so the batch function never sees a later reset
+        clip_batch_fn = lambda images: torch.from_numpy(onnx_backend.encode_images(images))
+    else:
+        clip_batch_fn = clip_image_batch_fn(clip_processor, clip_model, device, lock=model_lock)
+    clip_image_encoder = BatchingEncoder(
+        clip_batch_fn,
+        max_batch_size=int(os.getenv("CLIP_BATCH_SIZE", "8")),
+        max_wait=float(os.getenv("CLIP_BATCH_WAIT_MS", "30")) / 1000
+    )
+    # Single-image callers (indexing workers, storyboard) share batched predict calls
+    yolo_batcher = BatchingEncoder(yolo_detector.detect, max_batch_size=yolo_detector.batch_size,
+                                   max_wait=float(os.getenv("YOLO_BATCH_WAIT_MS", "30")) / 1000, name="yolo-batch")
+
+# OCR: persistent tesseract engines in worker processes, gated by a text-presence check
+if ocr_available():
+    ocr_pool = OCRPool(workers=int(os.getenv("OCR_WORKERS", "2")), languages=os.getenv("OCR_LANGUAGES", "eng+heb"))
+else:
+    ocr_pool = None
+    print("⚠️ Tesseract OCR not available, skipping OCR text extraction")
+
+# Features by Drive md5Checksum: copied / moved / renamed files skip download and inference.
+# The version covers every setting that changes the features, so stale entries are never reused.
+FEATURE_CACHE_PATH = os.getenv("FEATURE_CACHE_PATH", "feature_cache.sqlite")
+FEATURE_CACHE_VERSION = (f"v3|{CLIP_MODEL_NAME}@{CLIP_BACKEND_NAME}|yolov8n@{yolo_detector.imgsz}/{yolo_detector.conf}"
+                         f"|side{IMAGE_MAX_SIDE}|ocr={f'on@{OCR_MAX_SIDE}' if ocr_pool is not None else 'off'}")
+feature_cache = FeatureCache(
+    FEATURE_CACHE_PATH, version=FEATURE_CACHE_VERSION,
+    max_entries=int(os.getenv("FEATURE_CACHE_SIZE", "0")) or None
+) if FEATURE_CACHE_PATH else None
 
 # ---------------------------
 # Utilities
 # ---------------------------
+def as_prepared(image):
+    """PreparedImage for a PIL image (no-op for one that is already prepared)"""
+    return image if isinstance(image, PreparedImage) else PreparedImage(image, image.size)
+
 def extract_dominant_colors(image, num_colors=3):
     """Extract dominant colors from image using KMeans clustering"""
-    img = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
-    img = cv2.resize(img, (100, 100))  # resize for speed
+    img = as_prepared(image).small_bgr((100, 100))  # resize for speed
     img = img.reshape((-1, 3)).astype(np.float32)
     
     criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 10, 1.0)
@@ -546,15 +712,8 @@ def extract_dominant_colors(image, num_colors=3):
     return colors
 
 def detect_objects_yolo(image):
-    """Detect objects in image using YOLOv8"""
-    results = yolo_model.predict(np.array(image))
-    objs = []
-    for r in results:
-        for box in r.boxes:
-            cls = int(box.cls)
-            name = yolo_model.names[cls]
-            objs.append(name.lower())
-    return objs
+    """Detect objects in image using YOLOv8 (batched with concurrent callers)"""
+    return detection_labels(yolo_batcher.encode(image))
 
 def detect_room_type_from_objects(objects):
     """Detect room type based on detected objects"""
@@ -586,39 +745,19 @@ def detect_room_type_from_objects(objects):
     return 'unknown'
 
 def extract_text_ocr(image):
-    """Extract text from image using OCR"""
+    """Extract text from image using OCR (text-free images never reach tesseract)"""
+    if ocr_pool is None:
+        return ""
     try:
-        # Check if Tesseract is available
-        try:
-            pytesseract.get_tesseract_version()
-        except Exception:
-            print("⚠️ Tesseract OCR not available, skipping OCR text extraction")
-            return ""
-        
-        # Convert PIL image to OpenCV format
-        img_cv = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
-        
-        # Preprocess image for better OCR
-        gray = cv2.cvtColor(img_cv, cv2.COLOR_BGR2GRAY)
-        
-        # Apply threshold to get better text recognition
-        _, thresh = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-        
-        # Extract text using Tesseract
-        text = pytesseract.image_to_string(thresh, lang='eng+heb')
-        
-        # Clean up text
-        text = text.strip().replace('\n', ' ').replace('\r', ' ')
-        text = ' '.join(text.split())  # Remove extra whitespace
-        
-        return text if text else ""
+        prepared = as_prepared(image)
+        return ocr_pool.extract(prepared.gray, detail=prepared.detail_gray)
     except Exception as e:
         print(f"OCR error: {e}")
         return ""
 
 # Supabase Vector Database Functions
 def store_image_embedding(file_id: str, file_name: str, embedding: torch.Tensor, objects: list, colors: list, folder: str, ocr_text: str, room_type: str = "unknown"):
-    """Store image embedding and metadata in Supabase"""
+    """Queue image embedding and metadata for a batched upsert into Supabase"""
     try:
         # Convert tensor to list for JSON storage
         # Flatten the embedding if it has extra dimensions
@@ -639,82 +778,95 @@ def store_image_embedding(file_id: str, file_name: str, embedding: torch.Tensor,
             "room_type": room_type
         }
         
-        # Use upsert to avoid duplicates
-        result = supabase.table("image_embeddings").upsert(data, on_conflict="file_id").execute()
-        print(f"✅ Stored/Updated embedding for {file_name} in Supabase")
+        # Upserted (on file_id) in batches by the background writer
+        embedding_writer.put(data)
         return True
         
     except Exception as e:
-        print(f"❌ Failed to store embedding in Supabase: {e}")
-        print(f"   Data: {data}")
+        print(f"❌ Failed to queue embedding for {file_name} ({file_id}): {e}")
         return False
 
 def search_similar_images(query_embedding: torch.Tensor, top_k: int = 10, filters: dict | None = None):
+    """
+    Search for similar images using Supabase vector similarity.
+    Uses the pgvector match_image_embeddings RPC (only top_k rows are transferred);
+    falls back to a client-side scan if the function is not installed.
+    """
     if filters is None:
         filters = {}
-    """Search for similar images using Supabase vector similarity"""
+    query_np = query_embedding.cpu().numpy().astype(np.float32).flatten()
+    print(f"🔍 Searching Supabase with query vector shape: {len(query_np)}")
+    
+    if supabase_match_rpc["available"]:
+        try:
+            result = supabase.rpc("match_image_embeddings", {
+                "query_embedding": query_np.tolist(),
+                "match_count": top_k,
+                "required_objects": filters.get("objects") or None,
+                "folder_filter": filters.get("folder") or None
+            }).execute()
+            rows = result.data or []
+            print(f"📊 pgvector returned {len(rows)} matches")
+            for row in rows[:3]:
+                print(f"  📸 {row['file_name']} - Similarity: {row['similarity']:.4f} - Objects: {row.get('objects', [])}")
+            return [(row, float(row["similarity"])) for row in rows]
+        except Exception as e:
+            if "match_image_embeddings" in str(e) or "PGRST202" in str(e):
+                # Function missing - stop trying until restart
+                supabase_match_rpc["available"] = False
+                print("⚠️ match_image_embeddings RPC not found (apply supabase_image_embeddings_v3.sql) - using client-side scan")
+            else:
+                print(f"⚠️ pgvector search failed, using client-side scan: {e}")
+    
+    return scan_similar_images(query_np, top_k, filters)
+
+def scan_similar_images(query_np: np.ndarray, top_k: int, filters: dict):
+    """Client-side fallback: stream image_embeddings page by page and keep a running top_k"""
     try:
-        # Convert query embedding to list
-        # Flatten the embedding if it has extra dimensions
-        query_np = query_embedding.cpu().numpy()
-        if query_np.ndim > 1:
-            query_np = query_np.flatten()
-        query_vector = query_np.tolist()
-        
-        print(f"🔍 Searching Supabase with query vector shape: {len(query_vector)}")
+        # Normalize once so a page is scored with one matmul
+        query_np = query_np / max(float(np.linalg.norm(query_np)), 1e-12)
         
-        # Build the query - get ALL records first to see what we have
-        query = supabase.table("image_embeddings").select("*")
-        
-        # Add filters if provided
-        if filters:
+        def apply_filters(query):
             if filters.get("objects"):
                 query = query.contains("objects", filters["objects"])
             if filters.get("folder"):
                 query = query.eq("folder", filters["folder"])
-        
-        # Get all records
-        result = query.execute()
-        
-        print(f"📊 Found {len(result.data) if result.data else 0} total records in Supabase")
-        
-        if not result.data:
+            return query
+        
+        # Keep a running top_k instead of materializing the whole table
+        best = []  # min-heap of (similarity, seq, row)
+        scanned = 0
+        for rows in iter_table_pages(supabase, "image_embeddings", EMBEDDING_COLUMNS, cursor_column="file_id",
+                                     page_size=SUPABASE_PAGE_SIZE, filters=apply_filters):
+            page_rows, page_vectors = [], []
+            for row in rows:
+                try:
+                    page_vectors.append(image_index.embedding_row(row["embedding"]))
+                    page_rows.append(row)
+                except Exception as e:
+                    print(f"❌ Error processing row {row.get('file_id')}: {e}")
+            if not page_rows:
+                continue
+            vectors = np.stack(page_vectors)
+            similarities = (vectors @ query_np) / np.maximum(np.linalg.norm(vectors, axis=1), 1e-12)
+            for row, similarity in zip(page_rows, similarities.tolist()):
+                row.pop("embedding", None)
+                item = (similarity, scanned, row)
+                scanned += 1
+                if len(best) < top_k:
+                    heapq.heappush(best, item)
+                elif similarity > best[0][0]:
+                    heapq.heapreplace(best, item)
+        
+        print(f"📊 Scored {scanned} records from Supabase")
+        if not scanned:
             print("⚠️ No data found in Supabase database")
             return []
         
-        # Calculate similarities manually
-        similarities = []
-        for i, row in enumerate(result.data):
-            try:
-                # Handle the embedding data properly
-                stored_embedding_data = row["embedding"]
-                if isinstance(stored_embedding_data, list):
-                    stored_embedding = torch.tensor(stored_embedding_data, dtype=torch.float32)
-                else:
-                    stored_embedding = torch.tensor(stored_embedding_data, dtype=torch.float32)
-                
-                # Ensure both tensors have the same shape
-                if stored_embedding.shape != query_embedding.shape:
-                    if stored_embedding.dim() == 1 and query_embedding.dim() == 2:
-                        stored_embedding = stored_embedding.unsqueeze(0)
-                    elif stored_embedding.dim() == 2 and query_embedding.dim() == 1:
-                        query_embedding = query_embedding.unsqueeze(0)
-                
-                similarity = torch.cosine_similarity(query_embedding, stored_embedding, dim=-1).item()
-                similarities.append((row, similarity))
-                
-                if i < 3:  # Debug first few
-                    print(f"  📸 {row['file_name']} - Similarity: {similarity:.4f} - Objects: {row.get('objects', [])}")
-                    
-            except Exception as e:
-                print(f"❌ Error processing row {i}: {e}")
-                continue
-        
-        print(f"✅ Calculated similarities for {len(similarities)} images")
-        
-        # Sort by similarity and return top_k
-        similarities.sort(key=lambda x: x[1], reverse=True)
-        return similarities[:top_k]
+        best.sort(key=lambda item: (-item[0], item[1]))
+        for row, similarity in [(item[2], item[0]) for item in best[:3]]:
+            print(f"  📸 {row['file_name']} - Similarity: {similarity:.4f} - Objects: {row.get('objects', [])}")
+        return [(row, similarity) for similarity, _, row in best]
         
     except Exception as e:
         print(f"❌ Supabase search failed: {e}")
@@ -725,7 +877,9 @@ def search_similar_images(query_embedding: torch.Tensor, top_k: int = 10, filter
 def clear_supabase_embeddings():
     """Clear all embeddings from Supabase"""
     try:
+        embedding_writer.flush(timeout=30)  # queued rows would otherwise land after the delete
         result = supabase.table("image_embeddings").delete().neq("file_id", "").execute()
+        indexed_file_ids.clear()
         print(f"✅ Cleared {len(result.data)} embeddings from Supabase")
         return True
     except Exception as e:
@@ -733,41 +887,132 @@ def clear_supabase_embeddings():
         return False
 
 def is_image_indexed(file_id: str):
-    """Check if an image is already indexed in Supabase"""
+    """Check if an image is already indexed in Supabase (in memory once indexed_file_ids knows the id)"""
+    if indexed_file_ids.is_known(file_id):
+        return file_id in indexed_file_ids
     try:
         result = supabase.table("image_embeddings").select("file_id").eq("file_id", file_id).execute()
+        if result.data:
+            indexed_file_ids.add(file_id)
+        else:
+            indexed_file_ids.discard(file_id)
         return len(result.data) > 0
     except Exception as e:
         print(f"❌ Failed to check if image is indexed: {e}")
         return False
 
+def save_snapshot():
+    """Persist image_index to INDEX_SNAPSHOT_DIR so the next start skips the full Supabase load"""
+    if not INDEX_SNAPSHOT_DIR:
+        return None
+    stamp = save_index_snapshot(image_index, INDEX_SNAPSHOT_DIR, CLIP_MODEL_NAME, index_sync_state["synced_at"])
+    if stamp:
+        index_sync_state["snapshot_id"] = stamp["snapshot_id"]
+        print(f"💾 Saved index snapshot {stamp['snapshot_id']} ({stamp['count']} images)")
+    return stamp
+
+def embedding_entry(row):
+    """image_index entry for an image_embeddings row"""
+    return {
+        "name": row["file_name"],
+        "embedding": row["embedding"],
+        "objects": row["objects"],
+        "colors": row["colors"],
+        "folder": row["folder"],
+        "ocr_text": row["ocr_text"],
+        "room_type": row.get("room_type", "unknown")
+    }
+
+def iter_embedding_pages(since=None):
+    """Pages of image_embeddings rows changed after `since` (all rows when None)"""
+    cursor_column = index_sync_state["cursor_column"]
+    return iter_table_pages(supabase, "image_embeddings", f"{EMBEDDING_COLUMNS},{cursor_column}",
+                            cursor_column=cursor_column, since=since, page_size=SUPABASE_PAGE_SIZE)
+
+def rebuild_index_from_supabase():
+    """
+    Load every Supabase row into a new ImageIndex and swap it into image_index
+    (uploaded images are kept). Searches use the old index until the swap.
+    """
+    cursor_column = index_sync_state["cursor_column"]
+    staging, synced_at = ImageIndex(), None
+    try:
+        for rows in iter_embedding_pages():
+            for row in rows:
+                staging[row["file_id"]] = embedding_entry(row)
+            if rows[-1].get(cursor_column):
+                synced_at = rows[-1][cursor_column]
+            print(f"📥 Loaded {len(staging)} embeddings into the new index...")
+    except Exception as e:
+        print(f"❌ Failed to rebuild the index from Supabase, keeping the current one: {e}")
+        return None
+    file_ids, entries, matrix = staging.export()
+    del staging
+    with image_index.lock:
+        uploaded_ids, uploaded, uploaded_matrix = image_index.export(include=lambda data: data.get("is_uploaded"))
+        stored = set(file_ids)
+        keep = [i for i, file_id in enumerate(uploaded_ids) if file_id not in stored]
+        image_index.load_bulk(file_ids + [uploaded_ids[i] for i in keep], entries + [uploaded[i] for i in keep],
+                              np.concatenate([matrix, uploaded_matrix[keep]]))
+        index_sync_state["synced_at"] = synced_at
+    print(f"✅ Swapped in the rebuilt index ({len(image_index)} images)")
+    save_snapshot()
+    return len(image_index)
+
 def load_existing_embeddings():
-    """Load existing embeddings from Supabase into local index"""
+    """
+    Stream embeddings from Supabase into the local index page by page.
+    The first sync loads everything; later syncs (e.g. after a snapshot restore)
+    only fetch rows changed since the high-water mark, minus an overlap window,
+    and drop rows that no longer exist in Supabase.
+    """
+    since = index_sync_state["synced_at"] if len(image_index) else None
+    cursor_column = index_sync_state["cursor_column"]
+    mark = since_mark = parse_timestamp(since)
+    changed = set()  # file ids, so rows re-read from the overlap window are counted once
     try:
-        result = supabase.table("image_embeddings").select("*").execute()
-        if result.data:
-            print(f"📥 Loading {len(result.data)} existing embeddings from Supabase...")
-            for row in result.data:
-                file_id = row["file_id"]
-                image_index[file_id] = {
-                    "name": row["file_name"],
-                    "embedding": torch.tensor(row["embedding"]),
-                    "objects": row["objects"],
-                    "colors": row["colors"],
-                    "folder": row["folder"],
-                    "ocr_text": row["ocr_text"]
-                }
-            print(f"✅ Loaded {len(result.data)} embeddings into local index")
-            return len(result.data)
-        else:
-            print("📭 No existing embeddings found in Supabase")
-            return 0
+        for rows in iter_embedding_pages(rewind_timestamp(since, SUPABASE_SYNC_OVERLAP)):
+            for row in rows:
+                stamp = parse_timestamp(row.get(cursor_column))
+                # Re-writing an overlap row is idempotent; it counts as a change only if it is new to the index
+                if since_mark is None or stamp is None or stamp > since_mark or row["file_id"] not in image_index:
+                    changed.add(row["file_id"])
+                image_index[row["file_id"]] = embedding_entry(row)
+            # Pages are ordered by the cursor column, so the last row is the new high-water mark
+            last = parse_timestamp(rows[-1].get(cursor_column))
+            if last and (mark is None or last > mark):
+                mark = last
+                index_sync_state["synced_at"] = rows[-1][cursor_column]
+            print(f"📥 Synced {len(changed)} {'changed' if since else 'existing'} embeddings from Supabase...")
     except Exception as e:
         print(f"❌ Failed to load existing embeddings: {e}")
-        return 0
+        if cursor_column == "updated_at" and not changed:
+            print("ℹ️ If image_embeddings has no updated_at column, apply supabase_image_embeddings_v3.sql"
+                  " or set SUPABASE_SYNC_CURSOR=created_at")
+    loaded = len(changed)
+    
+    removed = 0
+    if since:
+        try:
+            remote_ids = set(iter_table_ids(supabase, "image_embeddings"))
+            for file_id in [fid for fid in image_index.ids if fid not in remote_ids and not image_index[fid].get("is_uploaded")]:
+                del image_index[file_id]
+                removed += 1
+        except Exception as e:
+            print(f"⚠️ Could not check for deleted embeddings: {e}")
+    
+    if loaded:
+        print(f"✅ Loaded {loaded} embeddings into local index")
+    elif not since:
+        print("📭 No existing embeddings found in Supabase")
+    if removed:
+        print(f"🗑️ Removed {removed} embeddings deleted from Supabase")
+    if loaded or removed:
+        save_snapshot()
+    return loaded
 
 def color_match_score(dominant_colors, target_colors_rgb):
-    """Compute color match score between dominant colors and target colors"""
+    """Compute color match score between dominant colors and target colors (single image; searches use ImageIndex.color_scores)"""
     if not target_colors_rgb or not dominant_colors:
         return 1.0
     
@@ -864,40 +1109,31 @@ def detect_room_types(objects):
     return detected_rooms
 
 def analyze_storyboard_image(img):
-    """Analyze a storyboard image and extract features"""
-    # CLIP embedding
-    inputs = clip_processor(images=img, return_tensors="pt")
-    inputs = {k: v.to(device) for k, v in inputs.items()}
-    with torch.no_grad():
-        image_features = clip_model.get_image_features(**inputs)
-        embedding = image_features / image_features.norm(dim=-1, keepdim=True)
+    """Analyze a storyboard image (PIL or PreparedImage) and extract features"""
+    prepared = as_prepared(img)
+    
+    # CLIP embedding (batched with any concurrent indexing work)
+    embedding = clip_image_encoder.encode(prepared.image).unsqueeze(0)
     
     # Extract dominant colors
-    colors = extract_dominant_colors(img)
+    colors = extract_dominant_colors(prepared)
     
     # YOLO object detection
-    objects = detect_objects_yolo(img)
+    objects = detect_objects_yolo(prepared.image)
     
     # Detect room types
     suggested_rooms = detect_room_types(objects)
     
     return {
-        'embedding': embedding.cpu(),
+        'embedding': embedding,
         'objects': objects,
         'colors': colors,
         'suggested_rooms': suggested_rooms
     }
 
 def translate_hebrew_query(query):
-    """Translate Hebrew terms to English for better CLIP understanding"""
-    translated_query = query
-    
-    # Check for Hebrew terms and translate them
-    for hebrew_term, english_term in HEBREW_ENGLISH_MAPPING.items():
-        if hebrew_term in query:
-            translated_query = translated_query.replace(hebrew_term, english_term)
-    
-    return translated_query
+    """Translate Hebrew terms to English for better CLIP understanding (longest phrase wins)"""
+    return HEBREW_TRANSLATOR.translate(query)
 
 def calculate_combined_score(semantic_score, object_score, color_score, weights=None):
     """Calculate combined score with configurable weights"""
@@ -917,9 +1153,111 @@ def calculate_combined_score(semantic_score, object_score, color_score, weights=
     
     return combined
 
+def calculate_combined_scores(semantic_scores, object_scores, color_scores, weights=None):
+    """Vectorized calculate_combined_score over numpy arrays of per-image scores"""
+    if weights is None:
+        weights = {"semantic": 0.6, "object": 0.2, "color": 0.2}
+
+    return (
+        np.clip(semantic_scores, 0, 1) * weights["semantic"] +
+        np.clip(object_scores, 0, 1) * weights["object"] +
+        np.clip(color_scores, 0, 1) * weights["color"]
+    )
+
+def encode_text_queries(translated_queries, guidelines=None):
+    """
+    Return a Q x 512 float32 matrix of normalized CLIP embeddings, one row per
+    translated query (plus its optional guidelines). Cached queries are reused;
+    all misses are tokenized together and encoded in one forward pass.
+    """
+    guidelines = guidelines or [""] * len(translated_queries)
+    keys = [query_cache.make_key(q, g) for q, g in zip(translated_queries, guidelines)]
+    embeddings = [query_cache.get(key) for key in keys]
+    
+    # Group misses by key so repeated queries in one batch are encoded once
+    missing = {}
+    for i, embedding in enumerate(embeddings):
+        if embedding is None:
+            missing.setdefault(keys[i], []).append(i)
+    
+    if missing:
+        texts = []
+        for positions in missing.values():
+            query, guideline = translated_queries[positions[0]], guidelines[positions[0]]
+            texts.append(f"{query} {guideline}" if guideline else query)
+        if clip_onnx is not None:
+            text_features = clip_onnx.encode_texts(texts)
+        else:
+            text_inputs = clip_processor(text=texts, return_tensors="pt", padding=True)
+            text_inputs = {k: v.to(device) for k, v in text_inputs.items()}
+            with torch.no_grad():
+                text_features = clip_model.get_text_features(**text_inputs)
+                text_features = (text_features / text_features.norm(dim=-1, keepdim=True)).cpu().numpy()
+        for (key, positions), vector in zip(missing.items(), text_features):
+            query_cache.put(key, vector)
+            for i in positions:
+                embeddings[i] = vector
+    
+    if not embeddings:
+        return np.zeros((0, image_index.dim), dtype=np.float32)
+    return np.stack(embeddings).astype(np.float32, copy=False)
+
+def encode_text_query(translated_query, guidelines=""):
+    """
+    Return the normalized CLIP embedding (float32 row) of a translated query plus
+    optional guidelines, running the text tower only on a query_cache miss.
+    """
+    return encode_text_queries([translated_query], [guidelines])[0]
+
+def format_search_results(rows, final_scores, semantic_scores, object_scores, color_scores):
+    """Build the JSON result list for ranked index rows (score arrays are aligned with rows)"""
+    results = []
+    for i, row in enumerate(rows):
+        fid = image_index.ids[row]
+        data = image_index[fid]
+        results.append({
+            "file_id": fid,
+            "name": data['name'],
+            "score": round(float(final_scores[i]), 4),
+            "objects": data['objects'],
+            "colors": data['colors'],
+            "semantic_score": round(float(semantic_scores[i]), 4),
+            "object_score": round(float(object_scores[i]), 4),
+            "color_score": round(float(color_scores[i]), 4),
+            "folder": data.get('folder', 'Root')
+        })
+    return results
+
+def select_candidate_rows(query_embeddings, top_k, ef=None, nprobe=None, exact=False):
+    """
+    Rows of image_index worth fully scoring for a query.
+
+    Returns None (score every row) on the exact path, otherwise the union of the
+    ANN neighbours of each query embedding (text query, feedback average, ...).
+    """
+    if exact or isinstance(ann_index, ExactIndex):
+        return None
+    k = max(ANN_CANDIDATES, top_k * 10)
+    if k >= len(image_index):
+        return None
+    neighbours = [ann_index.search(q, k, ef=ef or None, nprobe=nprobe or None) for q in query_embeddings]
+    return np.unique(np.concatenate(neighbours)) if neighbours else None
+
 # ---------------------------
 # 1️⃣ Authenticate with Google Drive
 # ---------------------------
+SERVICE_ACCOUNT_FILE = "secret-spark-432817-r3-e78bdaac1d51.json"
+
+def service_account_credentials():
+    """Read-only Drive credentials from the service account key file, or None if there is none"""
+    if not os.path.exists(SERVICE_ACCOUNT_FILE):
+        return None
+    from google.oauth2 import service_account
+    return service_account.Credentials.from_service_account_file(
+        SERVICE_ACCOUNT_FILE,
+        scopes=['https://www.googleapis.com/auth/drive.readonly']
+    )
+
 @app.get("/auth")
 def auth_drive():
     """Authenticate with Google Drive using Service Account or OAuth2"""
@@ -942,14 +1280,9 @@ def auth_drive():
 
     try:
         # Try service account first (more reliable for server applications)
-        service_account_file = "secret-spark-432817-r3-e78bdaac1d51.json"
-        if os.path.exists(service_account_file):
+        if os.path.exists(SERVICE_ACCOUNT_FILE):
             print("🔐 Using service account authentication...")
-            from google.oauth2 import service_account
-            creds = service_account.Credentials.from_service_account_file(
-                service_account_file,
-                scopes=['https://www.googleapis.com/auth/drive.readonly']
-            )
+            creds = service_account_credentials()
             drive_service = build('drive', 'v3', credentials=creds, cache_discovery=False)
             
             # Auto-load existing embeddings from Supabase
@@ -1328,188 +1661,383 @@ def disconnect(session_id: str | None = None):
 # ---------------------------
 # 2️⃣ Index Drive Images
 # ---------------------------
-def crawl_drive_images(service, folder_id=None, folder_path=None, max_images=999999):
-    """Recursively crawl Google Drive and index images - ONLY from the correct shared drive"""
-    global image_index
+def download_drive_file(service, record):
+    """Pipeline stage: resolve the folder path and download the image bytes (None = skip)"""
+    file = record["file"]
+    file_id = file['id']
+    file_name = file['name']
+    
+    # Determine folder path for this image
+    if record["folder_id"] == 'root':
+        # For root query, try to get the actual folder path
+        parents = file.get('parents', [])
+        if parents:
+            # Get the parent folder name
+            try:
+                parent_folder = service.files().get(fileId=parents[0], fields="name").execute()
+                record["folder_path"] = parent_folder.get('name', 'Unknown Folder')
+            except:
+                record["folder_path"] = 'Root'
+        else:
+            record["folder_path"] = 'Root'
+    
+    # Same bytes seen before (copy, move, rename): reuse the features, skip the download
+    cached = feature_cache.get(file.get('md5Checksum')) if feature_cache is not None else None
+    if cached is not None:
+        record.update(cached, embedding=torch.from_numpy(cached["embedding"]), cached=True)
+        return record
+    
+    try:
+        # Download image with SSL error handling
+        request = service.files().get_media(fileId=file_id)
+        record["content"] = request.execute()
+        return record
+    except Exception as e:
+        error_msg = str(e)
+        if "SSL" in error_msg or "wrong version number" in error_msg:
+            print(f"   ⚠️ SSL error downloading {file_name}, skipping...")
+        elif "timeout" in error_msg.lower():
+            print(f"   ⏰ Timeout downloading {file_name}, skipping...")
+        else:
+            print(f"   ❌ Failed to download {file_name}: {e}")
+        if record.get("job") is not None:
+            record["job"].record_error("download", e)
+        return None
+
+def decode_drive_image(record):
+    """Pipeline stage: decode the downloaded bytes once, downscaled to the working size"""
+    if record.get("cached"):
+        return record
+    record["image"] = prepare_image(record.pop("content"), keep_source=ocr_pool is not None)
+    return record
+
+def analyze_drive_image(record):
+    """Pipeline stage: CLIP embedding, YOLO objects, colors, room type and OCR"""
+    if record.get("cached"):
+        return record
+    prepared = record["image"]
+    job = record.get("job")
+    
+    # CLIP embedding - inference workers submitting together share one forward pass
+    with job_timer(job, "clip"):
+        record["embedding"] = clip_image_encoder.encode(prepared.image).unsqueeze(0)
+    
+    # YOLO object detection, batched across inference workers
+    with job_timer(job, "yolo"):
+        record["objects"] = detect_objects_yolo(prepared.image)
     
+    # Extract dominant colors
+    with job_timer(job, "colour"):
+        record["colors"] = extract_dominant_colors(prepared)
+    
+    # Detect room type from objects
+    record["room_type"] = detect_room_type_from_objects(record["objects"])
+    
+    # OCR text extraction
+    with job_timer(job, "ocr"):
+        record["ocr_text"] = extract_text_ocr(prepared)
+    
+    del record["image"]  # only the features travel on to persistence
+    if feature_cache is not None:
+        feature_cache.put(record["file"].get('md5Checksum'), {
+            "embedding": record["embedding"].cpu().numpy().astype(np.float32),
+            "objects": record["objects"],
+            "colors": [list(color) for color in record["colors"]],
+            "room_type": record["room_type"],
+            "ocr_text": record["ocr_text"]
+        })
+    return record
+
+def persist_drive_image(record):
+    """Pipeline stage: store the analyzed image locally and in Supabase. Returns True."""
+    file_id = record["file"]["id"]
+    file_name = record["file"]["name"]
+    
+    # Store in local index
+    image_index[file_id] = {
+        "name": file_name,
+        "embedding": record["embedding"],
+        "objects": record["objects"],
+        "colors": record["colors"],
+        "folder": record["folder_path"],
+        "ocr_text": record["ocr_text"],
+        "room_type": record["room_type"]
+    }
+    
+    # Store in Supabase vector database
+    store_image_embedding(file_id, file_name, record["embedding"], record["objects"], record["colors"],
+                          record["folder_path"], record["ocr_text"], record["room_type"])
+    
+    print(f"Indexed{' (cached features)' if record.get('cached') else ''}: {file_name} - Objects: {record['objects']} - Colors: {record['colors']}")
+    return True
+
+def index_drive_file(service, file, folder_id, folder_path):
+    """Download and analyze one Drive image, then store it locally and in Supabase. Returns True if indexed."""
+    record = {"file": file, "folder_id": folder_id, "folder_path": folder_path}
+    try:
+        record = download_drive_file(service, record)
+        if record is None:
+            return False
+        return persist_drive_image(analyze_drive_image(decode_drive_image(record)))
+    except Exception as e:
+        print(f"   ❌ Failed to process {file['name']}: {e}")
+        return False
+
+def create_indexing_pipeline(service, job=None):
+    """
+    download -> decode -> infer -> persist, each stage on its own bounded worker pool.
+    With a job, stages hold while it is paused, drop records once it is cancelled
+    and report latency (infer per model: clip / yolo / colour / ocr) and errors.
+    """
+    drive_for_thread = per_thread_service(service)
+    stages = [
+        ("download", lambda record: download_drive_file(drive_for_thread(), record), INDEX_DOWNLOAD_WORKERS, True),
+        ("decode", decode_drive_image, INDEX_DECODE_WORKERS, True),
+        ("infer", analyze_drive_image, INDEX_INFER_WORKERS, False),
+        ("persist", persist_drive_image, INDEX_PERSIST_WORKERS, True),
+    ]
+    return IndexingPipeline([
+        PipelineStage(name, job.stage(name, fn, timed=timed) if job is not None else fn, workers)
+        for name, fn, workers, timed in stages
+    ], queue_size=INDEX_QUEUE_SIZE)
+
+def crawl_drive_images(service, folder_id=None, folder_path=None, max_images=999999, skip_indexed=True,
+                       journal=None, resume=None, job=None):
+    """
+    Crawl Google Drive breadth-first and index images - ONLY from the correct shared drive.
+    Folders are listed concurrently (DRIVE_LIST_WORKERS) while up to DRIVE_PROCESS_WORKERS
+    images at a time go through the staged indexing pipeline.
+    skip_indexed=False re-indexes images already in Supabase (e.g. after a folder move).
+    journal/resume checkpoint the crawl and continue an interrupted one (see index_journal);
+    job (indexing_jobs.IndexingJob) collects progress and can pause or cancel the crawl.
+    """
     # Use default target folder if not specified
     if folder_id is None:
         folder_id = TARGET_FOLDER_ID
     if folder_path is None:
         folder_path = TARGET_FOLDER_NAME
     
-    # Stop if we've already indexed enough images
-    if len(image_index) >= max_images:
-        print(f"🛑 Reached limit of {max_images} images, stopping crawl")
-        return
-    
-    print(f"🔍 Crawling folder: {folder_path} (ID: {folder_id})")
+    # One paged id sweep instead of a Supabase query per file
+    if skip_indexed:
+        try:
+            print(f"📋 Preloaded {indexed_file_ids.preload(supabase)} indexed file ids")
+        except Exception as e:
+            print(f"⚠️ Could not preload indexed file ids, checking in batches: {e}")
     
-    # Get images in current folder
-    query = f"'{folder_id}' in parents and mimeType contains 'image/' and trashed=false"
-    print(f"   🔍 Searching for images in: {folder_path}")
+    def process_image(_service, file, image_folder_id, image_folder_path):
+        record = {"file": file, "folder_id": image_folder_id, "folder_path": image_folder_path, "job": job}
+        try:
+            return bool(pipeline.submit(record).result())
+        except Exception as e:
+            print(f"   ❌ Failed to process {file['name']}: {e}")
+            return False
+    
+    with create_indexing_pipeline(service, job) as pipeline:
+        if job is not None:
+            job.attach_pipeline(pipeline)
+        crawler = DriveCrawler(
+            service,
+            process_image=process_image,
+            is_indexed=is_image_indexed if skip_indexed else None,
+            prefetch_indexed=(lambda file_ids: indexed_file_ids.prefetch(supabase, file_ids)) if skip_indexed else None,
+            current_count=lambda: len(image_index),
+            max_images=max_images,
+            list_workers=DRIVE_LIST_WORKERS,
+            process_workers=DRIVE_PROCESS_WORKERS,
+            service_factory=per_thread_service(service),
+            journal=journal,
+            job=job
+        )
+        stats = crawler.crawl(folder_id, folder_path, resume=resume)
+    if job is not None:
+        job.detach_pipeline(pipeline)
+    print(f"📊 Pipeline stages: {pipeline.stats()['stages']}")
+    if not embedding_writer.flush(timeout=120):
+        print(f"⚠️ Supabase writes still pending: {embedding_writer.stats()}")
+    return stats
+
+def delete_indexed_images(file_ids):
+    """Drop images from the local index and from Supabase image_embeddings"""
+    file_ids = list(file_ids)
+    for file_id in file_ids:
+        image_index.pop(file_id, None)
+        indexed_file_ids.discard(file_id)
+    embedding_writer.flush(timeout=30)  # a queued upsert must not resurrect a deleted row
+    for start in range(0, len(file_ids), 300):
+        supabase.table("image_embeddings").delete().in_("file_id", file_ids[start:start + 300]).execute()
+
+def sync_drive_changes(service, job=None):
+    """
+    Apply the Drive changes feed since the stored startPageToken: new/modified images
+    are (re)indexed, trashed/removed/moved-out ones deleted, and new or moved folders crawled.
+    Returns a summary, or None when no token is stored yet (a full crawl is needed).
+    """
+    token = load_change_token(DRIVE_CHANGES_STATE, TARGET_FOLDER_ID)
+    if token is None:
+        return None
     
-    print(f"   🔍 Executing query: {query}")
-    try:
-        results = service.files().list(q=query, fields="files(id,name,parents)", pageSize=1000).execute()
-        files = results.get('files', [])
-        print(f"   📸 Found {len(files)} images in {folder_path}")
-        
-        # Debug: Show first few file names if any found
-        if files:
-            print(f"   📋 Sample files: {[f['name'] for f in files[:3]]}")
-        else:
-            print(f"   ⚠️ No files found with query: {query}")
-            
-    except Exception as e:
-        print(f"   ❌ Error executing query: {e}")
-        files = []
-
-    for file in files:
-        # Stop if we've reached the limit
-        if len(image_index) >= max_images:
-            print(f"🛑 Reached limit of {max_images} images, stopping processing")
+    changes, new_token = collect_drive_changes(service, token, TARGET_FOLDER_ID, TARGET_FOLDER_NAME)
+    print(f"🔄 Drive changes since last sync: {changes.summary()}")
+    
+    # Deletes: single files plus everything below trashed folders
+    doomed = set(changes.deletes)
+    for removed_path in changes.removed_folder_paths:
+        doomed.update(file_id for file_id, entry in image_index.items()
+                      if entry.get("folder") == removed_path or entry.get("folder", "").startswith(removed_path + "/"))
+    delete_indexed_images(doomed)
+    
+    # New and modified images go straight into the pipeline
+    with create_indexing_pipeline(service, job) as pipeline:
+        if job is not None:
+            job.attach_pipeline(pipeline)
+            job.images_listed(len(changes.upserts))
+        futures = []
+        for file, folder_id, folder_path in changes.upserts.values():
+            future = pipeline.submit({"file": file, "folder_id": folder_id, "folder_path": folder_path, "job": job})
+            if job is not None:
+                future.add_done_callback(
+                    lambda f: job.image_done("indexed" if f.exception() is None and f.result() else "failed"))
+            futures.append(future)
+    if job is not None:
+        job.detach_pipeline(pipeline)
+    updated = sum(1 for future in futures if future.exception() is None and future.result())
+    
+    # New, moved or renamed folders: images under a path we have never seen need their paths rewritten
+    known_folders = {entry.get("folder") for entry in image_index.values()}
+    for folder_id, folder_path in changes.folders_to_crawl.items():
+        if job is not None and job.cancelled:
             break
-            
-        file_id = file['id']
-        file_name = file['name']
-        
-        # Skip Samsung backup files (wrong drive) - be very strict
-        if any(keyword in file_name for keyword in ["סמסונג", "Samsung", "גיבוי", "backup", "מדיסק", "חיצוני"]):
-            print(f"   ⏭️ Skipping Samsung backup file: {file_name}")
-            continue
-        
-        # Check if image is already indexed
-        if is_image_indexed(file_id):
-            print(f"   ⏭️ Skipping {file_name} - already indexed")
-            continue
-        
-        # Determine folder path for this image
-        if folder_id == 'root':
-            # For root query, try to get the actual folder path
-            parents = file.get('parents', [])
-            if parents:
-                # Get the parent folder name
-                try:
-                    parent_folder = service.files().get(fileId=parents[0], fields="name").execute()
-                    folder_path = parent_folder.get('name', 'Unknown Folder')
-                except:
-                    folder_path = 'Root'
-            else:
-                folder_path = 'Root'
-        else:
-            folder_path = folder_path
-        
+        crawl_drive_images(service, folder_id, folder_path, skip_indexed=folder_path in known_folders, job=job)
+    
+    embedding_writer.flush(timeout=120)
+    if job is not None and job.cancelled:
+        save_snapshot()  # the token stays put, so the next sync replays these changes
+        return dict(changes.summary(), indexed=updated, deleted=len(doomed), cancelled=True)
+    save_change_token(DRIVE_CHANGES_STATE, TARGET_FOLDER_ID, new_token)
+    save_snapshot()
+    return dict(changes.summary(), indexed=updated, deleted=len(doomed))
+
+def run_full_crawl(job, service, resume=None):
+    """Full crawl of the target folder, checkpointed to the index journal (resume continues one)"""
+    if resume is not None:
+        start_token = resume.change_token
+        if index_journal:
+            index_journal.resume()
+    else:
+        # The live index keeps serving searches; it is rebuilt from Supabase once the crawl completes
+        # Taken before crawling so changes made during the crawl are picked up by the next incremental run
         try:
-            # Download image with SSL error handling
-            request = service.files().get_media(fileId=file_id)
-            try:
-                file_content = request.execute()
-                file_bytes = io.BytesIO(file_content)
-            except Exception as ssl_error:
-                if "SSL" in str(ssl_error) or "wrong version number" in str(ssl_error):
-                    print(f"   ⚠️ SSL error downloading {file_name}, skipping...")
-                    continue
-                else:
-                    raise ssl_error
-            
-            try:
-                img = Image.open(file_bytes).convert("RGB")
-            finally:
-                # Ensure the BytesIO object is properly handled
-                if hasattr(file_bytes, 'close'):
-                    file_bytes.close()
-            
-            # CLIP embedding
-            inputs = clip_processor(images=img, return_tensors="pt")
-            inputs = {k: v.to(device) for k, v in inputs.items()}
-            with torch.no_grad():
-                image_features = clip_model.get_image_features(**inputs)
-                embedding = image_features / image_features.norm(dim=-1, keepdim=True)
-            
-            # Extract dominant colors
-            colors = extract_dominant_colors(img)
-            
-            # YOLO object detection
-            objects = detect_objects_yolo(img)
-            
-            # Detect room type from objects
-            room_type = detect_room_type_from_objects(objects)
-            
-            # OCR text extraction
-            ocr_text = extract_text_ocr(img)
-            
-            # Store in local index
-            image_index[file_id] = {
-                "name": file_name,
-                "embedding": embedding.cpu(),
-                "objects": objects,
-                "colors": colors,
-                "folder": folder_path,
-                "ocr_text": ocr_text,
-                "room_type": room_type
-            }
-            
-            # Store in Supabase vector database
-            store_image_embedding(file_id, file_name, embedding, objects, colors, folder_path, ocr_text, room_type)
-            
-            print(f"Indexed: {file_name} - Objects: {objects} - Colors: {colors}")
-            
+            start_token = get_start_page_token(service)
         except Exception as e:
-            error_msg = str(e)
-            if "SSL" in error_msg or "wrong version number" in error_msg:
-                print(f"   ⚠️ SSL error with {file_name}, skipping...")
-            elif "timeout" in error_msg.lower():
-                print(f"   ⏰ Timeout downloading {file_name}, skipping...")
-            else:
-                print(f"   ❌ Failed to process {file_name}: {e}")
-
-    # Crawl subfolders recursively
-    query_folders = f"'{folder_id}' in parents and mimeType='application/vnd.google-apps.folder' and trashed=false"
+            print(f"⚠️ Could not get a Drive changes token, incremental sync unavailable: {e}")
+            start_token = None
+        if index_journal:
+            index_journal.start(job.job_id, TARGET_FOLDER_ID, TARGET_FOLDER_NAME, start_token)
+    
+    print(f"📊 Indexing ALL images from target folder: {TARGET_FOLDER_ID}")
     try:
-        folder_results = service.files().list(q=query_folders, fields="files(id,name)").execute()
-        subfolders = folder_results.get('files', [])
-        
-        print(f"   📁 Found {len(subfolders)} subfolders in {folder_path}")
-        
-        for folder in subfolders:
-            print(f"   📂 Subfolder: {folder['name']} (ID: {folder['id']})")
-        
-        for folder in subfolders:
-            new_folder_path = f"{folder_path}/{folder['name']}" if folder_path != 'Root' else folder['name']
-            print(f"   🔄 Recursively crawling: {folder['name']}")
-            try:
-                crawl_drive_images(service, folder_id=folder['id'], folder_path=new_folder_path, max_images=max_images)
-            except Exception as e:
-                print(f"   ❌ Error crawling folder {folder['name']}: {e}")
-                print(f"   ⏭️ Continuing with next folder...")
-                continue  # Continue with next folder instead of stopping
-    except Exception as e:
-        print(f"   ❌ Error getting subfolders: {e}")
+        stats = crawl_drive_images(service, max_images=999999, journal=index_journal, resume=resume, job=job)
+    except BaseException:
+        if index_journal:
+            embedding_writer.flush(timeout=120)  # journal whatever rows can still be stored
+            index_journal.close()  # keep the journal resumable
+        raise
+    if index_journal:
+        embedding_writer.flush(timeout=120)  # the last rows report back to the journal before it finishes
+        index_journal.finish("cancelled" if job.cancelled else "completed")
+    if job.cancelled:
+        return stats  # no snapshot for a partial crawl; the live index still holds everything it had
+    if start_token:
+        save_change_token(DRIVE_CHANGES_STATE, TARGET_FOLDER_ID, start_token)
+    # Fresh index of everything in Supabase (crawled now or skipped as already indexed); saves the snapshot
+    rebuild_index_from_supabase()
+    return stats
+
+def run_index_job(job, service, incremental=False, resume=None):
+    """Background body of an /index job (run by index_jobs); the return value becomes the job result"""
+    if incremental:
+        changes = sync_drive_changes(service, job)
+        if changes is not None:
+            return {"changes": changes, "total_images": len(image_index)}
+        print("ℹ️ No stored Drive change token yet - running a full crawl")
+        job.kind = "full"
+    return {"crawl": run_full_crawl(job, service, resume), "total_images": len(image_index)}
+
+def start_index_job(service, incremental=False, resume=None):
+    """Start an /index job in the background unless one is active; returns (job, started)"""
+    return index_jobs.start(run_index_job, service, incremental, resume,
+                            kind="incremental" if incremental else "full",
+                            job_id=resume.job_id if resume is not None else None)
+
+def interrupted_index_job():
+    """Journal of a full crawl that never finished (for the current target folder), or None"""
+    state = load_journal(INDEX_JOURNAL_PATH, max_attempts=INDEX_MAX_ATTEMPTS) if INDEX_JOURNAL_PATH else None
+    if state is None or state.finished or state.root_id != TARGET_FOLDER_ID:
+        return None
+    return state
 
 @app.post("/index")
-def index_drive():
-    """Index all images in Google Drive"""
+def index_drive(incremental: bool = False, restart: bool = False):
+    """
+    Start indexing in the background and return its job id right away (progress: GET /index/status).
+    An interrupted full crawl is resumed from its journal unless restart=true;
+    incremental=true only applies Drive changes since the last run.
+    """
     if not drive_service:
         return {"error": "Not authenticated. Call /auth first."}
     
-    global image_index
-    image_index = {}  # Reset index
-    
-    try:
-        # Start from root to crawl ALL folders and subfolders
-        print(f"🎯 Starting indexing from root folder to crawl ALL folders")
-        print(f"🔗 This will index images from all accessible folders in your Google Drive")
-        print(f"📊 Indexing ALL images from target folder: {TARGET_FOLDER_ID}")
-        print(f"🔍 This is MANUAL indexing - not automatic on connection")
-        crawl_drive_images(drive_service, max_images=999999)
-        return {
-            "status": "Drive indexed successfully", 
-            "total_images": len(image_index),
-            "message": f"Indexed {len(image_index)} images with CLIP embeddings, YOLO objects, and color data"
-        }
-    except Exception as e:
-        return {"error": f"Indexing failed: {str(e)}"}
+    resume = None if incremental or restart or index_jobs.active() else interrupted_index_job()
+    job, started = start_index_job(drive_service, incremental, resume)
+    if not started:
+        return {"status": "Indexing already running", "job_id": job.job_id, "total_images": len(image_index)}
+    return {
+        "status": "Indexing resumed" if resume is not None else "Indexing started",
+        "job_id": job.job_id,
+        "total_images": len(image_index),
+        "progress": resume.summary() if resume is not None else None,
+        "message": "Poll /index/status for progress"
+    }
+
+@app.get("/index/status")
+def index_status(job_id: str | None = None):
+    """Progress, throughput, queue depths, per-stage latency, errors and ETA of the current (or given) job"""
+    job = index_jobs.get(job_id) if job_id else index_jobs.current
+    if job is None:
+        if job_id:
+            raise HTTPException(status_code=404, detail=f"Unknown job {job_id}")
+        interrupted = interrupted_index_job()
+        if interrupted is not None:
+            return {"job_id": interrupted.job_id, "status": "interrupted", "total_images": len(image_index),
+                    "progress": interrupted.summary(), "message": "POST /index to resume it"}
+        return {"status": "idle", "total_images": len(image_index)}
+    return dict(job.status_dict(), total_images=len(image_index))
+
+def control_index_job(action):
+    """Apply pause / resume / cancel to the active job"""
+    job = index_jobs.active()
+    if job is None:
+        return {"status": "idle", "message": "No indexing job is running"}
+    changed = getattr(job, action)()
+    return {"job_id": job.job_id, "status": job.status, "changed": changed}
+
+@app.post("/index/pause")
+def pause_index_job():
+    """Hold the running job: in-flight images finish their current stage, nothing new starts"""
+    return control_index_job("pause")
+
+@app.post("/index/resume")
+def resume_paused_index_job():
+    return control_index_job("resume")
+
+@app.post("/index/cancel")
+def cancel_index_job():
+    """Stop the running job; a cancelled full crawl starts over on the next /index"""
+    return control_index_job("cancel")
+
+@app.get("/index/jobs")
+def list_index_jobs():
+    """Recent indexing jobs, newest first"""
+    return {"jobs": index_jobs.list()}
 
 # ---------------------------
 # 3️⃣ Search Endpoint
@@ -1523,6 +2051,9 @@ class SearchRequest(BaseModel):
     feedback_images: list = []        # Images to use as positive feedback
     negative_feedback: list = []      # Images to avoid
     search_session_id: str = ""       # To track search sessions
+    ef: int = 0                       # HNSW search breadth (0 = backend default)
+    nprobe: int = 0                   # IVF lists to probe (0 = backend default)
+    exact_search: bool = False        # Bypass the ANN index and scan every embedding
 
 def search_images_internal(search_request):
     """Internal search function that returns results as list (not JSONResponse)"""
@@ -1533,95 +2064,68 @@ def search_images_internal(search_request):
     translated_query = translate_hebrew_query(search_request["query"])
     
     # Encode text query with CLIP
-    text_inputs = clip_processor(text=[translated_query], return_tensors="pt", padding=True)
-    text_inputs = {k: v.to(device) for k, v in text_inputs.items()}
-    with torch.no_grad():
-        text_features = clip_model.get_text_features(**text_inputs)
-        text_emb = text_features / text_features.norm(dim=-1, keepdim=True)
-
-    results = []
-    for fid, data in image_index.items():
-        # Semantic similarity score
-        sim = (text_emb.cpu() @ data['embedding'].T).item()
+    text_emb = encode_text_query(translated_query)
+    top_k = search_request.get("top_k", 6)
+
+    # Rows stay put while scoring and formatting (indexing jobs add and move rows concurrently)
+    with image_index.lock:
+        # Semantic similarity: one matmul over all rows, or over the ANN candidates
+        rows = select_candidate_rows([text_emb], top_k)
+        if rows is None:
+            sims = image_index.similarities(text_emb)
+            rows = np.arange(sims.shape[0])
+        else:
+            sims = image_index.matrix[rows] @ image_index.embedding_row(text_emb)
+        ones = np.ones_like(sims)
         
         # Object filter score
         if search_request.get("required_objects"):
-            obj_score = len(set(data['objects']) & set(search_request["required_objects"])) / max(1, len(search_request["required_objects"]))
+            required = set(search_request["required_objects"])
+            obj_scores = image_index.label_overlap(required, rows).astype(np.float32) / max(1, len(required))
         else:
-            obj_score = 1.0
+            obj_scores = ones
         
         # Color filter score
         if search_request.get("required_colors"):
-            col_score = color_match_score(data['colors'], search_request["required_colors"])
+            col_scores = image_index.color_scores(search_request["required_colors"], rows)
         else:
-            col_score = 1.0
+            col_scores = ones
         
         # Combined score using improved algorithm
-        final_score = calculate_combined_score(sim, obj_score, col_score)
+        final_scores = calculate_combined_scores(sims, obj_scores, col_scores)
         
-        results.append((fid, data['name'], final_score, data['objects'], data['colors'], sim, obj_score, col_score, data.get('folder', 'Root')))
+        # Top-k selection without sorting the whole index
+        top = top_k_rows(final_scores, top_k)
+        return format_search_results(rows[top], final_scores[top], sims[top], obj_scores[top], col_scores[top])
 
-    # Sort by score and return top results
-    results.sort(key=lambda x: x[2], reverse=True)
-    
-    return [{
-        "file_id": r[0],
-        "name": r[1],
-        "score": round(r[2], 4),
-        "objects": r[3],
-        "colors": r[4],
-        "semantic_score": round(r[5], 4),
-        "object_score": round(r[6], 4),
-        "color_score": round(r[7], 4),
-        "folder": r[8]
-    } for r in results[:search_request.get("top_k", 6)]]
+# Objects whose presence boosts kitchen queries
+KITCHEN_OBJECTS = {'sink', 'refrigerator', 'oven', 'stove', 'microwave', 'dishwasher', 'knife', 'bowl', 'cup', 'bottle', 'wine glass', 'dining table'}
 
-@app.post("/search")
-def search_images(req: SearchRequest):
-    """Search images using semantic similarity, object detection, and color matching"""
-    if not image_index:
-        return {"error": "No images indexed. Call /index first."}
-    
-    print(f"🔍 Search request: {req.query}")
-    print(f"📊 Total indexed images: {len(image_index)}")
-    print(f"📂 Folders with images: {set(img.get('folder', 'Unknown') for img in image_index.values())}")
-    
-    # Translate Hebrew query to English for better CLIP understanding
-    translated_query = translate_hebrew_query(req.query)
-    print(f"🔄 Translated query: '{req.query}' -> '{translated_query}'")
-    
-    # Debug: Show sample of indexed images
-    sample_images = list(image_index.items())[:3]
-    for fid, data in sample_images:
-        print(f"📸 Sample image: {data['name']} - Objects: {data['objects']} - Folder: {data.get('folder', 'Unknown')}")
-    
-    # Apply special guidelines if provided
-    if req.special_guidelines:
-        translated_query += f" {req.special_guidelines}"
-        print(f"📋 Applied guidelines: {req.special_guidelines}")
+def rank_search_request(req: SearchRequest, translated_query: str, text_emb, sims=None):
+    """
+    Score indexed images for a search request and pick the final results.
+
+    `sims` optionally carries the precomputed CLIP similarity of the query against
+    every row of `image_index.matrix`; otherwise it is computed here, over the
+    ANN candidates unless the request asks for an exact scan.
+    Returns (rows, final_scores, semantic_scores, object_scores, color_scores),
+    ranked best first with the score arrays aligned to rows.
+    Callers hold `image_index.lock` until the rows are formatted, so rows keep
+    pointing at the same images.
+    """
+    n = len(image_index) if sims is None else sims.shape[0]
     
     # Process feedback images for learning
     feedback_boost = 0
+    avg_feedback = None
     if req.feedback_images:
-        print(f"🎯 Using {len(req.feedback_images)} feedback images for learning")
-        # Calculate average embedding of feedback images
-        feedback_embeddings = []
-        for fid in req.feedback_images:
-            if fid in image_index:
-                feedback_embeddings.append(image_index[fid]['embedding'])
-        
-        if feedback_embeddings:
+        feedback_rows = image_index.rows_of(req.feedback_images)
+        feedback_rows = feedback_rows[feedback_rows < n]
+        if len(feedback_rows) > 0:
             # Average the feedback embeddings
-            avg_feedback = torch.stack(feedback_embeddings).mean(dim=0)
+            avg_feedback = image_index.matrix[feedback_rows].mean(axis=0)
             feedback_boost = 0.3  # Boost for similar images
     
-    # Encode text query with CLIP
-    text_inputs = clip_processor(text=[translated_query], return_tensors="pt", padding=True)
-    text_inputs = {k: v.to(device) for k, v in text_inputs.items()}
-    with torch.no_grad():
-        text_features = clip_model.get_text_features(**text_inputs)
-        text_emb = text_features / text_features.norm(dim=-1, keepdim=True)
-
     # Check if query is asking for specific room types
     room_type_query = None
     hebrew_room_mapping = {
@@ -1640,121 +2144,212 @@ def search_images(req: SearchRequest):
             print(f"🏠 Detected room type query: {hebrew_room} -> {english_room}")
             break
 
-    results = []
-    for fid, data in image_index.items():
-        # Skip negative feedback images
-        if fid in req.negative_feedback:
-            continue
-            
-        # Semantic similarity score
-        sim = (text_emb.cpu() @ data['embedding'].T).item()
-        
-        # OCR text matching boost
-        ocr_boost = 0
-        if data.get('ocr_text') and req.query:
-            ocr_text = data['ocr_text'].lower()
-            query_lower = req.query.lower()
-            
+    # OCR text matching boost (only images that have OCR text are visited)
+    ocr_boosts = {}
+    if req.query:
+        query_lower = req.query.lower()
+        query_words = set(query_lower.split())
+        for row, ocr_text in image_index.ocr_rows():
+            if row >= n:
+                break
+            ocr_boost = 0
             # Check for exact matches in OCR text
             if query_lower in ocr_text:
                 ocr_boost = 0.3  # Significant boost for OCR matches
-            
             # Check for partial matches
-            query_words = query_lower.split()
-            ocr_words = ocr_text.split()
-            matching_words = len(set(query_words) & set(ocr_words))
+            matching_words = len(query_words & set(ocr_text.split()))
             if matching_words > 0:
                 ocr_boost = max(ocr_boost, matching_words * 0.1)
-        
-        sim = sim + ocr_boost
-        
-        # Apply feedback boost if available
-        if req.feedback_images and feedback_boost > 0:
-            feedback_sim = (avg_feedback.cpu() @ data['embedding'].T).item()
-            sim = max(sim, sim + feedback_sim * feedback_boost)
-        
-        # Room type matching boost
-        room_type_boost = 0
-        if room_type_query and data.get('room_type') == room_type_query:
-            room_type_boost = 0.4
-            print(f"🏠 Room type match for {data['name']}: {data['room_type']} matches {room_type_query}")
-        
-        # Object filter score - enhanced for room type detection
+            if ocr_boost:
+                ocr_boosts[row] = ocr_boost
+    
+    # Candidate rows: ANN neighbours of the query (and feedback), plus OCR hits and
+    # images containing every required object (inverted label index)
+    query_embeddings = [text_emb] if avg_feedback is None else [text_emb, avg_feedback]
+    rows = None if sims is not None else select_candidate_rows(query_embeddings, req.top_k, req.ef, req.nprobe, req.exact_search)
+    if rows is None:
+        sims = (image_index.similarities(text_emb) if sims is None else sims).astype(np.float32, copy=True)
+        rows = np.arange(sims.shape[0])
+    else:
+        rows = np.union1d(rows, np.fromiter(ocr_boosts.keys(), dtype=np.int64, count=len(ocr_boosts)))
         if req.required_objects:
-            obj_score = len(set(data['objects']) & set(req.required_objects)) / max(1, len(req.required_objects))
-        else:
-            # Check if query is a room type and boost object detection
-            room_boost = 0
-            if any(room_term in req.query.lower() for room_term in ['kitchen', 'מטבח', 'bedroom', 'חדר שינה', 'bathroom', 'חדר רחצה']):
-                # Boost score for kitchen-related objects when searching for kitchen
-                if 'kitchen' in translated_query.lower() or 'מטבח' in req.query:
-                    kitchen_objects = ['sink', 'refrigerator', 'oven', 'stove', 'microwave', 'dishwasher', 'knife', 'bowl', 'cup', 'bottle', 'wine glass', 'dining table']
-                    kitchen_matches = len(set(data['objects']) & set(kitchen_objects))
-                    room_boost = min(0.5, kitchen_matches * 0.1)  # Boost up to 0.5
-                # Add similar logic for other room types
-            obj_score = 1.0 + room_boost
-        
-        # Color filter score
-        if req.required_colors:
-            col_score = color_match_score(data['colors'], req.required_colors)
-        else:
-            col_score = 1.0
-        
-        # Combined score using improved algorithm with dynamic weights
-        # For room type searches, give more weight to object detection and room type
-        if any(room_term in req.query.lower() for room_term in ['kitchen', 'מטבח', 'bedroom', 'חדר שינה', 'bathroom', 'חדר רחצה']):
-            weights = {"semantic": 0.3, "object": 0.4, "color": 0.1, "room_type": 0.2}  # More weight to objects and room type for room detection
-        else:
-            weights = {"semantic": 0.6, "object": 0.2, "color": 0.2, "room_type": 0.0}  # Default weights
-        
-        # Add room type boost to semantic score
-        sim_with_room_boost = sim + room_type_boost
-        final_score = calculate_combined_score(sim_with_room_boost, obj_score, col_score, weights)
-        
-        results.append((fid, data['name'], final_score, data['objects'], data['colors'], sim, obj_score, col_score, data.get('folder', 'Root')))
-
-    # Sort by score and return top results
-    results.sort(key=lambda x: x[2], reverse=True)
+            rows = np.union1d(rows, image_index.rows_with_labels(req.required_objects))
+        sims = image_index.matrix[rows] @ image_index.embedding_row(text_emb)
+    
+    if ocr_boosts:
+        sims += np.array([ocr_boosts.get(int(row), 0) for row in rows], dtype=np.float32)
+    
+    # Skip negative feedback images
+    negative_rows = image_index.rows_of(req.negative_feedback)
+    excluded = np.isin(rows, negative_rows)
+    
+    # Apply feedback boost if available
+    if avg_feedback is not None:
+        feedback_sims = image_index.matrix[rows] @ avg_feedback
+        sims = np.maximum(sims, sims + feedback_sims * feedback_boost)
+    
+    # Room type matching boost
+    room_type_boost = np.zeros(len(rows), dtype=np.float32)
+    if room_type_query:
+        room_code = image_index.rooms.lookup(room_type_query)
+        room_matches = image_index.room_codes[rows] == room_code
+        room_type_boost[room_matches] = 0.4
+        print(f"🏠 Room type match for {int(room_matches.sum())} images: {room_type_query}")
+    
+    is_room_query = any(room_term in req.query.lower() for room_term in ['kitchen', 'מטבח', 'bedroom', 'חדר שינה', 'bathroom', 'חדר רחצה'])
+    
+    # Object filter score - enhanced for room type detection (popcounts over the label bitsets)
+    if req.required_objects:
+        required = set(req.required_objects)
+        obj_scores = image_index.label_overlap(required, rows).astype(np.float32) / max(1, len(required))
+    else:
+        # Check if query is a room type and boost object detection
+        room_boost = np.zeros(len(rows), dtype=np.float32)
+        if is_room_query:
+            # Boost score for kitchen-related objects when searching for kitchen
+            if 'kitchen' in translated_query.lower() or 'מטבח' in req.query:
+                kitchen_matches = image_index.label_overlap(KITCHEN_OBJECTS, rows).astype(np.float32)
+                room_boost = np.minimum(0.5, kitchen_matches * 0.1)  # Boost up to 0.5
+            # Add similar logic for other room types
+        obj_scores = 1.0 + room_boost
+    
+    # Color filter score
+    if req.required_colors:
+        col_scores = image_index.color_scores(req.required_colors, rows)
+    else:
+        col_scores = np.ones(len(rows), dtype=np.float32)
+    
+    # Combined score using improved algorithm with dynamic weights
+    # For room type searches, give more weight to object detection and room type
+    if is_room_query:
+        weights = {"semantic": 0.3, "object": 0.4, "color": 0.1, "room_type": 0.2}  # More weight to objects and room type for room detection
+    else:
+        weights = {"semantic": 0.6, "object": 0.2, "color": 0.2, "room_type": 0.0}  # Default weights
+    
+    # Add room type boost to semantic score
+    final_scores = calculate_combined_scores(sims + room_type_boost, obj_scores, col_scores, weights)
+    final_scores[excluded] = -np.inf
     
     # Add folder diversity to prevent bias towards one folder
-    if len(results) > req.top_k:
-        # Group results by folder
-        folder_groups = {}
-        for r in results:
-            folder = r[8]
-            if folder not in folder_groups:
-                folder_groups[folder] = []
-            folder_groups[folder].append(r)
-        
-        # Select diverse results from different folders
-        diverse_results = []
-        max_per_folder = max(1, req.top_k // len(folder_groups)) if folder_groups else req.top_k
-        
-        for folder, folder_results in folder_groups.items():
-            diverse_results.extend(folder_results[:max_per_folder])
-        
-        # Sort by score again and take top results
-        diverse_results.sort(key=lambda x: x[2], reverse=True)
-        final_results = diverse_results[:req.top_k]
+    all_excluded = negative_rows[negative_rows < n]
+    candidate_count = n - len(np.unique(all_excluded))
+    if candidate_count > req.top_k:
+        included = np.ones(n, dtype=bool)
+        included[all_excluded] = False
+        folder_count = len(np.unique(image_index.folder_codes[:n][included]))
+        max_per_folder = max(1, req.top_k // folder_count) if folder_count else req.top_k
+        top = diverse_top_k_rows(final_scores, req.top_k, image_index.folder_codes[rows], max_per_folder)
     else:
-        final_results = results
+        top = top_k_rows(final_scores, candidate_count)
+    
+    return rows[top], final_scores[top], sims[top], obj_scores[top], col_scores[top]
+
+@app.post("/search")
+def search_images(req: SearchRequest):
+    """Search images using semantic similarity, object detection, and color matching"""
+    if not image_index:
+        return {"error": "No images indexed. Call /index first."}
+    
+    print(f"🔍 Search request: {req.query}")
+    print(f"📊 Total indexed images: {len(image_index)}")
+    print(f"📂 Folders with images: {len(image_index.folders.labels)}")
+    
+    # Translate Hebrew query to English for better CLIP understanding
+    translated_query = translate_hebrew_query(req.query)
+    print(f"🔄 Translated query: '{req.query}' -> '{translated_query}'")
+    
+    # Encode text query with CLIP (cached per query + guidelines)
+    text_emb = encode_text_query(translated_query, req.special_guidelines)
+    
+    # Apply special guidelines if provided
+    if req.special_guidelines:
+        translated_query += f" {req.special_guidelines}"
+        print(f"📋 Applied guidelines: {req.special_guidelines}")
+    
+    if req.feedback_images:
+        print(f"🎯 Using {len(req.feedback_images)} feedback images for learning")
+
+    with image_index.lock:
+        results = format_search_results(*rank_search_request(req, translated_query, text_emb))
     
     # Debug: Print top results with scores
-    print(f"🏆 Top {min(5, len(final_results))} search results:")
-    for i, r in enumerate(final_results[:5]):
-        print(f"  {i+1}. {r[1]} - Score: {r[2]:.4f} (Semantic: {r[5]:.4f}, Objects: {r[6]:.4f}, Colors: {r[7]:.4f}) - Folder: {r[8]} - Objects: {r[3]}")
-    
-    return JSONResponse(content=[{
-        "file_id": r[0],
-        "name": r[1],
-        "score": round(r[2], 4),
-        "objects": r[3],
-        "colors": r[4],
-        "semantic_score": round(r[5], 4),
-        "object_score": round(r[6], 4),
-        "color_score": round(r[7], 4),
-        "folder": r[8]
-    } for r in final_results])
+    print(f"🏆 Top {min(5, len(results))} search results:")
+    for i, r in enumerate(results[:5]):
+        print(f"  {i+1}. {r['name']} - Score: {r['score']:.4f} (Semantic: {r['semantic_score']:.4f}, Objects: {r['object_score']:.4f}, Colors: {r['color_score']:.4f}) - Folder: {r['folder']} - Objects: {r['objects']}")
+    
+    return JSONResponse(content=results)
+
+class BatchSearchRequest(BaseModel):
+    queries: List[SearchRequest]      # Each query keeps its own filters, feedback and top_k
+
+@app.post("/search/batch")
+def search_images_batch(req: BatchSearchRequest):
+    """Run several searches with one CLIP text forward pass and one Q x N similarity matmul"""
+    if not image_index:
+        return {"error": "No images indexed. Call /index first."}
+    if not req.queries:
+        return JSONResponse(content=[])
+    
+    print(f"🔍 Batch search request: {len(req.queries)} queries over {len(image_index)} images")
+    start = time.time()
+    
+    translated_queries = [translate_hebrew_query(q.query) for q in req.queries]
+    text_embs = encode_text_queries(translated_queries, [q.special_guidelines for q in req.queries])
+    
+    batch_results = []
+    with image_index.lock:
+        # N x Q similarities of every indexed image against every query
+        sims = image_index.matrix @ text_embs.T
+        for i, query_req in enumerate(req.queries):
+            translated_query = translated_queries[i]
+            if query_req.special_guidelines:
+                translated_query += f" {query_req.special_guidelines}"
+            results = format_search_results(*rank_search_request(query_req, translated_query, text_embs[i], sims=sims[:, i]))
+            batch_results.append({
+                "query": query_req.query,
+                "translated_query": translated_queries[i],
+                "results": results
+            })
+    
+    print(f"✅ Batch search finished in {time.time() - start:.3f}s")
+    return JSONResponse(content=batch_results)
+
+class ANNCompareRequest(BaseModel):
+    queries: list = []                # Text queries; empty = sample indexed images as queries
+    top_k: int = 10
+    ef: int = 0
+    nprobe: int = 0
+    sample_size: int = 50
+
+@app.get("/ann/status")
+def ann_status():
+    """Show the configured ANN backend and its parameters"""
+    return {"images_indexed": len(image_index), "candidates_per_query": ANN_CANDIDATES, **ann_index.stats()}
+
+@app.post("/ann/rebuild")
+def ann_rebuild():
+    """Rebuild the ANN index from the current image_index (e.g. retrain IVF centroids)"""
+    start = time.time()
+    if isinstance(ann_index, IVFIndex):
+        ann_index.train()
+    else:
+        ann_index.rebuild()
+    return {"status": "rebuilt", "seconds": round(time.time() - start, 3), **ann_index.stats()}
+
+@app.post("/ann/compare")
+def ann_compare(req: ANNCompareRequest):
+    """Compare ANN recall@k and latency against the exact brute-force path"""
+    if not image_index:
+        return {"error": "No images indexed. Call /index first."}
+    
+    if req.queries:
+        queries = np.stack([image_index.embedding_row(encode_text_query(translate_hebrew_query(q))) for q in req.queries])
+    else:
+        rng = np.random.default_rng(0)
+        sample = rng.choice(len(image_index), size=min(req.sample_size, len(image_index)), replace=False)
+        queries = image_index.matrix[sample]
+    
+    return compare_with_exact(ann_index, queries, req.top_k, ef=req.ef or None, nprobe=req.nprobe or None)
 
 # ---------------------------
 # Advanced Search Features
@@ -1862,15 +2457,10 @@ async def search_images_supabase(req: SearchRequest):
     
     # Apply special guidelines if provided
     if req.special_guidelines:
-        translated_query += f" {req.special_guidelines}"
         print(f"📋 Applied guidelines: {req.special_guidelines}")
     
-    # Encode text query with CLIP
-    text_inputs = clip_processor(text=[translated_query], return_tensors="pt", padding=True)
-    text_inputs = {k: v.to(device) for k, v in text_inputs.items()}
-    with torch.no_grad():
-        text_features = clip_model.get_text_features(**text_inputs)
-        text_emb = text_features / text_features.norm(dim=-1, keepdim=True)
+    # Encode text query with CLIP (cached per query + guidelines)
+    text_emb = torch.from_numpy(encode_text_query(translated_query, req.special_guidelines).copy()).unsqueeze(0)
     
     # Try Supabase vector search first
     print("🔍 Attempting Supabase vector search...")
@@ -1984,7 +2574,8 @@ async def setup_supabase_table():
                 folder TEXT,
                 ocr_text TEXT,
                 room_type TEXT DEFAULT 'unknown',
-                created_at TIMESTAMP DEFAULT NOW()
+                created_at TIMESTAMP DEFAULT NOW(),
+                updated_at TIMESTAMPTZ DEFAULT NOW()  -- see supabase_image_embeddings_v3.sql for the trigger
             );
             """
         }
@@ -2719,10 +3310,92 @@ def health_check():
     return {
         "status": "healthy",
         "device": device,
+        "clip_backend": {"name": CLIP_BACKEND_NAME, "agreement": clip_onnx.agreement if clip_onnx is not None else None},
         "authenticated": drive_service is not None,
-        "images_indexed": len(image_index)
+        "images_indexed": len(image_index),
+        "query_cache": query_cache.stats(),
+        "clip_batching": clip_image_encoder.stats(),
+        "yolo_batching": yolo_batcher.stats(),
+        "model_pool": model_pool.stats() if model_pool is not None else None,
+        "ocr": ocr_pool.stats() if ocr_pool is not None else None,
+        "embedding_writer": embedding_writer.stats(),
+        "feature_cache": feature_cache.stats() if feature_cache is not None else None,
+        "index_snapshot": index_sync_state
     }
 
+@app.get("/query_cache")
+def query_cache_stats():
+    """Hit/miss statistics of the text-query embedding cache"""
+    return query_cache.stats()
+
+@app.on_event("startup")
+def restore_index_snapshot():
+    """Make image_index searchable immediately from the last on-disk snapshot"""
+    if not INDEX_SNAPSHOT_DIR:
+        return
+    start = time.time()
+    stamp = load_index_snapshot(image_index, INDEX_SNAPSHOT_DIR, CLIP_MODEL_NAME)
+    if stamp:
+        index_sync_state["synced_at"] = stamp["synced_at"]
+        index_sync_state["snapshot_id"] = stamp["snapshot_id"]
+        print(f"⚡ Restored {stamp['count']} images from snapshot {stamp['snapshot_id']} in {time.time() - start:.2f}s")
+
+@app.on_event("shutdown")
+def save_index_on_shutdown():
+    """Write a fresh snapshot so the next start only syncs the delta"""
+    if image_index:
+        save_snapshot()
+
+@app.on_event("shutdown")
+def stop_clip_batching():
+    """Let queued image embeddings finish before the process exits"""
+    clip_image_encoder.close(timeout=10)
+    yolo_batcher.close(timeout=10)
+    if model_pool is not None:
+        model_pool.close()
+    if ocr_pool is not None:
+        ocr_pool.close()
+
+@app.on_event("startup")
+def resume_index_job():
+    """Pick up a full crawl interrupted by a crash or deploy (as soon as Drive credentials are available)"""
+    global drive_service
+    state = interrupted_index_job()
+    if state is None:
+        return
+    print(f"♻️ Found interrupted index job {state.job_id}: {state.summary()}")
+    creds = service_account_credentials()
+    if creds is None:
+        print("ℹ️ Authenticate and POST /index to resume it")
+        return
+    drive_service = drive_service or build('drive', 'v3', credentials=creds, cache_discovery=False)
+    start_index_job(drive_service, resume=state)
+
+@app.on_event("shutdown")
+def checkpoint_index_job():
+    """Flush the crawl journal so a running job resumes after the restart"""
+    if index_jobs.active() is not None and index_journal:
+        embedding_writer.flush(timeout=60)  # queued rows report back to the journal first
+        index_journal.close()
+
+@app.on_event("shutdown")
+def flush_embedding_writes():
+    """Write every queued embedding row before the process exits"""
+    embedding_writer.close(timeout=60)
+    print(f"💾 Embedding writer: {embedding_writer.stats()}")
+
+@app.on_event("shutdown")
+def close_feature_cache():
+    if feature_cache is not None:
+        print(f"💾 Feature cache: {feature_cache.stats()}")
+        feature_cache.close()
+
+@app.on_event("shutdown")
+def save_query_cache():
+    """Persist warm query embeddings so they survive a restart"""
+    if query_cache.save():
+        print(f"💾 Saved {query_cache.stats()['entries']} cached query embeddings")
+
 # ---------------------------
 # Health Check
 # ---------------------------
@@ -3283,37 +3956,58 @@ async def upload_images(images: List[UploadFile] = File(...), guidelines: str =
         raise HTTPException(status_code=400, detail="No images provided")
     
     uploaded_images = []
+    failed_images = []
     
+    def upload_failed(image_file, error):
+        print(f"Failed to process uploaded image {image_file.filename}: {error}")
+        failed_images.append({"name": image_file.filename, "error": str(error)})
+    
+    # Decode every upload first so CLIP can embed them in batches
+    decoded = []
     for image_file in images:
         try:
             # Read image file
             image_content = await image_file.read()
-            image_bytes = io.BytesIO(image_content)
             
-            # Open and process image
-            img = Image.open(image_bytes).convert("RGB")
+            # Decode once at the working size
+            decoded.append((image_file, image_content, prepare_image(image_content, keep_source=ocr_pool is not None)))
+        except Exception as e:
+            upload_failed(image_file, e)
+            continue
+    
+    # CLIP embeddings and YOLO detections, one forward pass per batch
+    try:
+        embeddings = clip_image_encoder.encode_many([img.image for _, _, img in decoded])
+        detections = yolo_batcher.encode_many([img.image for _, _, img in decoded])
+        analyzed = list(zip(decoded, embeddings, detections))
+    except Exception as e:
+        # One bad image fails the whole batch: retry one by one so it only drops itself
+        print(f"Batched analysis of uploaded images failed ({e}), analyzing them one by one")
+        analyzed = []
+        for item in decoded:
+            try:
+                analyzed.append((item, clip_image_encoder.encode(item[2].image), yolo_batcher.encode(item[2].image)))
+            except Exception as item_error:
+                upload_failed(item[0], item_error)
+    
+    for (image_file, image_content, img), embedding, image_detections in analyzed:
+        try:
+            embedding = embedding.unsqueeze(0)
             
             # Generate unique ID for uploaded image
             import uuid
             file_id = f"uploaded_{uuid.uuid4().hex}"
             
-            # CLIP embedding
-            inputs = clip_processor(images=img, return_tensors="pt")
-            inputs = {k: v.to(device) for k, v in inputs.items()}
-            with torch.no_grad():
-                image_features = clip_model.get_image_features(**inputs)
-                embedding = image_features / image_features.norm(dim=-1, keepdim=True)
-            
             # Extract dominant colors
             colors = extract_dominant_colors(img)
             
             # YOLO object detection
-            objects = detect_objects_yolo(img)
+            objects = detection_labels(image_detections)
             
             # Store in index
             image_index[file_id] = {
                 "name": image_file.filename,
-                "embedding": embedding.cpu(),
+                "embedding": embedding,
                 "objects": objects,
                 "colors": colors,
                 "folder": "Uploaded Images",
@@ -3335,12 +4029,13 @@ async def upload_images(images: List[UploadFile] = File(...), guidelines: str =
             print(f"Uploaded and indexed: {image_file.filename} - Objects: {objects} - Colors: {colors}")
             
         except Exception as e:
-            print(f"Failed to process uploaded image {image_file.filename}: {e}")
+            upload_failed(image_file, e)
             continue
     
     return JSONResponse(content={
         "count": len(uploaded_images),
         "uploaded_images": uploaded_images,
+        "failed_images": failed_images,
         "message": f"Successfully uploaded and indexed {len(uploaded_images)} image(s)"
     })
 
@@ -3363,7 +4058,7 @@ async def get_uploaded_image(file_id: str):
     )
 
 @app.post("/analyze_storyboard")
-async def analyze_storyboard(storyboard: UploadFile = File(...), guidelines: str = Form(""), feedback_images: str = Form(""), negative_feedback: str = Form("")):
+async def analyze_storyboard(storyboard: UploadFile = File(...), guidelines: str = Form(""), feedback_images: str = Form(""), negative_feedback: str = Form(""), ef: int = Form(0), nprobe: int = Form(0), exact_search: bool = Form(False)):
     """Analyze storyboard image and find similar images with re-search capability"""
     global image_index
     
@@ -3373,45 +4068,47 @@ async def analyze_storyboard(storyboard: UploadFile = File(...), guidelines: str
     try:
         # Read and process storyboard image
         image_content = await storyboard.read()
-        image_bytes = io.BytesIO(image_content)
-        img = Image.open(image_bytes).convert("RGB")
+        img = prepare_image(image_content)
         
         # Analyze storyboard
         storyboard_analysis = analyze_storyboard_image(img)
         
-        # Find similar images
-        similar_images = []
-        for file_id, data in image_index.items():
-            # Calculate semantic similarity
-            semantic_sim = (storyboard_analysis['embedding'] @ data['embedding'].T).item()
-            
-            # Calculate object similarity
-            storyboard_objects = set(storyboard_analysis['objects'])
-            image_objects = set(data['objects'])
-            if storyboard_objects or image_objects:
-                object_sim = len(storyboard_objects & image_objects) / len(storyboard_objects | image_objects)
+        # Rows stay put while scoring and reading the matches (indexing runs concurrently)
+        with image_index.lock:
+            # Find similar images - score the ANN candidates (or the whole index) at once
+            rows = select_candidate_rows([storyboard_analysis['embedding']], 10, ef, nprobe, exact_search)
+            if rows is None:
+                semantic_sims = image_index.similarities(storyboard_analysis['embedding'])
+                rows = np.arange(semantic_sims.shape[0])
             else:
-                object_sim = 1.0
-            
+                semantic_sims = image_index.matrix[rows] @ image_index.embedding_row(storyboard_analysis['embedding'])
+        
+            # Calculate object similarity (Jaccard)
+            storyboard_objects = set(storyboard_analysis['objects'])
+            shared = image_index.label_overlap(storyboard_objects, rows)
+            union = len(storyboard_objects) + image_index.label_counts(rows) - shared
+            object_sims = np.where(union > 0, shared / np.maximum(union, 1), 1.0).astype(np.float32)
+        
             # Calculate color similarity
-            color_sim = color_match_score(data['colors'], storyboard_analysis['colors'])
-            
-            # Combined similarity score
-            similarity_score = calculate_combined_score(semantic_sim, object_sim, color_sim)
-            
-            similar_images.append({
-                'file_id': file_id,
-                'name': data['name'],
-                'folder': data.get('folder', 'Root'),
-                'similarity_score': similarity_score,
-                'object_match': object_sim,
-                'color_match': color_sim,
-                'objects': data['objects'],
-                'colors': data['colors']
-            })
+            color_sims = image_index.color_scores(storyboard_analysis['colors'], rows)
         
-        # Sort by similarity score
-        similar_images.sort(key=lambda x: x['similarity_score'], reverse=True)
+            # Combined similarity score
+            similarity_scores = calculate_combined_scores(semantic_sims, object_sims, color_sims)
+        
+            similar_images = []
+            for i in top_k_rows(similarity_scores, 10):
+                file_id = image_index.ids[rows[i]]
+                data = image_index[file_id]
+                similar_images.append({
+                    'file_id': file_id,
+                    'name': data['name'],
+                    'folder': data.get('folder', 'Root'),
+                    'similarity_score': float(similarity_scores[i]),
+                    'object_match': float(object_sims[i]),
+                    'color_match': float(color_sims[i]),
+                    'objects': data['objects'],
+                    'colors': data['colors']
+                })
         
         # Return top 10 similar images
         return JSONResponse(content={
@@ -3420,8 +4117,8 @@ async def analyze_storyboard(storyboard: UploadFile = File(...), guidelines: str
                 'colors': storyboard_analysis['colors'],
                 'suggested_rooms': storyboard_analysis['suggested_rooms']
             },
-            'similar_images': similar_images[:10],
-            'message': f"Found {len(similar_images)} similar images"
+            'similar_images': similar_images,
+            'message': f"Found {len(rows)} similar images"
         })
         
     except Exception as e:
@@ -3440,6 +4137,10 @@ def root():
             "index": "/index - Index all Drive images",
             "search": "/search - Search images with AI",
             "search_with_feedback": "/search_with_feedback - Advanced search with feedback",
+            "search_batch": "/search/batch - Run many searches in one CLIP pass",
+            "ann_status": "/ann/status - ANN index backend and parameters",
+            "ann_compare": "/ann/compare - ANN recall/latency vs exact search",
+            "query_cache": "/query_cache - Text-query embedding cache statistics",
             "parse": "/parse_requirements - Parse storyboard/PDF",
             "upload": "/upload_images - Upload and index images",
             "storyboard": "/analyze_storyboard - Analyze storyboard and find similar images",
@@ -3495,6 +4196,10 @@ def api_info():
             "index": "/index - Index all Drive images",
             "search": "/search - Search images with AI",
             "search_with_feedback": "/search_with_feedback - Advanced search with feedback",
+            "search_batch": "/search/batch - Run many searches in one CLIP pass",
+            "ann_status": "/ann/status - ANN index backend and parameters",
+            "ann_compare": "/ann/compare - ANN recall/latency vs exact search",
+            "query_cache": "/query_cache - Text-query embedding cache statistics",
             "parse": "/parse_requirements - Parse storyboard/PDF",
             "upload": "/upload_images - Upload and index images",
             "storyboard": "/analyze_storyboard - Analyze storyboard and find similar images",
@@ -7,7 +7,6 @@ import os
 import sys
 import json
 import time
-import asyncio
 from datetime import datetime
 from typing import List, Dict, Any, Optional
 from pathlib import Path
@@ -21,10 +20,10 @@ from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 import uvicorn
 
-# Import V4 components
+# Import V4 components (drive_service is read from the module: it is set after /auth)
+import fastapi_drive_ai_v4_production as v4
 from fastapi_drive_ai_v4_production import (
     app as v4_app,
-    drive_service,
     TARGET_FOLDER_ID,
     TARGET_FOLDER_NAME,
     SCOPES
@@ -79,16 +78,6 @@ app.include_router(v4_app.router, prefix="/v4")
 # Include production search routes
 app.include_router(search_router, prefix="/api")
 
-# Global variables for indexing status
-indexing_status = {
-    "is_running": False,
-    "started_at": None,
-    "processed_count": 0,
-    "total_count": 0,
-    "current_file": None,
-    "errors": []
-}
-
 class IndexingStatusResponse(BaseModel):
     is_running: bool
     started_at: Optional[str]
@@ -97,6 +86,40 @@ class IndexingStatusResponse(BaseModel):
     current_file: Optional[str]
     errors: List[str]
     progress_percentage: float
+    job_id: Optional[str] = None
+    status: str = "idle"
+    images_per_sec: float = 0.0
+    eta_seconds: Optional[int] = None
+    queues: Dict[str, int] = {}
+    stages: Dict[str, Dict[str, float]] = {}
+    error_counts: Dict[str, int] = {}
+
+def indexing_status() -> Dict[str, Any]:
+    """The V4 indexing job (v4.index_jobs) in the shape this app has always reported"""
+    job = v4.index_jobs.current
+    if job is None:
+        return {"is_running": False, "started_at": None, "processed_count": 0, "total_count": 0,
+                "current_file": None, "errors": [], "progress_percentage": 0.0}
+    
+    status = job.status_dict()
+    images = status["images"]
+    total = images["done"] + images["remaining_estimate"]
+    return {
+        "is_running": v4.index_jobs.active() is job,
+        "started_at": status["started_at"],
+        "processed_count": images["done"],
+        "total_count": total,
+        "current_file": None,
+        "errors": [f"{error['stage']}: {error['class']}: {error['message']}" for error in status["errors"]["recent"]],
+        "progress_percentage": images["done"] / total * 100 if total else 0.0,
+        "job_id": status["job_id"],
+        "status": status["status"],
+        "images_per_sec": status["throughput"]["recent_images_per_sec"],
+        "eta_seconds": status["eta_seconds"],
+        "queues": status["queues"],
+        "stages": status["stages"],
+        "error_counts": status["errors"]["by_class"],
+    }
 
 @app.get("/")
 async def root():
@@ -130,7 +153,7 @@ async def health_check():
             supabase_status = f"error: {str(e)}"
         
         # Check Google Drive connection
-        drive_status = "connected" if drive_service else "not_connected"
+        drive_status = "connected" if v4.drive_service else "not_connected"
         
         # Check production search
         search_status = "available" if production_search else "unavailable"
@@ -144,7 +167,7 @@ async def health_check():
                 "production_search": search_status,
                 "v4_backend": "running"
             },
-            "indexing": indexing_status
+            "indexing": indexing_status()
         }
     except Exception as e:
         return {
@@ -155,73 +178,37 @@ async def health_check():
 
 @app.get("/indexing/status", response_model=IndexingStatusResponse)
 async def get_indexing_status():
-    """Get current indexing status"""
-    progress = 0.0
-    if indexing_status["total_count"] > 0:
-        progress = (indexing_status["processed_count"] / indexing_status["total_count"]) * 100
-    
-    return IndexingStatusResponse(
-        is_running=indexing_status["is_running"],
-        started_at=indexing_status["started_at"],
-        processed_count=indexing_status["processed_count"],
-        total_count=indexing_status["total_count"],
-        current_file=indexing_status["current_file"],
-        errors=indexing_status["errors"],
-        progress_percentage=progress
-    )
+    """Get current indexing status (progress, images/sec, ETA, stage latency, errors)"""
+    return IndexingStatusResponse(**indexing_status())
 
 @app.post("/indexing/start")
-async def start_indexing():
-    """Start V4 indexing process"""
-    global indexing_status
+async def start_indexing(incremental: bool = False):
+    """Start V4 indexing process in the background"""
+    if not v4.drive_service:
+        return {"status": "error", "error": "Not authenticated"}
     
-    if indexing_status["is_running"]:
-        return {"status": "already_running", "message": "Indexing is already in progress"}
+    job, started = v4.start_index_job(v4.drive_service, incremental)
+    if not started:
+        return {"status": "already_running", "message": "Indexing is already in progress", "job_id": job.job_id}
     
-    try:
-        # Update status
-        indexing_status.update({
-            "is_running": True,
-            "started_at": datetime.utcnow().isoformat(),
-            "processed_count": 0,
-            "total_count": 0,
-            "current_file": None,
-            "errors": []
-        })
-        
-        # Start indexing in background
-        asyncio.create_task(run_indexing_process())
-        
-        return {
-            "status": "started",
-            "message": "V4 indexing process started",
-            "started_at": indexing_status["started_at"]
-        }
-        
-    except Exception as e:
-        indexing_status["is_running"] = False
-        return {"status": "error", "error": str(e)}
+    return {
+        "status": "started",
+        "message": "V4 indexing process started",
+        "job_id": job.job_id,
+        "started_at": job.started_at
+    }
 
-async def run_indexing_process():
-    """Run the V4 indexing process"""
-    global indexing_status
-    
-    try:
-        print("🚀 Starting V4 indexing process...")
-        
-        # Import V4 indexing function
-        from fastapi_drive_ai_v4_production import crawl_drive_images
-        
-        # Start crawling
-        await crawl_drive_images(drive_service, max_images=999999)
-        
-        print("✅ V4 indexing completed successfully!")
-        
-    except Exception as e:
-        print(f"❌ V4 indexing failed: {e}")
-        indexing_status["errors"].append(str(e))
-    finally:
-        indexing_status["is_running"] = False
+@app.post("/indexing/pause")
+async def pause_indexing():
+    return v4.control_index_job("pause")
+
+@app.post("/indexing/resume")
+async def resume_indexing():
+    return v4.control_index_job("resume")
+
+@app.post("/indexing/cancel")
+async def cancel_indexing():
+    return v4.control_index_job("cancel")
 
 @app.get("/stats/overview")
 async def get_system_overview():
@@ -270,7 +257,7 @@ async def get_system_overview():
             "system_status": {
                 "v4_backend": "running",
                 "production_search": "available" if production_search else "unavailable",
-                "indexing": indexing_status
+                "indexing": indexing_status()
             }
         }
         
@@ -18,7 +18,7 @@ import uuid
 import time
 import hashlib
 import traceback
-from typing import List, Dict, Optional, Tuple
+from typing import List, Dict, Iterable, Optional, Tuple
 from pathlib import Path
 from datetime import datetime
 
@@ -60,6 +60,27 @@ try:
 except ImportError:
     TRANSFORMERS_AVAILABLE = False
 
+# Drive listing (paged, images + subfolders in one query)
+from drive_crawler import (iter_folder_pages, per_thread_service, get_start_page_token, collect_drive_changes,
+                           load_change_token, save_change_token)
+
+# Staged download -> decode -> infer -> persist indexing
+from indexing_pipeline import IndexingPipeline, PipelineStage
+
+# Background indexing jobs (pause / cancel / throughput / ETA)
+from indexing_jobs import JobCancelled, JobManager, job_timer
+
+# Batched YOLO detection (one predict call per batch of images)
+from yolo_detector import YOLODetector
+from clip_batch_encoder import BatchingEncoder
+from model_worker_pool import ModelWorkerPool
+
+# Decode-once, downscaled image preparation
+from image_prep import IMAGE_MAX_SIDE, prepare_image
+
+# Features by Drive md5Checksum (copies / moves skip download and inference)
+from feature_cache import FeatureCache
+
 # Supabase & Database
 from supabase import create_client, Client
 from dotenv import load_dotenv
@@ -87,6 +108,16 @@ if OPENAI_API_KEY:
 # Google Drive Target Folder
 TARGET_FOLDER_ID = '11kSHWn47cQqeRhtlVQ-4Uask7jr2fqjW'
 TARGET_FOLDER_NAME = 'Shared Locations Drive'
+# Drive changes-feed position for incremental /index runs
+DRIVE_CHANGES_STATE = os.getenv("DRIVE_CHANGES_STATE", "drive_changes_token_v4.json")
+
+# Indexing pipeline: threads per stage and the bounded queue between stages
+INDEX_DOWNLOAD_WORKERS = int(os.getenv("INDEX_DOWNLOAD_WORKERS", "6"))
+INDEX_DECODE_WORKERS = int(os.getenv("INDEX_DECODE_WORKERS", "2"))
+INDEX_INFER_WORKERS = int(os.getenv("INDEX_INFER_WORKERS", "4"))  # YOLO calls are batched across these workers
+INDEX_PERSIST_WORKERS = int(os.getenv("INDEX_PERSIST_WORKERS", "4"))
+INDEX_QUEUE_SIZE = int(os.getenv("INDEX_QUEUE_SIZE", "8"))
+index_jobs = JobManager()  # start / pause / cancel / status of /index runs
 
 # OAuth Scopes
 SCOPES = [
@@ -108,6 +139,38 @@ ssl_context.verify_mode = ssl.CERT_NONE
 # YOLO for object detection
 print("📦 Loading YOLO model...")
 yolo_model = YOLO("yolov8n.pt")
+yolo_detector = YOLODetector(
+    yolo_model,
+    imgsz=int(os.getenv("YOLO_IMGSZ", "640")),
+    conf=float(os.getenv("YOLO_CONF", "0.25")),
+    batch_size=int(os.getenv("YOLO_BATCH_SIZE", "8"))
+)
+
+# On CPU, YOLO runs in worker processes that each load the model once
+# (MODEL_WORKERS=auto sizes the pool to the cores, 0 keeps inference in this process)
+MODEL_WORKERS = os.getenv("MODEL_WORKERS", "auto")
+if not torch.cuda.is_available() and MODEL_WORKERS != "0":
+    model_pool = ModelWorkerPool(
+        workers=None if MODEL_WORKERS == "auto" else int(MODEL_WORKERS),
+        threads_per_worker=int(os.getenv("MODEL_THREADS_PER_WORKER", "0")) or None,
+        loader_kwargs={"clip_model_name": None, "yolo_weights": "yolov8n.pt", "yolo_imgsz": yolo_detector.imgsz,
+                       "yolo_conf": yolo_detector.conf, "yolo_batch_size": yolo_detector.batch_size}
+    )
+    yolo_batcher = model_pool.encoder("yolo", max_batch_size=yolo_detector.batch_size,
+                                      max_wait=float(os.getenv("YOLO_BATCH_WAIT_MS", "30")) / 1000)
+else:
+    model_pool = None
+    yolo_batcher = BatchingEncoder(yolo_detector.detect, max_batch_size=yolo_detector.batch_size,
+                                   max_wait=float(os.getenv("YOLO_BATCH_WAIT_MS", "30")) / 1000, name="yolo-batch")
+
+# Detections, colors, captions and the caption embedding by content checksum.
+# The version covers every setting that changes them, so stale entries are never reused.
+FEATURE_CACHE_PATH = os.getenv("FEATURE_CACHE_PATH", "feature_cache_v4.sqlite")
+feature_cache = FeatureCache(
+    FEATURE_CACHE_PATH,
+    version=f"v4|yolov8n@{yolo_detector.imgsz}/{yolo_detector.conf}|side{IMAGE_MAX_SIDE}|text-embedding-3-large",
+    max_entries=int(os.getenv("FEATURE_CACHE_SIZE", "0")) or None
+) if FEATURE_CACHE_PATH else None
 
 # CLIP for embeddings (optional, will switch to caption-based later)
 if CLIP_AVAILABLE:
@@ -410,7 +473,7 @@ def lab_to_color_name(lab: Tuple[float, float, float]) -> str:
     
     return best_color
 
-def extract_object_colors(image: np.ndarray, bbox: Dict, k=3) -> List[Dict]:
+def extract_object_colors(image: np.ndarray, bbox: Dict, k=3, lab: Optional[np.ndarray] = None) -> List[Dict]:
     """
     Extract dominant colors from object region using K-means in LAB space
     
@@ -418,6 +481,7 @@ def extract_object_colors(image: np.ndarray, bbox: Dict, k=3) -> List[Dict]:
         image: Image as numpy array (RGB)
         bbox: Bounding box {"x", "y", "w", "h"}
         k: Number of color clusters
+        lab: Precomputed LAB of the whole image (skips the per-object conversion)
     
     Returns:
         List of {"name": "black", "lab": {...}, "ratio": 0.6}
@@ -434,7 +498,10 @@ def extract_object_colors(image: np.ndarray, bbox: Dict, k=3) -> List[Dict]:
         pixels = crop.reshape(-1, 3)
         
         # Convert to LAB
-        lab_pixels = skimage_color.rgb2lab(pixels.reshape(1, -1, 3) / 255.0)[0]
+        if lab is not None:
+            lab_pixels = lab[y:y+h, x:x+w].reshape(-1, 3)
+        else:
+            lab_pixels = skimage_color.rgb2lab(pixels.reshape(1, -1, 3) / 255.0)[0]
         
         # K-means clustering
         kmeans = KMeans(n_clusters=min(k, len(pixels)), random_state=42, n_init=10)
@@ -471,7 +538,8 @@ def extract_object_colors(image: np.ndarray, bbox: Dict, k=3) -> List[Dict]:
 # PHASE 2: MATERIAL DETECTION (HEURISTIC V1)
 # =====================================================
 
-def detect_material_heuristic(image: np.ndarray, bbox: Dict, label: str) -> Tuple[str, float]:
+def detect_material_heuristic(image: np.ndarray, bbox: Dict, label: str,
+                              gray_image: Optional[np.ndarray] = None) -> Tuple[str, float]:
     """
     Heuristic material detection based on texture and context
     
@@ -481,6 +549,7 @@ def detect_material_heuristic(image: np.ndarray, bbox: Dict, label: str) -> Tupl
         image: Image as numpy array
         bbox: Bounding box
         label: Object label
+        gray_image: Precomputed grayscale of the whole image
     
     Returns:
         (material, confidence)
@@ -493,7 +562,10 @@ def detect_material_heuristic(image: np.ndarray, bbox: Dict, label: str) -> Tupl
             return 'unknown', 0.0
         
         # Convert to grayscale for texture analysis
-        gray = cv2.cvtColor(crop, cv2.COLOR_RGB2GRAY)
+        if gray_image is not None:
+            gray = gray_image[y:y+h, x:x+w]
+        else:
+            gray = cv2.cvtColor(crop, cv2.COLOR_RGB2GRAY)
         
         # Compute texture features
         laplacian_var = cv2.Laplacian(gray, cv2.CV_64F).var()
@@ -668,6 +740,213 @@ def generate_text_embedding(text: str) -> List[float]:
 # MAIN INDEXING PIPELINE
 # =====================================================
 
+# Content-derived fields reused for another file with the same md5Checksum
+CACHED_FEATURES = ("width", "height", "detected_objects", "room_type", "room_confidence",
+                   "caption_en", "caption_he", "facts")
+
+def decode_for_indexing(record: Dict) -> Optional[Dict]:
+    """
+    Pipeline stage 1 (decode): load the image once at the working size,
+    perceptual hash & dedup check.
+    Returns None for duplicates (record["result"] holds the status).
+    """
+    if record.get("cached"):
+        print(f"🖼️  Processing (cached features): {record['file_name']}")
+    else:
+        prepared = prepare_image(record.pop("image_data"))
+        record["image"] = prepared
+        record["width"], record["height"] = prepared.original_size
+        
+        print(f"🖼️  Processing: {record['file_name']}")
+    
+    # =====================================================
+    # STEP 1: Perceptual Hash & Dedup
+    # =====================================================
+    if not record.get("cached"):
+        record["phash"] = compute_phash(prepared.image)
+    duplicate_id = check_duplicate_image(record["phash"])
+    if duplicate_id and not (record.get("reindex") and duplicate_id == record["drive_id"]):
+        print(f"⏭️  Duplicate detected (existing: {duplicate_id}), skipping")
+        record["result"] = {"status": "duplicate", "duplicate_of": duplicate_id}
+        return None
+    return record
+
+def analyze_for_indexing(record: Dict) -> Dict:
+    """Pipeline stage 2 (infer): detection, per-object color/material, room and caption"""
+    if record.get("cached"):
+        return record
+    prepared = record.pop("image")
+    image_np = prepared.rgb
+    job = record.get("job")
+    
+    # =====================================================
+    # STEP 2: Object Detection (YOLO, batched across infer workers)
+    # =====================================================
+    detected_objects = []
+    
+    with job_timer(job, "yolo"):
+        detections = yolo_batcher.encode(prepared.image)
+    for detection in detections:
+        label = detection["label"]
+        conf = detection["confidence"]
+        bbox = detection["bbox"]
+        
+        # =====================================================
+        # STEP 3: Per-Object Color Extraction
+        # =====================================================
+        with job_timer(job, "colour"):
+            colors = extract_object_colors(image_np, bbox, k=3, lab=prepared.lab)
+        primary_color = colors[0] if colors else {"name": "unknown", "lab": {}, "ratio": 1.0}
+        
+        # =====================================================
+        # STEP 4: Material Detection
+        # =====================================================
+        with job_timer(job, "material"):
+            material, material_conf = detect_material_heuristic(image_np, bbox, label, gray_image=prepared.gray)
+        
+        # Boxes are found on the working-size image; store them in original pixels
+        bbox = prepared.to_original_bbox(bbox)
+        
+        detected_objects.append({
+            "label": label,
+            "confidence": conf,
+            "bbox": bbox,
+            "color_name": primary_color['name'],
+            "color_lab": primary_color['lab'],
+            "secondary_colors": colors[1:] if len(colors) > 1 else [],
+            "material": material,
+            "material_confidence": material_conf,
+            "area_pixels": bbox['w'] * bbox['h']
+        })
+    
+    print(f"   ✅ Detected {len(detected_objects)} objects")
+    record["detected_objects"] = detected_objects
+    
+    # =====================================================
+    # STEP 5: Room Classification
+    # =====================================================
+    room_type, room_confidence = infer_room_from_objects(detected_objects)
+    record["room_type"], record["room_confidence"] = room_type, room_confidence
+    print(f"   🏠 Room: {room_type} (conf: {room_confidence:.2f})")
+    
+    # =====================================================
+    # STEP 6: Caption Generation
+    # =====================================================
+    with job_timer(job, "caption"):
+        caption_en, caption_he, facts = generate_structured_caption(
+            room_type,
+            detected_objects,
+            style_tags=[]  # TODO: Add style detection
+        )
+    record["caption_en"], record["caption_he"], record["facts"] = caption_en, caption_he, facts
+    print(f"   📝 Caption: {caption_en[:80]}...")
+    return record
+
+def persist_for_indexing(record: Dict) -> Dict:
+    """Pipeline stage 3 (persist): caption embedding and the multi-table Supabase writes"""
+    drive_id = record["drive_id"]
+    detected_objects = record["detected_objects"]
+    room_type = record["room_type"]
+    caption_en = record["caption_en"]
+    
+    # =====================================================
+    # STEP 7: Embedding Generation
+    # =====================================================
+    with job_timer(record.get("job"), "embedding"):
+        embed_en = record.get("embed_en") or generate_text_embedding(caption_en)
+    embed_he = embed_en  # Using same for now, TODO: separate Hebrew
+    
+    # =====================================================
+    # STEP 8: Store in Supabase (Multi-Table Insert)
+    # =====================================================
+    
+    # 8.1: Insert into images table
+    image_id = str(uuid.uuid4())
+    image_data_db = {
+        "id": image_id,
+        "drive_id": drive_id,
+        "file_name": record["file_name"],
+        "folder_path": record["folder_path"],
+        "width": record["width"],
+        "height": record["height"],
+        "phash": record["phash"].hex(),  # Store as hex string
+        "room_type": room_type,
+        "room_confidence": record["room_confidence"],
+        "style_tags": [],
+        "indexed_at": datetime.utcnow().isoformat()
+    }
+    supabase.table("images").upsert(image_data_db, on_conflict="drive_id").execute()
+    
+    # Get the actual image_id (in case it was an update)
+    result = supabase.table("images").select("id").eq("drive_id", drive_id).execute()
+    if result.data:
+        image_id = result.data[0]['id']
+    
+    # Re-indexed image: replace its objects and tags instead of appending to them
+    if record.get("reindex"):
+        supabase.table("image_objects").delete().eq("image_id", image_id).execute()
+        supabase.table("image_tags").delete().eq("image_id", image_id).execute()
+    
+    # 8.2: Insert objects
+    for obj in detected_objects:
+        obj_data = {
+            "image_id": image_id,
+            "label": obj['label'],
+            "label_confidence": obj['confidence'],
+            "bbox": obj['bbox'],
+            "mask_rle": None,  # TODO: Add SAM2 masks
+            "color_name": obj['color_name'],
+            "color_lab": obj['color_lab'],
+            "secondary_colors": obj['secondary_colors'],
+            "material": obj['material'],
+            "material_confidence": obj['material_confidence'],
+            "area_pixels": obj['area_pixels'],
+            "attributes": {}
+        }
+        supabase.table("image_objects").insert(obj_data).execute()
+    
+    # 8.3: Insert caption & embeddings
+    caption_data = {
+        "image_id": image_id,
+        "caption_en": caption_en,
+        "caption_he": record["caption_he"],
+        "facts": record["facts"],
+        "embed_en": embed_en,
+        "embed_he": embed_he
+    }
+    supabase.table("image_captions").upsert(caption_data, on_conflict="image_id").execute()
+    
+    # 8.4: Insert tags (denormalized for fast filtering)
+    tags = [
+        f"room:{room_type}",
+        *[f"obj:{obj['label']}" for obj in detected_objects],
+        *[f"col:{obj['color_name']}" for obj in detected_objects if obj['color_name'] != 'unknown'],
+        *[f"mat:{obj['material']}" for obj in detected_objects if obj['material'] != 'unknown'],
+    ]
+    
+    for tag in set(tags):  # Deduplicate
+        supabase.table("image_tags").upsert(
+            {"image_id": image_id, "tag": tag},
+            on_conflict="image_id,tag"
+        ).execute()
+    
+    print(f"   ✅ Stored in Supabase (image_id: {image_id})")
+    
+    if feature_cache is not None and not record.get("cached"):
+        features = {key: record[key] for key in CACHED_FEATURES}
+        features["phash"] = record["phash"].hex()
+        if any(embed_en):  # never cache the zero vector of a failed embedding call
+            features["embed_en"] = np.asarray(embed_en, dtype=np.float32)
+        feature_cache.put(record.get("checksum"), features)
+    
+    return {
+        "status": "success",
+        "image_id": image_id,
+        "room_type": room_type,
+        "objects_count": len(detected_objects),
+        "caption": caption_en
+    }
+
 def process_and_index_image(
     drive_id: str,
     file_name: str,
@@ -685,168 +964,17 @@ def process_and_index_image(
     7. Embedding generation
     8. Store in Supabase (5 tables)
     
+    Runs the decode / analyze / persist stages inline; crawls run them on the
+    staged IndexingPipeline instead.
+    
     Returns:
         Status dictionary
     """
+    record = {"drive_id": drive_id, "file_name": file_name, "folder_path": folder_path, "image_data": image_data}
     try:
-        # Load image
-        image = Image.open(io.BytesIO(image_data)).convert('RGB')
-        image_np = np.array(image)
-        width, height = image.size
-        
-        print(f"🖼️  Processing: {file_name}")
-        
-        # =====================================================
-        # STEP 1: Perceptual Hash & Dedup
-        # =====================================================
-        phash = compute_phash(image)
-        duplicate_id = check_duplicate_image(phash)
-        if duplicate_id:
-            print(f"⏭️  Duplicate detected (existing: {duplicate_id}), skipping")
-            return {"status": "duplicate", "duplicate_of": duplicate_id}
-        
-        # =====================================================
-        # STEP 2: Object Detection (YOLO)
-        # =====================================================
-        yolo_results = yolo_model(image_np, verbose=False)[0]
-        detected_objects = []
-        
-        for detection in yolo_results.boxes.data:
-            x1, y1, x2, y2, conf, cls = detection
-            label = yolo_model.names[int(cls)]
-            
-            bbox = {
-                "x": int(x1),
-                "y": int(y1),
-                "w": int(x2 - x1),
-                "h": int(y2 - y1)
-            }
-            
-            # =====================================================
-            # STEP 3: Per-Object Color Extraction
-            # =====================================================
-            colors = extract_object_colors(image_np, bbox, k=3)
-            primary_color = colors[0] if colors else {"name": "unknown", "lab": {}, "ratio": 1.0}
-            
-            # =====================================================
-            # STEP 4: Material Detection
-            # =====================================================
-            material, material_conf = detect_material_heuristic(image_np, bbox, label)
-            
-            detected_objects.append({
-                "label": label,
-                "confidence": float(conf),
-                "bbox": bbox,
-                "color_name": primary_color['name'],
-                "color_lab": primary_color['lab'],
-                "secondary_colors": colors[1:] if len(colors) > 1 else [],
-                "material": material,
-                "material_confidence": material_conf,
-                "area_pixels": bbox['w'] * bbox['h']
-            })
-        
-        print(f"   ✅ Detected {len(detected_objects)} objects")
-        
-        # =====================================================
-        # STEP 5: Room Classification
-        # =====================================================
-        room_type, room_confidence = infer_room_from_objects(detected_objects)
-        print(f"   🏠 Room: {room_type} (conf: {room_confidence:.2f})")
-        
-        # =====================================================
-        # STEP 6: Caption Generation
-        # =====================================================
-        caption_en, caption_he, facts = generate_structured_caption(
-            room_type,
-            detected_objects,
-            style_tags=[]  # TODO: Add style detection
-        )
-        print(f"   📝 Caption: {caption_en[:80]}...")
-        
-        # =====================================================
-        # STEP 7: Embedding Generation
-        # =====================================================
-        embed_en = generate_text_embedding(caption_en)
-        embed_he = embed_en  # Using same for now, TODO: separate Hebrew
-        
-        # =====================================================
-        # STEP 8: Store in Supabase (Multi-Table Insert)
-        # =====================================================
-        
-        # 8.1: Insert into images table
-        image_id = str(uuid.uuid4())
-        image_data_db = {
-            "id": image_id,
-            "drive_id": drive_id,
-            "file_name": file_name,
-            "folder_path": folder_path,
-            "width": width,
-            "height": height,
-            "phash": phash.hex(),  # Store as hex string
-            "room_type": room_type,
-            "room_confidence": room_confidence,
-            "style_tags": [],
-            "indexed_at": datetime.utcnow().isoformat()
-        }
-        supabase.table("images").upsert(image_data_db, on_conflict="drive_id").execute()
-        
-        # Get the actual image_id (in case it was an update)
-        result = supabase.table("images").select("id").eq("drive_id", drive_id).execute()
-        if result.data:
-            image_id = result.data[0]['id']
-        
-        # 8.2: Insert objects
-        for obj in detected_objects:
-            obj_data = {
-                "image_id": image_id,
-                "label": obj['label'],
-                "label_confidence": obj['confidence'],
-                "bbox": obj['bbox'],
-                "mask_rle": None,  # TODO: Add SAM2 masks
-                "color_name": obj['color_name'],
-                "color_lab": obj['color_lab'],
-                "secondary_colors": obj['secondary_colors'],
-                "material": obj['material'],
-                "material_confidence": obj['material_confidence'],
-                "area_pixels": obj['area_pixels'],
-                "attributes": {}
-            }
-            supabase.table("image_objects").insert(obj_data).execute()
-        
-        # 8.3: Insert caption & embeddings
-        caption_data = {
-            "image_id": image_id,
-            "caption_en": caption_en,
-            "caption_he": caption_he,
-            "facts": facts,
-            "embed_en": embed_en,
-            "embed_he": embed_he
-        }
-        supabase.table("image_captions").upsert(caption_data, on_conflict="image_id").execute()
-        
-        # 8.4: Insert tags (denormalized for fast filtering)
-        tags = [
-            f"room:{room_type}",
-            *[f"obj:{obj['label']}" for obj in detected_objects],
-            *[f"col:{obj['color_name']}" for obj in detected_objects if obj['color_name'] != 'unknown'],
-            *[f"mat:{obj['material']}" for obj in detected_objects if obj['material'] != 'unknown'],
-        ]
-        
-        for tag in set(tags):  # Deduplicate
-            supabase.table("image_tags").upsert(
-                {"image_id": image_id, "tag": tag},
-                on_conflict="image_id,tag"
-            ).execute()
-        
-        print(f"   ✅ Stored in Supabase (image_id: {image_id})")
-        
-        return {
-            "status": "success",
-            "image_id": image_id,
-            "room_type": room_type,
-            "objects_count": len(detected_objects),
-            "caption": caption_en
-        }
+        if decode_for_indexing(record) is None:
+            return record["result"]
+        return persist_for_indexing(analyze_for_indexing(record))
     
     except Exception as e:
         print(f"❌ Failed to process {file_name}: {e}")
@@ -887,58 +1015,122 @@ def authenticate_drive():
     except Exception as e:
         return {"status": "error", "error": str(e)}
 
-def crawl_and_index_folder(service, folder_id: str = None, folder_path: str = None):
-    """Recursively crawl folder and index all images"""
+def download_for_indexing(service, record: Dict) -> Dict:
+    """Pipeline download stage: fetch the Drive file bytes (or reuse cached features for known content)"""
+    cached = feature_cache.get(record.get("checksum")) if feature_cache is not None else None
+    if cached is not None:
+        record.update(cached, phash=bytes.fromhex(cached["phash"]), cached=True)
+        if "embed_en" in cached:
+            record["embed_en"] = cached["embed_en"].tolist()
+        return record
+    
+    request = service.files().get_media(fileId=record["drive_id"])
+    fh = io.BytesIO()
+    downloader = MediaIoBaseDownload(fh, request)
+    
+    done = False
+    while not done:
+        status, done = downloader.next_chunk()
+    
+    record["image_data"] = fh.getvalue()
+    return record
+
+def create_indexing_pipeline(service, job=None) -> IndexingPipeline:
+    """
+    download -> decode -> infer -> persist, each stage on its own bounded worker pool.
+    With a job, stages hold while it is paused, drop records once it is cancelled
+    and report latency (infer per step: yolo / colour / material / caption) and errors.
+    """
+    drive_for_thread = per_thread_service(service)
+    stages = [
+        ("download", lambda record: download_for_indexing(drive_for_thread(), record), INDEX_DOWNLOAD_WORKERS, True),
+        ("decode", decode_for_indexing, INDEX_DECODE_WORKERS, True),
+        ("infer", analyze_for_indexing, INDEX_INFER_WORKERS, False),
+        ("persist", persist_for_indexing, INDEX_PERSIST_WORKERS, True),
+    ]
+    return IndexingPipeline([
+        PipelineStage(name, job.stage(name, fn, timed=timed) if job is not None else fn, workers)
+        for name, fn, workers, timed in stages
+    ], queue_size=INDEX_QUEUE_SIZE)
+
+def _report_indexed(record: Dict, future) -> None:
+    """Done-callback: print the per-image status line once the pipeline finishes a file"""
+    job = record.get("job")
+    error = future.exception()
+    if error is not None:
+        print(f"❌ Failed to process {record['file_name']}: {error}")
+        result = {"status": "error"}
+    else:
+        dropped = {"status": "cancelled" if job is not None and job.cancelled else "skipped"}
+        result = future.result() or record.get("result", dropped)
+    print(f"      {result.get('status')}: {record['file_name']}")
+    if job is not None:
+        status = result.get("status") or "skipped"
+        job.image_done({"success": "indexed", "error": "failed", "cancelled": "cancelled"}.get(status, "skipped"))
+
+def crawl_and_index_folder(service, folder_id: Optional[str] = None, folder_path: Optional[str] = None,
+                           pipeline: Optional[IndexingPipeline] = None, reindex: bool = False, job=None):
+    """
+    Recursively crawl folder and index all images through the staged indexing pipeline.
+    reindex=True re-processes images that are already stored (e.g. after a folder move).
+    job (indexing_jobs.IndexingJob) collects progress and can pause or cancel the crawl.
+    """
     if folder_id is None:
         folder_id = TARGET_FOLDER_ID
     if folder_path is None:
         folder_path = TARGET_FOLDER_NAME
     
-    print(f"📁 Crawling: {folder_path}")
+    if pipeline is None:
+        # Top-level call owns the pipeline and waits for every queued image
+        with create_indexing_pipeline(service, job) as pipeline:
+            if job is not None:
+                job.attach_pipeline(pipeline)
+                job.folders_queued(1)
+            try:
+                crawl_and_index_folder(service, folder_id, folder_path, pipeline, reindex, job)
+            except JobCancelled:
+                print("🛑 Indexing job cancelled, stopping crawl")
+        if job is not None:
+            job.detach_pipeline(pipeline)
+        print(f"📊 Pipeline stages: {pipeline.stats()['stages']}")
+        return
     
-    # Query for images
-    query = f"'{folder_id}' in parents and mimeType contains 'image/' and trashed=false"
+    print(f"📁 Crawling: {folder_path}")
     
     try:
-        results = service.files().list(q=query, fields="files(id,name,parents,mimeType)", pageSize=1000).execute()
-        files = results.get('files', [])
-        
-        print(f"   📸 Found {len(files)} images")
-        
-        # Process each image
-        for file in files:
-            file_id = file['id']
-            file_name = file['name']
-            
-            # Download image
-            request = service.files().get_media(fileId=file_id)
-            fh = io.BytesIO()
-            downloader = MediaIoBaseDownload(fh, request)
-            
-            done = False
-            while not done:
-                status, done = downloader.next_chunk()
+        # Images and subfolders come in pages; each page is queued as soon as it arrives
+        subfolders = []
+        for files, page_folders in iter_folder_pages(service, folder_id):
+            subfolders.extend(page_folders)
+            print(f"   📸 Found {len(files)} images")
+            if job is not None:
+                job.images_listed(len(files))
+                job.folders_queued(len(page_folders))
             
-            image_data = fh.getvalue()
-            
-            # Process and index
-            result = process_and_index_image(file_id, file_name, folder_path, image_data)
-            print(f"      {result.get('status')}: {file_name}")
-        
-        # Get subfolders
-        query_folders = f"'{folder_id}' in parents and mimeType='application/vnd.google-apps.folder' and trashed=false"
-        folder_results = service.files().list(q=query_folders, fields="files(id,name)").execute()
-        subfolders = folder_results.get('files', [])
+            # Queue each image (blocks while the pipeline is backed up)
+            for file in files:
+                if job is not None:
+                    job.checkpoint()  # holds while paused, raises JobCancelled once cancelled
+                record = {"drive_id": file['id'], "file_name": file['name'], "folder_path": folder_path,
+                          "checksum": file.get('md5Checksum'), "reindex": reindex, "job": job}
+                future = pipeline.submit(record)
+                future.add_done_callback(lambda f, record=record: _report_indexed(record, f))
         
         print(f"   📂 Found {len(subfolders)} subfolders")
+        if job is not None:
+            job.folder_listed()
         
         # Recursively crawl subfolders
         for subfolder in subfolders:
             subfolder_path = f"{folder_path}/{subfolder['name']}"
-            crawl_and_index_folder(service, subfolder['id'], subfolder_path)
+            crawl_and_index_folder(service, subfolder['id'], subfolder_path, pipeline, reindex, job)
     
+    except JobCancelled:
+        raise
     except Exception as e:
         print(f"❌ Error crawling folder: {e}")
+        if job is not None:
+            job.record_error("list", e)
 
 # =====================================================
 # FASTAPI ENDPOINTS
@@ -958,16 +1150,25 @@ def health_check():
     return {
         "status": "healthy",
         "app": "PicLocate V4 Production",
-        "version": "4.0.0"
+        "version": "4.0.0",
+        "feature_cache": feature_cache.stats() if feature_cache is not None else None,
+        "model_pool": model_pool.stats() if model_pool is not None else None
     }
 
+@app.on_event("shutdown")
+def stop_model_pool():
+    """Let queued detections finish, then stop the model worker processes"""
+    yolo_batcher.close(timeout=10)
+    if model_pool is not None:
+        model_pool.close()
+
 @app.get("/auth")
 def auth_drive():
     """Start OAuth authentication"""
     return authenticate_drive()
 
 @app.get("/auth/callback")
-def auth_callback(code: str = None, error: str = None):
+def auth_callback(code: Optional[str] = None, error: Optional[str] = None):
     """Handle OAuth callback"""
     global drive_service
     
@@ -1024,30 +1225,141 @@ def auth_status():
     except Exception as e:
         return {"status": "error", "error": str(e)}
 
+def delete_drive_images(drive_ids: Iterable[str] = (), folder_paths: Iterable[str] = ()) -> None:
+    """Delete images (objects, captions and tags cascade) by Drive id or by folder subtree"""
+    drive_ids = list(drive_ids)
+    for start in range(0, len(drive_ids), 300):
+        supabase.table("images").delete().in_("drive_id", drive_ids[start:start + 300]).execute()
+    for folder_path in folder_paths:
+        supabase.table("images").delete().eq("folder_path", folder_path).execute()
+        supabase.table("images").delete().like("folder_path", f"{folder_path}/%").execute()
+
+def sync_drive_changes(service, job=None) -> Optional[Dict]:
+    """
+    Apply the Drive changes feed since the stored startPageToken: new/modified images
+    are (re)indexed, trashed/removed/moved-out ones deleted, and new or moved folders crawled.
+    Returns a summary, or None when no token is stored yet (a full crawl is needed).
+    """
+    token = load_change_token(DRIVE_CHANGES_STATE, TARGET_FOLDER_ID)
+    if token is None:
+        return None
+    
+    changes, new_token = collect_drive_changes(service, token, TARGET_FOLDER_ID, TARGET_FOLDER_NAME)
+    print(f"🔄 Drive changes since last sync: {changes.summary()}")
+    delete_drive_images(changes.deletes, changes.removed_folder_paths)
+    
+    with create_indexing_pipeline(service, job) as pipeline:
+        if job is not None:
+            job.attach_pipeline(pipeline)
+            job.images_listed(len(changes.upserts))
+            job.folders_queued(len(changes.folders_to_crawl))
+        try:
+            for file, _, folder_path in changes.upserts.values():
+                if job is not None:
+                    job.checkpoint()
+                record = {"drive_id": file['id'], "file_name": file['name'], "folder_path": folder_path,
+                          "checksum": file.get('md5Checksum'), "reindex": True, "job": job}
+                future = pipeline.submit(record)
+                future.add_done_callback(lambda f, record=record: _report_indexed(record, f))
+            for folder_id, folder_path in changes.folders_to_crawl.items():
+                crawl_and_index_folder(service, folder_id, folder_path, pipeline, reindex=True, job=job)
+        except JobCancelled:
+            print("🛑 Indexing job cancelled, Drive changes will be replayed next time")
+    if job is not None:
+        job.detach_pipeline(pipeline)
+        if job.cancelled:
+            return dict(changes.summary(), cancelled=True)  # token not advanced
+    
+    save_change_token(DRIVE_CHANGES_STATE, TARGET_FOLDER_ID, new_token)
+    return changes.summary()
+
+def run_index_job(job, service, incremental: bool = False) -> Dict:
+    """Background body of an /index job (run by index_jobs); the return value becomes the job result"""
+    changes = sync_drive_changes(service, job) if incremental else None
+    if changes is None:
+        job.kind = "full"
+        # Taken before crawling so changes made during the crawl are picked up next time
+        try:
+            start_token = get_start_page_token(service)
+        except Exception as e:
+            print(f"⚠️ Could not get a Drive changes token, incremental sync unavailable: {e}")
+            start_token = None
+        
+        print("🚀 Starting full drive indexing...")
+        crawl_and_index_folder(service, job=job)
+        if start_token and not job.cancelled:
+            save_change_token(DRIVE_CHANGES_STATE, TARGET_FOLDER_ID, start_token)
+    
+    # Get total count
+    result = supabase.table("images").select("id", count="exact").execute()
+    total_images = result.count if hasattr(result, 'count') else 0
+    
+    response = {
+        "status": "success",
+        "message": f"Indexed {total_images} images",
+        "total_images": total_images
+    }
+    if changes is not None:
+        response["changes"] = changes
+    return response
+
+def start_index_job(service, incremental: bool = False):
+    """Start an /index job in the background unless one is active; returns (job, started)"""
+    return index_jobs.start(run_index_job, service, incremental, kind="incremental" if incremental else "full")
+
 @app.post("/index")
-def index_drive():
-    """Index all images from Google Drive"""
+def index_drive(incremental: bool = False):
+    """
+    Start indexing all images from Google Drive in the background and return the job id
+    (progress: GET /index/status). incremental=true only applies Drive changes since the last run.
+    """
     global drive_service
     
     if not drive_service:
         return {"error": "Not authenticated"}
     
-    try:
-        print("🚀 Starting full drive indexing...")
-        crawl_and_index_folder(drive_service)
-        
-        # Get total count
-        result = supabase.table("images").select("id", count="exact").execute()
-        total_images = result.count if hasattr(result, 'count') else 0
-        
-        return {
-            "status": "success",
-            "message": f"Indexed {total_images} images",
-            "total_images": total_images
-        }
-    
-    except Exception as e:
-        return {"error": str(e)}
+    job, started = start_index_job(drive_service, incremental)
+    return {
+        "status": "started" if started else "already_running",
+        "job_id": job.job_id,
+        "message": "Poll /index/status for progress"
+    }
+
+@app.get("/index/status")
+def index_status(job_id: Optional[str] = None):
+    """Progress, throughput, queue depths, per-stage latency, errors and ETA of the current (or given) job"""
+    job = index_jobs.get(job_id) if job_id else index_jobs.current
+    if job is None:
+        if job_id:
+            raise HTTPException(status_code=404, detail=f"Unknown job {job_id}")
+        return {"status": "idle"}
+    return job.status_dict()
+
+def control_index_job(action: str) -> Dict:
+    """Apply pause / resume / cancel to the active job"""
+    job = index_jobs.active()
+    if job is None:
+        return {"status": "idle", "message": "No indexing job is running"}
+    changed = getattr(job, action)()
+    return {"job_id": job.job_id, "status": job.status, "changed": changed}
+
+@app.post("/index/pause")
+def pause_index_job():
+    """Hold the running job: in-flight images finish their current stage, nothing new starts"""
+    return control_index_job("pause")
+
+@app.post("/index/resume")
+def resume_index_job():
+    return control_index_job("resume")
+
+@app.post("/index/cancel")
+def cancel_index_job():
+    return control_index_job("cancel")
+
+@app.get("/index/jobs")
+def list_index_jobs():
+    """Recent indexing jobs, newest first"""
+    return {"jobs": index_jobs.list()}
 
 # Search endpoints
 class SearchRequest(BaseModel):
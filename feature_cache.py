@@ -0,0 +1,145 @@
+"""
+Content-addressed cache of per-image features, keyed on Drive's md5Checksum
+- Copies, moves and renames keep the same bytes, so their features (embedding,
+  detections, colours, OCR text, ...) are reused without downloading the file
+- Entries are stamped with a feature version (models + settings); an entry
+  written under another version counts as a miss and is overwritten
+- Stored in a local SQLite file: numpy arrays as raw float32/uint8 blobs,
+  everything else as JSON
+- Optional size bound: least recently used entries are evicted
+"""
+
+import io
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+
+import numpy as np
+
+
+class FeatureCache:
+    """Thread-safe checksum -> features dict store"""
+
+    def __init__(self, path: str, version: str = "", max_entries: Optional[int] = None):
+        self.path = path
+        self.version = version
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._puts_since_trim = 0
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS features (
+                checksum TEXT PRIMARY KEY,
+                version TEXT NOT NULL,
+                data TEXT NOT NULL,
+                arrays BLOB,
+                used_at REAL NOT NULL
+            )""")
+        self._db.execute("CREATE INDEX IF NOT EXISTS features_used_at ON features (used_at)")
+        self._db.commit()
+
+    @staticmethod
+    def _encode(features: Dict) -> tuple:
+        arrays = {key: np.asarray(value) for key, value in features.items() if isinstance(value, np.ndarray)}
+        data = {key: value for key, value in features.items() if key not in arrays}
+        blob = None
+        if arrays:
+            buffer = io.BytesIO()
+            np.savez(buffer, **arrays)
+            blob = buffer.getvalue()
+        return json.dumps(data, ensure_ascii=False), blob
+
+    @staticmethod
+    def _decode(data: str, blob: Optional[bytes]) -> Dict:
+        features = json.loads(data)
+        if blob:
+            with np.load(io.BytesIO(blob), allow_pickle=False) as arrays:
+                features.update({key: arrays[key] for key in arrays.files})
+        return features
+
+    def get(self, checksum: Optional[str]) -> Optional[Dict]:
+        """Cached features for this content, or None"""
+        if not checksum:
+            return None
+        with self._lock:
+            row = self._db.execute("SELECT version, data, arrays FROM features WHERE checksum = ?",
+                                   (checksum,)).fetchone()
+            if row is None or row[0] != self.version:
+                self.misses += 1
+                return None
+            self.hits += 1
+            if self.max_entries:
+                self._db.execute("UPDATE features SET used_at = ? WHERE checksum = ?", (time.time(), checksum))
+                self._db.commit()
+        try:
+            return self._decode(row[1], row[2])
+        except Exception as e:
+            print(f"⚠️ Unreadable feature cache entry {checksum}: {e}")
+            return None
+
+    def put(self, checksum: Optional[str], features: Dict) -> bool:
+        """Store features (numpy arrays + JSON-serializable values) for this content"""
+        if not checksum:
+            return False
+        try:
+            data, blob = self._encode(features)
+        except (TypeError, ValueError) as e:
+            print(f"⚠️ Could not cache features for {checksum}: {e}")
+            return False
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO features (checksum, version, data, arrays, used_at) "
+                             "VALUES (?, ?, ?, ?, ?)", (checksum, self.version, data, blob, time.time()))
+            self._puts_since_trim += 1
+            if self.max_entries and self._puts_since_trim >= max(1, self.max_entries // 100):
+                self._trim()
+            self._db.commit()
+        return True
+
+    def _trim(self):
+        self._puts_since_trim = 0
+        excess = self._db.execute("SELECT COUNT(*) FROM features").fetchone()[0] - self.max_entries
+        if excess > 0:
+            self._db.execute("DELETE FROM features WHERE checksum IN "
+                             "(SELECT checksum FROM features ORDER BY used_at LIMIT ?)", (excess,))
+
+    def discard(self, checksum: str) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM features WHERE checksum = ?", (checksum,))
+            self._db.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM features")
+            self._db.commit()
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM features WHERE version = ?", (self.version,)).fetchone()[0]
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "version": self.version,
+            "path": self.path,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
@@ -65,8 +65,16 @@ export default function Home() {
   const handleIndex = async () => {
     setIsIndexing(true)
     try {
+      // /index starts a background job; poll its status until it is done
       const response = await axios.post(`${API_BASE}/index`)
       setIndexStats(response.data)
+      let status = 'running'
+      while (['running', 'paused', 'cancelling'].includes(status)) {
+        await new Promise(resolve => setTimeout(resolve, 3000))
+        const job = await axios.get(`${API_BASE}/index/status`)
+        setIndexStats(job.data)
+        status = job.data.status
+      }
       setIsIndexing(false)
     } catch (error) {
       console.error('Indexing failed:', error)
@@ -202,6 +210,7 @@ export default function Home() {
               {indexStats && (
                 <span className="text-sm text-gray-600">
                   {indexStats.total_images} images indexed
+                  {indexStats.eta_seconds != null && ` · ${indexStats.throughput.recent_images_per_sec} img/s · ~${Math.ceil(indexStats.eta_seconds / 60)} min left`}
                 </span>
               )}
             </div>
@@ -0,0 +1,40 @@
+"""
+Precompiled Hebrew -> English phrase translator
+- One regex alternation built once per dictionary, longest phrases first
+- Single left-to-right pass: at each position the longest matching phrase wins,
+  matches never overlap, and the result does not depend on dictionary order
+- Optional whole-word mode for dictionaries keyed by standalone words
+"""
+
+import re
+from typing import Dict, List, Tuple
+
+
+class PhraseTranslator:
+    """Leftmost-longest, non-overlapping replacement of dictionary phrases"""
+
+    def __init__(self, mapping: Dict[str, str], whole_words: bool = False):
+        self.mapping = {source: target for source, target in mapping.items() if source}
+        self.whole_words = whole_words
+        # Python's alternation takes the first alternative that matches, so
+        # sorting by length (longest first) yields longest-match semantics
+        phrases = sorted(self.mapping, key=lambda phrase: (-len(phrase), phrase))
+        pattern = "|".join(re.escape(phrase) for phrase in phrases)
+        if whole_words:
+            pattern = rf"(?<!\w)(?:{pattern})(?!\w)"
+        self._pattern = re.compile(pattern) if phrases else None
+
+    def translate(self, text: str) -> str:
+        """Replace every dictionary phrase in text in one pass"""
+        if not text or self._pattern is None:
+            return text
+        return self._pattern.sub(lambda match: self.mapping[match.group(0)], text)
+
+    def find(self, text: str) -> List[Tuple[str, str]]:
+        """(source phrase, translation) for every match, in order of appearance"""
+        if not text or self._pattern is None:
+            return []
+        return [(match.group(0), self.mapping[match.group(0)]) for match in self._pattern.finditer(text)]
+
+    def __contains__(self, text: str) -> bool:
+        return bool(text) and self._pattern is not None and self._pattern.search(text) is not None
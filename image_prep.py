@@ -0,0 +1,109 @@
+"""
+Decode-once, downscale-early image preparation shared by all analyzers
+- JPEGs are decoded in draft mode straight to (roughly) the working resolution,
+  so a 48 MP photo never materializes at full size
+- Declared pixel count is checked before decoding (decompression-bomb cap)
+- Derived buffers (RGB array, grayscale, LAB, small BGR for k-means) are built
+  lazily, at most once per image, and shared by CLIP, YOLO, colours, OCR and pHash
+- OCR reads small text, so it gets its own higher-resolution grayscale
+  (`detail_gray`, up to OCR_MAX_SIDE) decoded from the kept source bytes
+"""
+
+import io
+import os
+from typing import Dict, Optional, Tuple
+
+import cv2
+import numpy as np
+from PIL import Image
+
+# Long side of the working image; CLIP (224) and YOLO (imgsz 640) downscale further anyway
+IMAGE_MAX_SIDE = int(os.getenv("IMAGE_MAX_SIDE", "1600"))
+# Reject images declaring more pixels than this (largest real photos are ~50 MP)
+IMAGE_MAX_PIXELS = int(os.getenv("IMAGE_MAX_PIXELS", "120000000"))
+# Long side of the grayscale OCR reads (0 = full resolution); only decoded for images that pass the text gate
+OCR_MAX_SIDE = int(os.getenv("OCR_MAX_SIDE", "4096"))
+
+
+class ImageTooLargeError(ValueError):
+    """Declared image size exceeds the pixel cap"""
+
+
+class PreparedImage:
+    """A decoded, downscaled RGB image plus lazily computed analyzer buffers"""
+
+    def __init__(self, image: Image.Image, original_size: Tuple[int, int], source: Optional[bytes] = None):
+        self.image = image
+        self.original_size = original_size
+        self.source = source  # encoded bytes, kept for detail_gray
+        self.size = image.size
+        self.scale = image.size[0] / original_size[0] if original_size[0] else 1.0
+        self._buffers: Dict[str, np.ndarray] = {}
+
+    def _buffer(self, name: str, build) -> np.ndarray:
+        if name not in self._buffers:
+            self._buffers[name] = build()
+        return self._buffers[name]
+
+    @property
+    def rgb(self) -> np.ndarray:
+        """H x W x 3 uint8 RGB"""
+        return self._buffer("rgb", lambda: np.asarray(self.image))
+
+    @property
+    def gray(self) -> np.ndarray:
+        """H x W uint8 grayscale"""
+        return self._buffer("gray", lambda: cv2.cvtColor(self.rgb, cv2.COLOR_RGB2GRAY))
+
+    @property
+    def lab(self) -> np.ndarray:
+        """H x W x 3 float32 CIELAB (L 0..100, same scale as skimage.color.rgb2lab)"""
+        return self._buffer("lab", lambda: cv2.cvtColor(self.rgb.astype(np.float32) / 255.0, cv2.COLOR_RGB2Lab))
+
+    def detail_gray(self, max_side: Optional[int] = None) -> np.ndarray:
+        """
+        Grayscale at up to max_side (0 = original size) for OCR. Re-decodes the
+        source bytes when the working image is smaller; otherwise it is `gray`.
+        """
+        max_side = OCR_MAX_SIDE if max_side is None else max_side
+        target = min(max(self.original_size), max_side) if max_side else max(self.original_size)
+        source = self.source
+        if source is None or target <= max(self.size):
+            return self.gray
+        return self._buffer(f"gray{target}", lambda: cv2.cvtColor(
+            np.asarray(prepare_image(source, max_side=target).image), cv2.COLOR_RGB2GRAY))
+
+    def small_bgr(self, size: Tuple[int, int] = (100, 100)) -> np.ndarray:
+        """Tiny BGR copy for colour clustering"""
+        return self._buffer(f"bgr{size}", lambda: cv2.resize(cv2.cvtColor(self.rgb, cv2.COLOR_RGB2BGR), size,
+                                                               interpolation=cv2.INTER_AREA))
+
+    def to_original_bbox(self, bbox: Dict[str, int]) -> Dict[str, int]:
+        """Map an {"x","y","w","h"} box on the working image back to original pixels"""
+        if self.scale == 1.0:
+            return dict(bbox)
+        return {key: int(round(value / self.scale)) for key, value in bbox.items()}
+
+    def release(self):
+        """Drop derived buffers (the PIL image stays)"""
+        self._buffers.clear()
+
+
+def prepare_image(data: bytes, max_side: Optional[int] = None, max_pixels: Optional[int] = None,
+                  keep_source: bool = False) -> PreparedImage:
+    """Decode image bytes once, at no more than max_side on the long edge (keep_source: for detail_gray)"""
+    max_side = max_side or IMAGE_MAX_SIDE
+    max_pixels = max_pixels or IMAGE_MAX_PIXELS
+    image = Image.open(io.BytesIO(data))
+    original_size = image.size
+    if original_size[0] * original_size[1] > max_pixels:
+        raise ImageTooLargeError(f"{original_size[0]}x{original_size[1]} exceeds the {max_pixels} pixel cap")
+
+    # JPEG: let the decoder scale by 1/2..1/8 while decoding (never below the target)
+    ratio = max_side / max(original_size)
+    if image.format == "JPEG" and ratio < 1:
+        image.draft("RGB", (max(1, int(original_size[0] * ratio)), max(1, int(original_size[1] * ratio))))
+    image = image.convert("RGB")
+    if max(image.size) > max_side:
+        image.thumbnail((max_side, max_side), Image.Resampling.BILINEAR, reducing_gap=2.0)
+    return PreparedImage(image, original_size, data if keep_source else None)
@@ -0,0 +1,237 @@
+"""
+Checkpoint journal for long Drive crawls
+- Append-only JSON lines on local disk: a job header, every listed page
+  (images + subfolders), folders whose listing completed, and files processed
+- Written as the crawl goes, so a timeout, crash or deploy loses at most the
+  images that were in flight
+- `load_journal` replays the file into a JournalState: the folders still to
+  list and the listed images still to process; a torn last line is ignored
+- Failed files are journaled too: after `max_attempts` failures a file is no
+  longer retried by resumed crawls
+"""
+
+import json
+import os
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from drive_crawler import subfolder_path
+
+
+class JournalState:
+    """What an interrupted crawl still has to do"""
+
+    def __init__(self, header: dict, max_attempts: int = 3):
+        self.job_id = header.get("job_id")
+        self.root_id: str = header["root_id"]
+        self.root_path: str = header["root_path"]
+        self.change_token = header.get("change_token")
+        self.started_at = header.get("started_at")
+        self.finished = False
+        self.status = None
+        self.folders: Dict[str, str] = {self.root_id: self.root_path}  # id -> path, every folder seen
+        self.listed: set = set()
+        self.images: Dict[str, Tuple[dict, str, str]] = {}  # file id -> (file, folder_id, folder_path)
+        self.done: set = set()
+        self.failures: Dict[str, int] = {}  # file id -> failed attempts
+        self.max_attempts = max_attempts
+
+    @property
+    def pending_folders(self) -> List[Tuple[str, str]]:
+        """Folders whose listing never completed (listed again from the start)"""
+        return [(folder_id, path) for folder_id, path in self.folders.items() if folder_id not in self.listed]
+
+    @property
+    def pending_images(self) -> List[Tuple[dict, str, str]]:
+        """Images of fully listed folders that were never processed (and have attempts left)"""
+        return [entry for file_id, entry in self.images.items()
+                if file_id not in self.done and entry[1] in self.listed
+                and self.failures.get(file_id, 0) < self.max_attempts]
+
+    @property
+    def given_up(self) -> List[str]:
+        """Files that failed max_attempts times and are not retried any more"""
+        return [file_id for file_id, count in self.failures.items()
+                if count >= self.max_attempts and file_id not in self.done]
+
+    def summary(self) -> dict:
+        return {
+            "job_id": self.job_id,
+            "finished": self.finished,
+            "folders_seen": len(self.folders),
+            "folders_listed": len(self.listed),
+            "images_seen": len(self.images),
+            "files_done": len(self.done),
+            "pending_folders": len(self.pending_folders),
+            "pending_images": len(self.pending_images),
+            "files_given_up": len(self.given_up),
+        }
+
+
+def load_journal(path: str, max_attempts: int = 3) -> Optional[JournalState]:
+    """Replay a journal file; None if there is none or it has no header"""
+    if not path or not os.path.exists(path):
+        return None
+    state = None
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue  # torn write from a crash
+            event = entry.get("event")
+            if event == "start":
+                state = JournalState(entry, max_attempts)
+            elif state is None:
+                continue
+            elif event == "page":
+                folder_id, folder_path = entry["folder_id"], entry["folder_path"]
+                state.folders.setdefault(folder_id, folder_path)
+                for child_id, child_name in entry.get("subfolders", []):
+                    state.folders.setdefault(child_id, subfolder_path(folder_path, child_name))
+                for file in entry.get("images", []):
+                    state.images[file["id"]] = (file, folder_id, folder_path)
+            elif event == "listed":
+                state.listed.add(entry["folder_id"])
+            elif event == "done":
+                state.done.update(entry["file_ids"])
+            elif event == "failed":
+                for file_id in entry["file_ids"]:
+                    state.failures[file_id] = state.failures.get(file_id, 0) + 1
+            elif event == "finished":
+                state.finished = True
+                state.status = entry.get("status")
+    return state
+
+
+class IndexJournal:
+    """
+    Thread-safe journal writer handed to DriveCrawler. Processed file ids are
+    buffered and written in groups; pages and folder completions are written
+    immediately (they are what makes resuming cheap).
+    `row_state(file_id)` (e.g. BufferedUpserter.key_state) says whether a file's
+    stored row is "pending", "failed" or "stored". Files whose row is pending are
+    held until the writer reports them through `rows_stored` / `rows_failed`, so
+    nothing waits on storage and a result that never got stored is retried by
+    the resumed crawl.
+    """
+
+    def __init__(self, path: str, flush_every: int = 50, sync_interval: float = 5.0,
+                 row_state: Optional[Callable[[str], str]] = None):
+        self.path = path
+        self.flush_every = max(1, flush_every)
+        self.sync_interval = sync_interval
+        self.row_state = row_state
+        self._lock = threading.Lock()
+        self._pending_done: List[str] = []
+        self._awaiting_rows: set = set()
+        self._last_sync = time.monotonic()
+        self._file = None
+
+    def _write(self, entry: dict):
+        if self._file is None:
+            return  # closed at shutdown while crawler threads were still running
+        self._file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self._file.flush()
+        if time.monotonic() - self._last_sync >= self.sync_interval:
+            os.fsync(self._file.fileno())
+            self._last_sync = time.monotonic()
+
+    def start(self, job_id: str, root_id: str, root_path: str, change_token: Optional[str] = None):
+        """Begin a new journal (replacing any previous one)"""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._lock:
+            self._file = open(self.path, "w", encoding="utf-8")
+            self._awaiting_rows = set()
+            self._write({"event": "start", "job_id": job_id, "root_id": root_id, "root_path": root_path,
+                         "change_token": change_token,
+                         "started_at": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime())})
+
+    def resume(self):
+        """Keep appending to an existing journal"""
+        with self._lock:
+            self._file = open(self.path, "a", encoding="utf-8")
+            self._awaiting_rows = set()
+
+    def folder_page(self, folder_id: str, folder_path: str, images: List[dict], subfolders: List[dict]):
+        with self._lock:
+            self._write({"event": "page", "folder_id": folder_id, "folder_path": folder_path, "images": images,
+                         "subfolders": [[folder["id"], folder["name"]] for folder in subfolders]})
+
+    def folder_listed(self, folder_id: str):
+        with self._lock:
+            self._write({"event": "listed", "folder_id": folder_id})
+
+    def file_done(self, file_id: str):
+        # Checked under the lock: rows_stored / rows_failed for this id wait until it is registered
+        with self._lock:
+            state = self.row_state(file_id) if self.row_state else "stored"
+            if state == "pending":
+                self._awaiting_rows.add(file_id)
+            elif state == "failed":
+                self._write({"event": "failed", "file_ids": [file_id]})
+            else:
+                self._add_done([file_id])
+
+    def file_failed(self, file_id: str):
+        """Count a failed attempt (a file failing max_attempts times is not retried on resume)"""
+        with self._lock:
+            self._write({"event": "failed", "file_ids": [file_id]})
+
+    def rows_stored(self, file_ids: Iterable[str]):
+        """The rows of these files reached storage (writer on_flushed callback)"""
+        with self._lock:
+            stored = [file_id for file_id in file_ids if file_id in self._awaiting_rows]
+            self._awaiting_rows.difference_update(stored)
+            self._add_done(stored)
+
+    def rows_failed(self, file_ids: Iterable[str]):
+        """The rows of these files could not be stored (writer on_failed callback)"""
+        with self._lock:
+            failed = [file_id for file_id in file_ids if file_id in self._awaiting_rows]
+            self._awaiting_rows.difference_update(failed)
+            if failed:
+                self._write({"event": "failed", "file_ids": failed})
+
+    def _add_done(self, file_ids: List[str]):
+        self._pending_done.extend(file_ids)
+        if len(self._pending_done) >= self.flush_every:
+            self._flush_done()
+
+    def _flush_done(self):
+        if self._pending_done:
+            self._write({"event": "done", "file_ids": self._pending_done})
+            self._pending_done = []
+
+    def flush(self):
+        with self._lock:
+            if self._file is not None:
+                self._flush_done()
+                os.fsync(self._file.fileno())
+
+    def finish(self, status: str = "completed"):
+        """Mark the job as over; a finished journal is never resumed"""
+        with self._lock:
+            if self._file is None:
+                return
+            self._flush_done()
+            self._write({"event": "finished", "status": status})
+            os.fsync(self._file.fileno())
+            self._file.close()
+            self._file = None
+
+    def close(self):
+        """
+        Flush and close without finishing (the job can be resumed). Files whose
+        rows are still pending stay unjournaled and are processed again on resume.
+        """
+        with self._lock:
+            if self._file is None:
+                return
+            self._flush_done()
+            os.fsync(self._file.fileno())
+            self._file.close()
+            self._file = None
@@ -0,0 +1,114 @@
+"""
+On-disk snapshot of the v3 ImageIndex for fast cold starts
+- Embeddings saved as a float32 .npy matrix and opened memory-mapped (copy-on-write)
+- Compact JSON sidecar with the metadata columns and a version stamp
+- The sidecar's `synced_at` is the Supabase high-water mark, so a restarted
+  worker only needs to sync rows changed since the snapshot was written
+"""
+
+import glob
+import json
+import os
+import time
+import uuid
+from typing import Optional
+
+import numpy as np
+
+from vector_index import ImageIndex
+
+SNAPSHOT_FORMAT_VERSION = 1
+METADATA_FILE = "index_meta.json"
+SNAPSHOT_FIELDS = ("name", "objects", "colors", "folder", "ocr_text", "room_type")
+
+
+def _stamp(meta: dict) -> dict:
+    """The version stamp part of a sidecar (everything but the columns)"""
+    return {k: v for k, v in meta.items() if k not in ("ids", "columns")}
+
+
+def save_index_snapshot(index: ImageIndex, directory: str, model_name: str = "",
+                        synced_at: Optional[str] = None) -> Optional[dict]:
+    """
+    Write the index (minus uploaded images, which only live in memory) to
+    `directory`. Each snapshot gets its own matrix file and the sidecar is
+    replaced last, so a crash never leaves a sidecar pointing at a partial matrix.
+    """
+    try:
+        file_ids, entries, matrix = index.export(include=lambda data: not data.get("is_uploaded"))
+        os.makedirs(directory, exist_ok=True)
+
+        snapshot_id = f"{int(time.time())}-{uuid.uuid4().hex[:8]}"
+        matrix_file = f"embeddings-{snapshot_id}.npy"
+        tmp_matrix = os.path.join(directory, matrix_file + ".tmp")
+        with open(tmp_matrix, "wb") as f:
+            np.save(f, matrix)
+        os.replace(tmp_matrix, os.path.join(directory, matrix_file))
+
+        meta = {
+            "format_version": SNAPSHOT_FORMAT_VERSION,
+            "snapshot_id": snapshot_id,
+            "model": model_name,
+            "dim": index.dim,
+            "count": len(file_ids),
+            "saved_at": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime()),
+            "synced_at": synced_at,
+            "matrix_file": matrix_file,
+            "ids": file_ids,
+            "columns": {field: [data.get(field) for data in entries] for field in SNAPSHOT_FIELDS},
+        }
+        tmp_meta = os.path.join(directory, METADATA_FILE + ".tmp")
+        with open(tmp_meta, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_meta, os.path.join(directory, METADATA_FILE))
+    except Exception as e:
+        print(f"❌ Failed to save index snapshot: {e}")
+        return None
+
+    # Older matrices may still be mapped by running workers; removing them is best effort
+    for stale in glob.glob(os.path.join(directory, "embeddings-*.npy")):
+        if os.path.basename(stale) != matrix_file:
+            try:
+                os.remove(stale)
+            except OSError:
+                pass
+    return _stamp(meta)
+
+
+def load_index_snapshot(index: ImageIndex, directory: str, model_name: str = "") -> Optional[dict]:
+    """
+    Replace the contents of `index` with the snapshot in `directory`.
+    Returns the snapshot's version stamp, or None if there is no usable snapshot
+    (other format or CLIP model). The snapshot mirrors the Supabase rows, so it
+    is valid whichever CLIP backend encodes queries.
+    """
+    meta_path = os.path.join(directory, METADATA_FILE)
+    if not os.path.exists(meta_path):
+        return None
+    try:
+        with open(meta_path, encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("format_version") != SNAPSHOT_FORMAT_VERSION or meta.get("dim") != index.dim:
+            print(f"⚠️ Ignoring index snapshot with incompatible format in {directory}")
+            return None
+        if model_name and meta.get("model") != model_name:
+            print(f"⚠️ Ignoring index snapshot built with model {meta.get('model')}")
+            return None
+
+        count = meta["count"]
+        if count:
+            matrix = np.load(os.path.join(directory, meta["matrix_file"]), mmap_mode="c")
+        else:
+            matrix = np.zeros((0, index.dim), dtype=np.float32)
+        if matrix.shape != (count, index.dim):
+            print(f"⚠️ Ignoring index snapshot: matrix shape {matrix.shape} does not match {count} entries")
+            return None
+
+        columns = meta["columns"]
+        fields = list(columns.keys())
+        entries = [dict(zip(fields, values)) for values in zip(*(columns[field] for field in fields))]
+        index.load_bulk(meta["ids"], entries, matrix)
+    except Exception as e:
+        print(f"❌ Failed to load index snapshot: {e}")
+        return None
+    return _stamp(meta)
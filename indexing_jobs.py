@@ -0,0 +1,347 @@
+"""
+Indexing job subsystem shared by the v3 and v4 apps
+- One IndexingJob per run, executed on a background thread by JobManager:
+  start, pause / resume, cancel and a status snapshot
+- Progress counters: folders queued / listed, images listed and their outcome
+  (indexed, skipped, failed, cancelled)
+- Per-stage latency (count, avg, p95 and max over a sliding window) recorded
+  with `job.timed(stage)` or by wrapping a pipeline stage with `job.stage(...)`
+- Throughput overall and over the last `window` seconds, pipeline queue depths,
+  error counts by exception class and by stage
+- ETA from the remaining listing: images listed but not finished, plus the
+  folders still to list times the average number of images per listed folder
+"""
+
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from typing import Callable, Dict, List, Optional
+
+OUTCOMES = ("indexed", "skipped", "failed", "cancelled")
+
+
+class JobCancelled(Exception):
+    """Raised by `IndexingJob.checkpoint` once the job has been cancelled"""
+
+
+def _now_iso() -> str:
+    return time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime())
+
+
+def job_timer(job: Optional["IndexingJob"], stage: str):
+    """`job.timed(stage)`, or a no-op outside a job (e.g. single-image indexing)"""
+    return job.timed(stage) if job is not None else nullcontext()
+
+
+class StageStats:
+    """Latency of one stage: totals plus a sliding window for percentiles"""
+
+    def __init__(self, window: int = 512):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.recent = deque(maxlen=window)
+
+    def add(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.recent.append(seconds)
+
+    def summary(self) -> dict:
+        recent = sorted(self.recent)
+        return {
+            "count": self.count,
+            "avg_ms": round(self.total / self.count * 1000, 1) if self.count else 0.0,
+            "p50_ms": round(recent[len(recent) // 2] * 1000, 1) if recent else 0.0,
+            "p95_ms": round(recent[min(len(recent) - 1, int(len(recent) * 0.95))] * 1000, 1) if recent else 0.0,
+            "max_ms": round(self.max * 1000, 1),
+        }
+
+
+class IndexingJob:
+    """State, controls and metrics of one indexing run"""
+
+    def __init__(self, kind: str = "full", job_id: Optional[str] = None, window: float = 60.0):
+        self.job_id = job_id or uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.window = window
+        self.status = "pending"
+        self.started_at = None
+        self.finished_at = None
+        self.result = None
+        self.error = None
+        self._lock = threading.Lock()
+        self._running = threading.Event()  # cleared while paused
+        self._running.set()
+        self._cancel = threading.Event()
+        self._start_time = None
+        self._end_time = None
+        self._paused_since: Optional[float] = None
+        self._paused_seconds = 0.0
+        self._folders = {"queued": 0, "listed": 0}
+        self._images: Dict[str, int] = dict.fromkeys(("listed",) + OUTCOMES, 0)
+        self._finished_times = deque()  # completion timestamps inside the throughput window
+        self._stages: Dict[str, StageStats] = {}
+        self._errors_by_class: Dict[str, int] = {}
+        self._errors_by_stage: Dict[str, int] = {}
+        self._recent_errors = deque(maxlen=20)
+        self._pipelines: List = []
+
+    # ---------------------------
+    # controls
+    # ---------------------------
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    @property
+    def paused(self) -> bool:
+        return not self._running.is_set()
+
+    def pause(self) -> bool:
+        with self._lock:
+            if self.status != "running":
+                return False
+            self.status = "paused"
+            self._paused_since = time.monotonic()
+            self._running.clear()
+        print(f"⏸️ Indexing job {self.job_id} paused")
+        return True
+
+    def resume(self) -> bool:
+        with self._lock:
+            if self.status != "paused":
+                return False
+            self.status = "running"
+            if self._paused_since is not None:
+                self._paused_seconds += time.monotonic() - self._paused_since
+                self._paused_since = None
+            self._running.set()
+        print(f"▶️ Indexing job {self.job_id} resumed")
+        return True
+
+    def cancel(self) -> bool:
+        with self._lock:
+            if self.status not in ("pending", "running", "paused"):
+                return False
+            if self._paused_since is not None:
+                self._paused_seconds += time.monotonic() - self._paused_since
+                self._paused_since = None
+            self.status = "cancelling"
+            self._cancel.set()
+            self._running.set()  # wake paused workers so they can leave
+        print(f"🛑 Indexing job {self.job_id} cancelling")
+        return True
+
+    def wait_if_paused(self) -> bool:
+        """Block while the job is paused; False once it is cancelled"""
+        self._running.wait()
+        return not self._cancel.is_set()
+
+    def checkpoint(self):
+        """Call between units of work: waits while paused, raises JobCancelled when cancelled"""
+        if not self.wait_if_paused():
+            raise JobCancelled(self.job_id)
+
+    # ---------------------------
+    # progress
+    # ---------------------------
+    def folders_queued(self, n: int = 1):
+        with self._lock:
+            self._folders["queued"] += n
+
+    def folder_listed(self):
+        with self._lock:
+            self._folders["listed"] += 1
+
+    def images_listed(self, n: int):
+        with self._lock:
+            self._images["listed"] += n
+
+    def image_done(self, outcome: str):
+        """outcome: indexed / skipped / failed (failures after a cancel count as cancelled)"""
+        if outcome == "failed" and self._cancel.is_set():
+            outcome = "cancelled"
+        now = time.monotonic()
+        with self._lock:
+            self._images[outcome] += 1
+            self._finished_times.append(now)
+            while self._finished_times and now - self._finished_times[0] > self.window:
+                self._finished_times.popleft()
+
+    @contextmanager
+    def timed(self, stage: str):
+        """Record the latency of the enclosed block under `stage`"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self._stages.setdefault(stage, StageStats()).add(elapsed)
+
+    def record_error(self, stage: str, error: BaseException):
+        name = type(error).__name__
+        with self._lock:
+            self._errors_by_class[name] = self._errors_by_class.get(name, 0) + 1
+            self._errors_by_stage[stage] = self._errors_by_stage.get(stage, 0) + 1
+            self._recent_errors.append({"stage": stage, "class": name, "message": str(error)[:200], "at": _now_iso()})
+
+    def stage(self, name: str, fn: Callable, timed: bool = True) -> Callable:
+        """
+        Wrap a pipeline stage function: waits while paused, drops the record once
+        cancelled, and records latency (unless the stage times its own steps) and errors.
+        """
+        def run(record):
+            if not self.wait_if_paused():
+                return None
+            try:
+                with self.timed(name) if timed else nullcontext():
+                    return fn(record)
+            except Exception as e:
+                self.record_error(name, e)
+                raise
+        return run
+
+    def attach_pipeline(self, pipeline):
+        """Report this pipeline's queue depths in status()"""
+        with self._lock:
+            self._pipelines.append(pipeline)
+
+    def detach_pipeline(self, pipeline):
+        with self._lock:
+            if pipeline in self._pipelines:
+                self._pipelines.remove(pipeline)
+
+    # ---------------------------
+    # running
+    # ---------------------------
+    def run(self, target: Callable, *args, **kwargs):
+        """Run target(job, *args, **kwargs) and record how it ended"""
+        with self._lock:
+            if self.status == "pending":
+                self.status = "running"
+            self.started_at = _now_iso()
+            self._start_time = time.monotonic()
+        try:
+            result = target(self, *args, **kwargs)
+            outcome = "cancelled" if self._cancel.is_set() else "completed"
+        except JobCancelled:
+            result, outcome = None, "cancelled"
+        except Exception as e:
+            print(f"❌ Indexing job {self.job_id} failed: {e}")
+            self.record_error("job", e)
+            result, outcome = None, "failed"
+            self.error = str(e)
+        with self._lock:
+            self.result = result
+            self.status = outcome
+            self.finished_at = _now_iso()
+            self._end_time = time.monotonic()
+        print(f"🏁 Indexing job {self.job_id} {outcome}: {dict(self._images)}")
+        return result
+
+    def _active_seconds(self) -> float:
+        if self._start_time is None:
+            return 0.0
+        end = self._end_time or time.monotonic()
+        paused = self._paused_seconds
+        if self._paused_since is not None:
+            paused += end - self._paused_since
+        return max(0.0, end - self._start_time - paused)
+
+    def status_dict(self) -> dict:
+        """JSON-ready snapshot: progress, throughput, queues, stage latency, errors and ETA"""
+        with self._lock:
+            folders = dict(self._folders)
+            images = dict(self._images)
+            stages = {name: stats.summary() for name, stats in self._stages.items()}
+            errors = {"total": sum(self._errors_by_class.values()), "by_class": dict(self._errors_by_class),
+                      "by_stage": dict(self._errors_by_stage), "recent": list(self._recent_errors)}
+            now = time.monotonic()
+            recent_finished = sum(1 for finished in self._finished_times if now - finished <= self.window)
+            pipelines = list(self._pipelines)
+            status = self.status
+
+        queues: Dict[str, int] = {}
+        for pipeline in pipelines:
+            for name, stage in pipeline.stats()["stages"].items():
+                queues[name] = queues.get(name, 0) + stage["queued"]
+
+        active = self._active_seconds()
+        done = sum(images[outcome] for outcome in OUTCOMES)
+        rate = done / active if active > 0 else 0.0
+        recent_rate = recent_finished / min(self.window, active) if active > 0 else 0.0
+
+        folders["pending"] = max(0, folders["queued"] - folders["listed"])
+        per_folder = images["listed"] / folders["listed"] if folders["listed"] else 0.0
+        remaining = max(0, images["listed"] - done) + folders["pending"] * per_folder
+        eta_rate = recent_rate or rate
+        running = status in ("running", "paused")
+        eta = round(remaining / eta_rate) if running and eta_rate > 0 else None
+
+        return {
+            "job_id": self.job_id,
+            "kind": self.kind,
+            "status": status,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "active_seconds": round(active, 1),
+            "folders": folders,
+            "images": dict(images, done=done, remaining_estimate=round(remaining)),
+            "throughput": {"images_per_sec": round(rate, 2), "recent_images_per_sec": round(recent_rate, 2),
+                           "indexed_per_sec": round(images["indexed"] / active, 2) if active > 0 else 0.0},
+            "eta_seconds": eta,
+            "queues": queues,
+            "stages": stages,
+            "errors": errors,
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+class JobManager:
+    """Runs at most one indexing job at a time on a background thread and keeps recent ones"""
+
+    def __init__(self, history: int = 10):
+        self._lock = threading.Lock()
+        self._jobs: "deque[IndexingJob]" = deque(maxlen=history)
+
+    @property
+    def current(self) -> Optional[IndexingJob]:
+        """The most recent job (running or not)"""
+        with self._lock:
+            return self._jobs[-1] if self._jobs else None
+
+    def active(self) -> Optional[IndexingJob]:
+        job = self.current
+        return job if job is not None and job.status in ("pending", "running", "paused", "cancelling") else None
+
+    def get(self, job_id: str) -> Optional[IndexingJob]:
+        with self._lock:
+            return next((job for job in self._jobs if job.job_id == job_id), None)
+
+    def start(self, target: Callable, *args, kind: str = "full", job_id: Optional[str] = None, **kwargs):
+        """
+        Start target(job, *args, **kwargs) in the background unless a job is active.
+        Returns (job, started); when not started, job is the active one.
+        """
+        with self._lock:
+            active = self._jobs[-1] if self._jobs else None
+            if active is not None and active.status in ("pending", "running", "paused", "cancelling"):
+                return active, False
+            job = IndexingJob(kind=kind, job_id=job_id)
+            job.status = "running"
+            self._jobs.append(job)
+        threading.Thread(target=job.run, args=(target,) + args, kwargs=kwargs,
+                         name=f"index-job-{job.job_id}", daemon=True).start()
+        return job, True
+
+    def list(self) -> List[dict]:
+        with self._lock:
+            jobs = list(self._jobs)
+        return [{"job_id": job.job_id, "kind": job.kind, "status": job.status,
+                 "started_at": job.started_at, "finished_at": job.finished_at} for job in reversed(jobs)]
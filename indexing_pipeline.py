@@ -0,0 +1,128 @@
+"""
+Staged, backpressured indexing pipeline
+- Each stage (e.g. download -> decode -> infer -> persist) has its own worker
+  threads, so network-bound and CPU-bound work overlap instead of alternating
+- Stages are connected by bounded queues: a full queue blocks the stage (and
+  ultimately `submit`) in front of it, so memory stays flat however fast the
+  crawler discovers images
+- A stage function takes the record produced by the previous stage and returns
+  the record for the next one, or None to drop it (duplicate, skipped download)
+- `submit` returns a Future resolving to the last stage's result (None if a
+  stage dropped the record; the exception if a stage raised)
+"""
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional
+
+_STOP = object()  # end-of-input marker, one per worker of the receiving stage
+
+
+class PipelineStage:
+    """One step of the pipeline: `fn(record) -> record | None` on `workers` threads"""
+
+    def __init__(self, name: str, fn: Callable[[Any], Any], workers: int = 1):
+        self.name = name
+        self.fn = fn
+        self.workers = max(1, workers)
+
+
+class IndexingPipeline:
+    """Run records through stages on per-stage thread pools connected by bounded queues"""
+
+    def __init__(self, stages: List[PipelineStage], queue_size: int = 16, name: str = "index"):
+        if not stages:
+            raise ValueError("pipeline needs at least one stage")
+        self.stages = stages
+        self.name = name
+        self._queues = [queue.Queue(maxsize=max(1, queue_size)) for _ in stages]
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, Any]] = {
+            stage.name: {"processed": 0, "dropped": 0, "failed": 0, "busy_seconds": 0.0} for stage in stages
+        }
+        self._running = [stage.workers for stage in stages]
+        self._submitted = 0
+        self._closed = False
+        self._threads: List[threading.Thread] = []
+        for index, stage in enumerate(stages):
+            for n in range(stage.workers):
+                thread = threading.Thread(target=self._work, args=(index,), name=f"{name}-{stage.name}-{n}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, record) -> Future:
+        """Queue a record for the first stage; blocks while that stage is backed up"""
+        future: Future = Future()
+        future.set_running_or_notify_cancel()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError(f"pipeline '{self.name}' is closed")
+            self._submitted += 1
+        self._queues[0].put((record, future))
+        return future
+
+    def close(self, timeout: Optional[float] = None):
+        """Stop accepting records, let everything queued finish, and stop the workers"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        for _ in range(self.stages[0].workers):
+            self._queues[0].put(_STOP)
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            stages = {
+                stage.name: dict(self._stats[stage.name], busy_seconds=round(self._stats[stage.name]["busy_seconds"], 2),
+                                 workers=stage.workers, queued=self._queues[i].qsize())
+                for i, stage in enumerate(self.stages)
+            }
+            return {"submitted": self._submitted, "closed": self._closed, "stages": stages}
+
+    # ---------------------------
+    # workers
+    # ---------------------------
+    def _work(self, index: int):
+        stage = self.stages[index]
+        inbox = self._queues[index]
+        outbox = self._queues[index + 1] if index + 1 < len(self.stages) else None
+        stats = self._stats[stage.name]
+        while True:
+            entry = inbox.get()
+            if entry is _STOP:
+                break
+            record, future = entry
+            start = time.perf_counter()
+            try:
+                result = stage.fn(record)
+            except Exception as e:
+                with self._lock:
+                    stats["failed"] += 1
+                    stats["busy_seconds"] += time.perf_counter() - start
+                future.set_exception(e)
+                continue
+            with self._lock:
+                stats["dropped" if result is None else "processed"] += 1
+                stats["busy_seconds"] += time.perf_counter() - start
+            if result is None or outbox is None:
+                future.set_result(result)
+            else:
+                outbox.put((result, future))  # blocks while the next stage is backed up
+
+        # Last worker of this stage out: the next stage has seen all of its input
+        with self._lock:
+            self._running[index] -= 1
+            last = self._running[index] == 0
+        if last and outbox is not None:
+            for _ in range(self.stages[index + 1].workers):
+                outbox.put(_STOP)
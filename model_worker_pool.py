@@ -0,0 +1,270 @@
+"""
+Multi-process model workers for CPU inference
+- CLIP and YOLO run in a pool of spawned worker processes instead of under the
+  API process's GIL; each worker loads the models once and keeps them
+- Sized to the host: `worker_layout` splits the cores into workers of
+  `threads_per_worker` torch threads each (torch.set_num_threads per worker)
+- IPC: image pixels never go through pickle. The caller copies a batch of
+  images into one shared-memory block and sends only (block name, offsets,
+  shapes); the worker wraps the block in numpy views without copying and
+  sends back the small results (embedding rows, detections)
+- PoolEncoder is a clip_batch_encoder.BatchingEncoder in front of the pool:
+  single submissions are still micro-batched (max_batch_size / max_wait), each
+  batch is one worker task and one shared-memory block, and up to one batch
+  per worker is in flight
+"""
+
+import multiprocessing
+import os
+import sys
+import threading
+from concurrent.futures import CancelledError, Future, ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from clip_batch_encoder import BatchingEncoder
+
+# Worker-side handlers: op name -> fn(list of RGB uint8 arrays) -> one result per image
+_worker_handlers: Dict[str, Callable] = {}
+
+
+def worker_layout(workers: Optional[int] = None, threads_per_worker: Optional[int] = None,
+                  cpu_count: Optional[int] = None) -> Tuple[int, int]:
+    """
+    (workers, threads per worker) for this host. By default every worker gets 4
+    intra-op threads and there are as many workers as fit in the cores.
+    """
+    cores = cpu_count or os.cpu_count() or 1
+    if workers and threads_per_worker:
+        return workers, threads_per_worker
+    if workers:
+        return workers, max(1, cores // workers)
+    threads = threads_per_worker or min(4, cores)
+    return max(1, cores // threads), threads
+
+
+def load_clip_yolo(clip_model_name: Optional[str] = "openai/clip-vit-base-patch32",
+                   yolo_weights: Optional[str] = "yolov8n.pt", yolo_imgsz: int = 640,
+                   yolo_conf: float = 0.25, yolo_batch_size: int = 8, clip_backend: str = "torch",
+                   clip_onnx_dir: Optional[str] = None) -> Dict[str, Callable]:
+    """
+    Default worker loader: "clip" (normalized float32 rows) and "yolo" (detections) handlers.
+    clip_backend "onnx" / "onnx-int8" loads the towers the API process exported to clip_onnx_dir.
+    """
+    handlers = {}
+    if clip_model_name:
+        from transformers import CLIPProcessor
+
+        processor = CLIPProcessor.from_pretrained(clip_model_name)
+        if clip_backend != "torch":
+            from onnx_clip_backend import ONNXClipBackend
+
+            if clip_onnx_dir is None:
+                raise ValueError(f"clip_backend '{clip_backend}' needs clip_onnx_dir (the exported ONNX towers)")
+            handlers["clip"] = ONNXClipBackend(clip_onnx_dir, processor, quantized=clip_backend == "onnx-int8").encode_images
+        else:
+            from transformers import CLIPModel
+            from clip_batch_encoder import clip_image_batch_fn
+
+            model = CLIPModel.from_pretrained(clip_model_name).eval()
+            encode = clip_image_batch_fn(processor, model, "cpu")
+            handlers["clip"] = lambda images: encode(images).numpy().astype(np.float32)
+    if yolo_weights:
+        from ultralytics import YOLO
+        from yolo_detector import YOLODetector
+
+        detector = YOLODetector(YOLO(yolo_weights), imgsz=yolo_imgsz, conf=yolo_conf, batch_size=yolo_batch_size)
+        handlers["yolo"] = detector.detect
+    return handlers
+
+
+def _init_worker(loader: Callable, loader_kwargs: dict, threads: int):
+    """Pin the thread pools before torch is imported, then load the models once"""
+    global _worker_handlers
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[var] = str(threads)
+    try:
+        import torch
+        torch.set_num_threads(threads)
+        torch.set_num_interop_threads(1)
+    except ImportError:
+        pass
+    try:
+        import cv2
+        cv2.setNumThreads(1)
+    except ImportError:
+        pass
+    _worker_handlers = loader(**loader_kwargs)
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    return shared_memory.SharedMemory(name=name)
+
+
+def _run_in_worker(op: str, block: str, layout: List[Tuple[int, tuple]]) -> list:
+    """Run `op` on images that live in shared memory block `block` (offset, shape per image)"""
+    shm = _attach(block)
+    images = []
+    try:
+        images = [np.ndarray(shape, dtype=np.uint8, buffer=shm.buf, offset=offset) for offset, shape in layout]
+        results = _worker_handlers[op](images)
+        return [results[i] for i in range(len(images))]  # handlers must not return views of their inputs
+    finally:
+        del images
+        shm.close()
+
+
+def _as_array(image) -> np.ndarray:
+    """RGB uint8 array for a PIL image (a decoded copy) or an RGB array (as-is)"""
+    array = np.asarray(image.convert("RGB") if getattr(image, "mode", "RGB") != "RGB" else image)
+    if array.dtype != np.uint8 or array.ndim != 3 or array.shape[2] != 3:
+        raise ValueError(f"Expected an RGB uint8 image, got {array.dtype} {array.shape}")
+    return array
+
+
+class ModelWorkerPool:
+    """
+    Worker processes holding the models. `submit(op, images)` ships a batch of
+    images through shared memory and resolves to one result per image.
+    Workers start on first use.
+    """
+
+    def __init__(self, workers: Optional[int] = None, threads_per_worker: Optional[int] = None,
+                 loader: Callable = load_clip_yolo, loader_kwargs: Optional[dict] = None):
+        self.workers, self.threads_per_worker = worker_layout(workers, threads_per_worker)
+        self.loader = loader
+        self.loader_kwargs = loader_kwargs or {}
+        self.counts = {"tasks": 0, "images": 0, "bytes": 0, "failed": 0}
+        self._lock = threading.Lock()
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                print(f"🧠 Starting {self.workers} model workers x {self.threads_per_worker} threads")
+                # spawn: never fork a process that holds torch / model threads
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker, initargs=(self.loader, self.loader_kwargs, self.threads_per_worker))
+            return self._executor
+
+    def submit(self, op: str, images: Sequence[Any]) -> Future:
+        """Future resolving to a list with one `op` result per image"""
+        arrays = [_as_array(image) for image in images]
+        layout, size = [], 0
+        for array in arrays:
+            layout.append((size, array.shape))
+            size += array.nbytes
+        shm = shared_memory.SharedMemory(create=True, size=max(1, size))
+        try:
+            for (offset, shape), array in zip(layout, arrays):
+                np.ndarray(shape, dtype=np.uint8, buffer=shm.buf, offset=offset)[...] = array  # into the block
+            future = self._get_executor().submit(_run_in_worker, op, shm.name, layout)
+        except Exception:
+            shm.close()
+            shm.unlink()
+            raise
+        with self._lock:
+            self.counts["tasks"] += 1
+            self.counts["images"] += len(arrays)
+            self.counts["bytes"] += size
+
+        def release(done: Future):
+            shm.close()
+            shm.unlink()
+            if done.cancelled() or done.exception() is not None:
+                with self._lock:
+                    self.counts["failed"] += 1
+        future.add_done_callback(release)
+        return future
+
+    def run(self, op: str, images: Sequence[Any], timeout: Optional[float] = None) -> list:
+        return self.submit(op, images).result(timeout)
+
+    def map(self, op: str, images: Sequence[Any], chunk_size: int = 8) -> list:
+        """Results for a list of images, in order, spread over the workers in chunks"""
+        futures = [self.submit(op, images[start:start + chunk_size]) for start in range(0, len(images), chunk_size)]
+        return [result for future in futures for result in future.result()]
+
+    def encoder(self, op: str, max_batch_size: int = 8, max_wait: float = 0.03,
+                convert: Optional[Callable] = None) -> "PoolEncoder":
+        return PoolEncoder(self, op, max_batch_size, max_wait, convert)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self.counts, workers=self.workers, threads_per_worker=self.threads_per_worker,
+                        started=self._executor is not None)
+
+    def close(self, wait: bool = True):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=not wait)
+
+
+class PoolEncoder(BatchingEncoder):
+    """
+    BatchingEncoder for one op of a ModelWorkerPool. Concurrent single
+    submissions are collected into batches of up to max_batch_size within
+    max_wait; each batch runs as one worker task. While every worker has a batch
+    the next one keeps filling. encode_many splits a list across the workers.
+    `convert` maps each result row (e.g. numpy -> torch tensor).
+    """
+
+    def __init__(self, pool: ModelWorkerPool, op: str, max_batch_size: int = 8, max_wait: float = 0.03,
+                 convert: Optional[Callable] = None):
+        super().__init__(lambda items: pool.run(op, items), max_batch_size, max_wait, name=f"pool-{op}")
+        self.pool = pool
+        self.op = op
+        self.convert = convert or (lambda row: row)
+        self.in_flight = 0
+        self._capacity = threading.Condition()
+
+    def _wait_for_capacity(self):
+        with self._capacity:
+            while self.in_flight >= self.pool.workers:
+                self._capacity.wait()
+
+    def _dispatch(self, batch: List[tuple]):
+        """Send the batch to a worker without waiting; its futures resolve from the task's callback"""
+        try:
+            task = self.pool.submit(self.op, [item for item, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        with self._lock:
+            self.batches += 1
+            self.items += len(batch)
+        with self._capacity:
+            self.in_flight += 1
+
+        def done(task: Future):
+            with self._capacity:
+                self.in_flight -= 1
+                self._capacity.notify()
+            if task.cancelled() or task.exception() is not None:
+                error = CancelledError() if task.cancelled() else task.exception()
+                for _, future in batch:
+                    future.set_exception(error)
+                return
+            try:
+                rows = task.result()
+                for i, (_, future) in enumerate(batch):
+                    future.set_result(self.convert(rows[i]))
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+        task.add_done_callback(done)
+
+    def encode_many(self, items: Sequence) -> list:
+        chunk = max(1, min(self.max_batch_size, -(-len(items) // self.pool.workers)))
+        return [self.convert(row) for row in self.pool.map(self.op, items, chunk_size=chunk)]
+
+    def stats(self) -> dict:
+        return dict(super().stats(), pool=self.pool.stats(), op=self.op, in_flight=self.in_flight)
@@ -0,0 +1,246 @@
+"""
+OCR with a persistent tesseract engine, text-presence gating and a process pool
+- has_text: cheap morphological text-line detector; text-free photos (most of
+  the crawl) never reach tesseract
+- OCREngine: keeps one tesseract C-API handle per language loaded for the life
+  of the process (tesserocr), instead of one tesseract subprocess per image
+  (pytesseract, used as the fallback)
+- Script detection (tesseract OSD) narrows the configured languages to the
+  packs written in the detected script (e.g. heb for Hebrew, eng for Latin out
+  of eng+heb) and keeps all of them when it is unsure
+- OCRPool: engines live in worker processes; callers hand over a grayscale
+  array, plus optionally a higher-resolution one that is only built for images
+  that pass the text gate
+"""
+
+import multiprocessing
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+import cv2
+import numpy as np
+
+try:
+    import tesserocr
+    TESSEROCR_AVAILABLE = True
+except ImportError:
+    TESSEROCR_AVAILABLE = False
+
+try:
+    import pytesseract
+    PYTESSERACT_AVAILABLE = True
+except ImportError:
+    PYTESSERACT_AVAILABLE = False
+
+# Tesseract OSD script name -> language packs written in that script
+SCRIPT_LANGUAGES = {
+    "Latin": ("eng", "fra", "deu", "spa", "ita", "por", "nld", "pol", "tur", "ron", "swe", "dan", "nor", "fin"),
+    "Hebrew": ("heb", "yid"),
+    "Arabic": ("ara", "fas", "urd"),
+    "Cyrillic": ("rus", "ukr", "bul", "srp"),
+    "Greek": ("ell",),
+    "Han": ("chi_sim", "chi_tra"),
+    "Japanese": ("jpn",),
+    "Korean": ("kor",),
+}
+DEFAULT_LANGUAGES = "eng+heb"
+
+
+def languages_for_script(script: Optional[str], languages: str) -> str:
+    """The configured packs ("eng+heb") written in `script`, or all of them if none is"""
+    packs = SCRIPT_LANGUAGES.get(script or "", ())
+    return "+".join(lang for lang in languages.split("+") if lang in packs) or languages
+
+
+def ocr_available() -> bool:
+    """True if some tesseract backend can run here (checked once at startup, not per image)"""
+    if TESSEROCR_AVAILABLE:
+        return True
+    if not PYTESSERACT_AVAILABLE:
+        return False
+    try:
+        pytesseract.get_tesseract_version()
+        return True
+    except Exception:
+        return False
+
+
+def clean_ocr_text(text: Optional[str]) -> str:
+    """Collapse whitespace and newlines into single spaces"""
+    return " ".join((text or "").split())
+
+
+def has_text(gray: np.ndarray, min_regions: int = 3, max_side: int = 800) -> bool:
+    """
+    Cheap text-presence test on a grayscale image: strong local gradients joined
+    horizontally into wide, short blobs look like lines of characters.
+    """
+    height, width = gray.shape[:2]
+    scale = min(1.0, max_side / max(height, width))
+    if scale < 1.0:
+        gray = cv2.resize(gray, (int(width * scale), int(height * scale)), interpolation=cv2.INTER_AREA)
+
+    gradient = cv2.morphologyEx(gray, cv2.MORPH_GRADIENT, np.ones((3, 3), np.uint8))
+    _, binary = cv2.threshold(gradient, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    joined = cv2.morphologyEx(binary, cv2.MORPH_CLOSE, cv2.getStructuringElement(cv2.MORPH_RECT, (9, 1)))
+    contours, _ = cv2.findContours(joined, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+    regions = 0
+    for contour in contours:
+        x, y, w, h = cv2.boundingRect(contour)
+        if not (6 <= h <= 60 and w >= 2 * h):
+            continue
+        fill = cv2.countNonZero(binary[y:y + h, x:x + w]) / float(w * h)
+        if 0.2 <= fill <= 0.9:
+            regions += 1
+            if regions >= min_regions:
+                return True
+    return False
+
+
+class OCREngine:
+    """Persistent in-process OCR (tesserocr), falling back to pytesseract subprocesses"""
+
+    def __init__(self, languages: str = DEFAULT_LANGUAGES, detect_script: bool = True):
+        self.languages = languages
+        self.detect_script = detect_script
+        self._apis: Dict[str, Any] = {}  # lang -> tesserocr.PyTessBaseAPI
+        self._osd = None
+        if not ocr_available():
+            raise RuntimeError("No tesseract backend available (install tesserocr or pytesseract + tesseract)")
+
+    def _api(self, lang: str):
+        if lang not in self._apis:
+            self._apis[lang] = tesserocr.PyTessBaseAPI(lang=lang, psm=tesserocr.PSM.AUTO)
+        return self._apis[lang]
+
+    def script_language(self, binary: np.ndarray) -> str:
+        """Configured language packs of the detected script, or the whole configured combination"""
+        if not (self.detect_script and TESSEROCR_AVAILABLE):
+            return self.languages
+        try:
+            from PIL import Image
+            if self._osd is None:
+                self._osd = tesserocr.PyTessBaseAPI(lang="osd", psm=tesserocr.PSM.OSD_ONLY)
+            self._osd.SetImage(Image.fromarray(binary))
+            osd = self._osd.DetectOrientationScript() or {}
+            if osd.get("script_conf", 0) >= 1.0:
+                return languages_for_script(osd.get("script_name"), self.languages)
+        except Exception:
+            pass  # no osd.traineddata or too little text to tell
+        return self.languages
+
+    def recognize(self, gray: np.ndarray) -> str:
+        """OCR a grayscale image (Otsu-binarized first)"""
+        _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        lang = self.script_language(binary)
+        if TESSEROCR_AVAILABLE:
+            from PIL import Image
+            api = self._api(lang)
+            api.SetImage(Image.fromarray(binary))
+            return clean_ocr_text(api.GetUTF8Text())
+        return clean_ocr_text(pytesseract.image_to_string(binary, lang=lang))
+
+    def close(self):
+        for api in list(self._apis.values()) + ([self._osd] if self._osd else []):
+            api.End()
+        self._apis.clear()
+        self._osd = None
+
+
+# One engine per pool worker process
+_worker_engine: Optional[OCREngine] = None
+
+
+def _init_worker(languages: str, detect_script: bool):
+    global _worker_engine
+    cv2.setNumThreads(1)  # parallelism comes from the pool
+    _worker_engine = OCREngine(languages, detect_script)
+
+
+def _recognize_in_worker(gray: np.ndarray) -> str:
+    if _worker_engine is None:
+        raise RuntimeError("OCR worker was started without _init_worker")
+    return _worker_engine.recognize(gray)
+
+
+class OCRPool:
+    """
+    Text-gated OCR on a pool of worker processes, each holding a persistent engine.
+    `workers=0` runs the engine in the calling process instead.
+    """
+
+    def __init__(self, workers: int = 2, languages: str = DEFAULT_LANGUAGES, detect_script: bool = True,
+                 min_text_regions: int = 3):
+        self.workers = workers
+        self.languages = languages
+        self.detect_script = detect_script
+        self.min_text_regions = min_text_regions
+        self.counts = {"images": 0, "skipped_no_text": 0, "recognized": 0, "failed": 0}
+        self._lock = threading.Lock()
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._local_engine: Optional[OCREngine] = None
+        self._local_lock = threading.Lock()  # tesseract handles are not thread-safe
+
+    def _count(self, key: str):
+        with self._lock:
+            self.counts[key] += 1
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # spawn: never fork a process that holds torch / model threads
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker, initargs=(self.languages, self.detect_script))
+            return self._executor
+
+    def submit(self, gray: np.ndarray, detail: Optional[Callable[[], np.ndarray]] = None) -> Future:
+        """
+        Future resolving to the image text ("" when no text is detected). The
+        text gate runs on `gray`; tesseract reads `detail()` when given (e.g. a
+        higher-resolution grayscale, where small text is still legible).
+        """
+        self._count("images")
+        if not has_text(gray, self.min_text_regions):
+            self._count("skipped_no_text")
+            future: Future = Future()
+            future.set_result("")
+            return future
+        self._count("recognized")
+        if detail is not None:
+            gray = detail()
+        if self.workers <= 0:
+            future = Future()
+            try:
+                with self._local_lock:
+                    if self._local_engine is None:
+                        self._local_engine = OCREngine(self.languages, self.detect_script)
+                    future.set_result(self._local_engine.recognize(gray))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+        return self._get_executor().submit(_recognize_in_worker, np.ascontiguousarray(gray))
+
+    def extract(self, gray: np.ndarray, timeout: Optional[float] = None,
+                detail: Optional[Callable[[], np.ndarray]] = None) -> str:
+        try:
+            return self.submit(gray, detail).result(timeout)
+        except Exception:
+            self._count("failed")
+            raise
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self.counts, workers=self.workers,
+                        engine="tesserocr" if TESSEROCR_AVAILABLE else "pytesseract")
+
+    def close(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+        if self._local_engine is not None:
+            self._local_engine.close()
+            self._local_engine = None
@@ -0,0 +1,225 @@
+"""
+ONNX Runtime backend for CLIP on CPU hosts
+- Exports the vision and text towers of a transformers CLIPModel to ONNX once
+  (`ensure_exported`), optionally with dynamic int8 quantization of the
+  MatMul / Gemm weights (the transformer layers, almost all of the FLOPs)
+- ONNXClipBackend runs both towers with onnxruntime and returns L2-normalized
+  float32 rows, the same contract as the PyTorch path
+- `load_clip_backend` checks the ONNX embeddings against the PyTorch model on
+  probe images and texts and refuses a backend whose cosine agreement is below
+  the tolerance, so new vectors stay comparable with the stored ones
+"""
+
+import json
+import os
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+try:
+    import onnxruntime as ort
+    ONNX_AVAILABLE = True
+except ImportError:
+    ONNX_AVAILABLE = False
+
+BACKENDS = ("torch", "onnx", "onnx-int8")
+OPSET = 17
+# Minimum cosine between PyTorch and ONNX embeddings of the same input
+DEFAULT_MIN_COSINE = {"onnx": 0.999, "onnx-int8": 0.98}
+PROBE_TEXTS = ["modern kitchen with a white island", "bedroom with a wooden bed and a lamp",
+               "living room sofa", "מטבח מודרני", "office desk near a window"]
+
+
+def normalize_rows(features: np.ndarray) -> np.ndarray:
+    features = np.asarray(features, dtype=np.float32)
+    return features / np.linalg.norm(features, axis=-1, keepdims=True).clip(min=1e-12)
+
+
+def embedding_agreement(reference: np.ndarray, candidate: np.ndarray) -> Dict[str, float]:
+    """Row-wise cosine between two sets of embeddings of the same inputs"""
+    cosines = np.sum(normalize_rows(reference) * normalize_rows(candidate), axis=-1)
+    return {"min_cosine": round(float(cosines.min()), 5), "mean_cosine": round(float(cosines.mean()), 5)}
+
+
+def probe_images(count: int = 4, size: int = 256, seed: int = 0) -> List[np.ndarray]:
+    """Smooth gradients with noise and a bright block: closer to photos than pure noise"""
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:size, 0:size] / size
+    images = []
+    for _ in range(count):
+        base = np.stack([x * rng.uniform(50, 255), y * rng.uniform(50, 255), (1 - x) * rng.uniform(50, 255)], axis=-1)
+        top, left = rng.integers(0, size // 2, 2)
+        base[top:top + size // 3, left:left + size // 3] = rng.uniform(0, 255, 3)
+        images.append(np.clip(base + rng.normal(0, 8, base.shape), 0, 255).astype(np.uint8))
+    return images
+
+
+def onnx_paths(model_dir: str, quantized: bool = False) -> Dict[str, str]:
+    suffix = ".int8.onnx" if quantized else ".onnx"
+    return {tower: os.path.join(model_dir, f"{tower}{suffix}") for tower in ("vision", "text")}
+
+
+def export_clip_onnx(model, model_dir: str, opset: int = OPSET) -> Dict[str, str]:
+    """Export the vision and text towers (unnormalized features, dynamic batch / sequence)"""
+    import torch
+
+    class VisionTower(torch.nn.Module):
+        def __init__(self, clip):
+            super().__init__()
+            self.clip = clip
+
+        def forward(self, pixel_values):
+            return self.clip.get_image_features(pixel_values=pixel_values)
+
+    class TextTower(torch.nn.Module):
+        def __init__(self, clip):
+            super().__init__()
+            self.clip = clip
+
+        def forward(self, input_ids, attention_mask):
+            return self.clip.get_text_features(input_ids=input_ids, attention_mask=attention_mask)
+
+    os.makedirs(model_dir, exist_ok=True)
+    paths = onnx_paths(model_dir)
+    model = model.eval().to("cpu")
+    size = model.config.vision_config.image_size
+    with torch.no_grad():
+        torch.onnx.export(VisionTower(model), (torch.zeros(1, 3, size, size),), paths["vision"],
+                          input_names=["pixel_values"], output_names=["image_embeds"],
+                          dynamic_axes={"pixel_values": {0: "batch"}, "image_embeds": {0: "batch"}},
+                          opset_version=opset)
+        input_ids = torch.ones(2, 8, dtype=torch.long)
+        torch.onnx.export(TextTower(model), (input_ids, torch.ones_like(input_ids)), paths["text"],
+                          input_names=["input_ids", "attention_mask"], output_names=["text_embeds"],
+                          dynamic_axes={"input_ids": {0: "batch", 1: "sequence"},
+                                        "attention_mask": {0: "batch", 1: "sequence"},
+                                        "text_embeds": {0: "batch"}},
+                          opset_version=opset)
+    return paths
+
+
+def quantize_clip_onnx(model_dir: str) -> Dict[str, str]:
+    """Dynamic int8 quantization of the exported towers (weights int8, activations quantized per call)"""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    source, target = onnx_paths(model_dir), onnx_paths(model_dir, quantized=True)
+    for tower in ("vision", "text"):
+        quantize_dynamic(source[tower], target[tower], weight_type=QuantType.QInt8,
+                         op_types_to_quantize=["MatMul", "Gemm"])
+    return target
+
+
+def ensure_exported(model, model_name: str, model_dir: str, quantized: bool = False) -> Dict[str, str]:
+    """Export (and quantize) once; re-export when the directory holds another model"""
+    meta_path = os.path.join(model_dir, "export.json")
+    meta = {"model": model_name, "opset": OPSET}
+    current = None
+    if os.path.exists(meta_path):
+        with open(meta_path, encoding="utf-8") as f:
+            current = json.load(f)
+    paths = onnx_paths(model_dir)
+    if current != meta or not all(os.path.exists(path) for path in paths.values()):
+        print(f"📦 Exporting {model_name} to ONNX in {model_dir}...")
+        export_clip_onnx(model, model_dir)
+        for path in onnx_paths(model_dir, quantized=True).values():
+            if os.path.exists(path):
+                os.remove(path)  # quantized from the previous export
+        with open(meta_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+    if quantized:
+        paths = onnx_paths(model_dir, quantized=True)
+        if not all(os.path.exists(path) for path in paths.values()):
+            print("📦 Quantizing ONNX CLIP towers to int8...")
+            quantize_clip_onnx(model_dir)
+    return paths
+
+
+class ONNXClipBackend:
+    """CLIP image / text embeddings from exported ONNX towers on onnxruntime's CPU provider"""
+
+    def __init__(self, model_dir: str, processor, quantized: bool = False, threads: Optional[int] = None):
+        if not ONNX_AVAILABLE:
+            raise RuntimeError("onnxruntime is not installed (pip install onnxruntime)")
+        self.processor = processor
+        self.quantized = quantized
+        self.agreement: Optional[Dict[str, Dict[str, float]]] = None  # cosine vs PyTorch, filled in by load_clip_backend
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        # Model pool workers pin OMP_NUM_THREADS; elsewhere onnxruntime picks the core count
+        options.intra_op_num_threads = threads or int(os.getenv("OMP_NUM_THREADS", "0"))
+        paths = onnx_paths(model_dir, quantized)
+        self.vision = ort.InferenceSession(paths["vision"], options, providers=["CPUExecutionProvider"])
+        self.text = ort.InferenceSession(paths["text"], options, providers=["CPUExecutionProvider"])
+
+    @property
+    def name(self) -> str:
+        return "onnx-int8" if self.quantized else "onnx"
+
+    def encode_images(self, images: Sequence) -> np.ndarray:
+        """PIL images or RGB arrays -> N x D normalized float32"""
+        pixel_values = self.processor(images=list(images), return_tensors="np")["pixel_values"]
+        return normalize_rows(self.vision.run(None, {"pixel_values": pixel_values.astype(np.float32)})[0])
+
+    def encode_texts(self, texts: Sequence[str]) -> np.ndarray:
+        """Texts -> N x D normalized float32"""
+        inputs = self.processor(text=list(texts), return_tensors="np", padding=True)
+        return normalize_rows(self.text.run(None, {
+            "input_ids": inputs["input_ids"].astype(np.int64),
+            "attention_mask": inputs["attention_mask"].astype(np.int64),
+        })[0])
+
+
+def torch_clip_embeddings(model, processor, images=None, texts=None) -> np.ndarray:
+    """Reference embeddings from the PyTorch model (what the stored vectors were built with)"""
+    import torch
+
+    with torch.no_grad():
+        if images is not None:
+            inputs = processor(images=list(images), return_tensors="pt")
+            features = model.get_image_features(pixel_values=inputs["pixel_values"].to(model.device))
+        else:
+            inputs = processor(text=list(texts or ()), return_tensors="pt", padding=True)
+            features = model.get_text_features(**{k: v.to(model.device) for k, v in inputs.items()})
+    return normalize_rows(features.cpu().numpy())
+
+
+def check_agreement(backend: ONNXClipBackend, model, processor) -> Dict[str, Dict[str, float]]:
+    images = probe_images()
+    return {
+        "image": embedding_agreement(torch_clip_embeddings(model, processor, images=images),
+                                     backend.encode_images(images)),
+        "text": embedding_agreement(torch_clip_embeddings(model, processor, texts=PROBE_TEXTS),
+                                    backend.encode_texts(PROBE_TEXTS)),
+    }
+
+
+def load_clip_backend(kind: str, model_name: str, model, processor, model_dir: str,
+                      min_cosine: Optional[float] = None) -> Optional[ONNXClipBackend]:
+    """
+    ONNX backend for kind "onnx" / "onnx-int8", exported on first use and checked
+    against the PyTorch model. None (use PyTorch) for "torch", when onnxruntime
+    is missing, or when the embeddings disagree by more than the tolerance.
+    """
+    if kind not in BACKENDS:
+        raise ValueError(f"Unknown CLIP backend {kind!r}, expected one of {BACKENDS}")
+    if kind == "torch":
+        return None
+    if not ONNX_AVAILABLE:
+        print("⚠️ onnxruntime not installed, CLIP stays on PyTorch")
+        return None
+    try:
+        quantized = kind == "onnx-int8"
+        ensure_exported(model, model_name, model_dir, quantized)
+        backend = ONNXClipBackend(model_dir, processor, quantized)
+        agreement = check_agreement(backend, model, processor)
+        backend.agreement = agreement
+    except Exception as e:
+        print(f"⚠️ ONNX CLIP backend failed to load, CLIP stays on PyTorch: {e}")
+        return None
+    tolerance = min_cosine if min_cosine is not None else DEFAULT_MIN_COSINE[kind]
+    worst = min(result["min_cosine"] for result in agreement.values())
+    if worst < tolerance:
+        print(f"⚠️ {kind} CLIP embeddings drift from PyTorch (min cosine {worst} < {tolerance}), staying on PyTorch")
+        return None
+    print(f"✅ CLIP backend {kind} (min cosine vs PyTorch {worst})")
+    return backend
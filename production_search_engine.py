@@ -13,6 +13,7 @@ from dataclasses import dataclass
 import openai
 from supabase import create_client
 import hashlib
+from hebrew_translator import PhraseTranslator
 from concurrent.futures import ThreadPoolExecutor
 # import aiohttp  # Optional for async HTTP requests
 
@@ -121,6 +122,7 @@ class ProductionSearchEngine:
             "אריחים": "tile",
             "בטון": "concrete"
         }
+        self.he_translator = PhraseTranslator(self.he_to_en)
         
         # VLM System Prompt with strict JSON schema
         self.SYSTEM_PROMPT = """You are a careful visual verifier. For each image, decide if it satisfies the user's request using only what is visible. Be strict: if uncertain, say it does NOT match. Output only JSON by the schema.
@@ -186,9 +188,7 @@ Schema:
     async def _normalize_query(self, query: str, lang: str) -> str:
         """Normalize query (Hebrew → English translation)"""
         if lang == "he":
-            query_en = query
-            for he, en in self.he_to_en.items():
-                query_en = query_en.replace(he, en)
+            query_en = self.he_translator.translate(query)
             print(f"Translated: '{query}' -> '{query_en}'")
             return query_en
         return query
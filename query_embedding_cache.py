@@ -0,0 +1,133 @@
+"""
+LRU cache for normalized CLIP text-query embeddings
+- Keyed on the normalized translated query plus search guidelines and the
+  CLIP backend (torch / onnx / onnx-int8 embed the same text slightly differently)
+- Bounded size with least-recently-used eviction
+- Optional persistence to a .npz file so warm entries survive restarts
+- Hit / miss counters for monitoring
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+import numpy as np
+
+# (normalized query, normalized guidelines, CLIP backend)
+CacheKey = Tuple[str, str, str]
+
+
+def normalize_query_text(text: str) -> str:
+    """Case- and whitespace-insensitive form of a query (CLIP lowercases anyway)"""
+    return " ".join((text or "").lower().split())
+
+
+class QueryEmbeddingCache:
+    """Thread-safe bounded LRU of query key -> float32 embedding row"""
+
+    def __init__(self, max_entries: int = 1024, persist_path: Optional[str] = None,
+                 model_name: str = "", persist_every: int = 50, backend: str = "torch"):
+        self.max_entries = max(1, max_entries)
+        self.persist_path = persist_path
+        self.model_name = model_name
+        self.backend = backend
+        self.persist_every = persist_every
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[CacheKey, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._unsaved = 0
+        if persist_path:
+            self.load()
+
+    def make_key(self, query: str, guidelines: str = "") -> CacheKey:
+        return normalize_query_text(query), normalize_query_text(guidelines), self.backend
+
+    def get(self, key: CacheKey) -> Optional[np.ndarray]:
+        with self._lock:
+            embedding = self._entries.get(key)
+            if embedding is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return embedding
+
+    def put(self, key: CacheKey, embedding) -> None:
+        row = np.asarray(embedding, dtype=np.float32).reshape(-1)
+        row.setflags(write=False)
+        with self._lock:
+            self._entries[key] = row
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._unsaved += 1
+            should_save = self.persist_path and self._unsaved >= self.persist_every
+        if should_save:
+            self.save()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "persist_path": self.persist_path,
+        }
+
+    def save(self) -> bool:
+        """Write the cache (oldest first) to persist_path"""
+        if not self.persist_path:
+            return False
+        with self._lock:
+            keys = list(self._entries.keys())
+            vectors = np.stack(list(self._entries.values())) if keys else np.zeros((0, 0), dtype=np.float32)
+            self._unsaved = 0
+        try:
+            tmp_path = f"{self.persist_path}.tmp.npz"
+            np.savez(
+                tmp_path,
+                queries=np.array([k[0] for k in keys], dtype=str),
+                guidelines=np.array([k[1] for k in keys], dtype=str),
+                vectors=vectors,
+                model_name=np.array(self.model_name),
+                backend=np.array(self.backend),
+            )
+            os.replace(tmp_path, self.persist_path)
+            return True
+        except Exception as e:
+            print(f"⚠️ Failed to persist query embedding cache: {e}")
+            return False
+
+    def load(self) -> int:
+        """Load persisted entries; entries from a different model or backend are ignored"""
+        if not self.persist_path or not os.path.exists(self.persist_path):
+            return 0
+        try:
+            with np.load(self.persist_path, allow_pickle=False) as data:
+                if str(data["model_name"]) != self.model_name:
+                    print("⚠️ Query embedding cache was built with a different model, ignoring it")
+                    return 0
+                # files written before the backend was recorded were built with PyTorch
+                backend = str(data["backend"]) if "backend" in data.files else "torch"
+                if backend != self.backend:
+                    print(f"⚠️ Query embedding cache was built with the {backend} CLIP backend, ignoring it")
+                    return 0
+                entries = list(zip(data["queries"], data["guidelines"], data["vectors"]))
+        except Exception as e:
+            print(f"⚠️ Failed to load query embedding cache: {e}")
+            return 0
+        for query, guidelines, vector in entries[-self.max_entries:]:
+            row = vector.astype(np.float32)
+            row.setflags(write=False)
+            self._entries[(str(query), str(guidelines), self.backend)] = row
+        return len(entries)
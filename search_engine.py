@@ -12,6 +12,10 @@ import numpy as np
 
 # Hebrew synonyms (imported from main)
 from fastapi_drive_ai_v4_production import HEBREW_ENGLISH_SYNONYMS, generate_text_embedding, supabase
+from hebrew_translator import PhraseTranslator
+
+# Compiled once for all parsers; whole words so e.g. multi-word room names match as phrases
+HEBREW_SYNONYM_TRANSLATOR = PhraseTranslator(HEBREW_ENGLISH_SYNONYMS, whole_words=True)
 
 @dataclass
 class SearchConstraints:
@@ -45,20 +49,8 @@ class QueryParser:
         self.en_to_he = {v: k for k, v in self.he_to_en.items()}
     
     def translate_hebrew_to_english(self, text: str) -> str:
-        """Translate Hebrew words to English using synonym map"""
-        words = text.split()
-        translated = []
-        
-        for word in words:
-            # Remove punctuation
-            clean_word = re.sub(r'[^\w\s]', '', word)
-            
-            if clean_word in self.he_to_en:
-                translated.append(self.he_to_en[clean_word])
-            else:
-                translated.append(word)
-        
-        return ' '.join(translated)
+        """Translate Hebrew words and phrases to English using synonym map (single pass, longest match)"""
+        return ' '.join(HEBREW_SYNONYM_TRANSLATOR.translate(text).split())
     
     def detect_language(self, text: str) -> str:
         """Detect if text is Hebrew or English"""
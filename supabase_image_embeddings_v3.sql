@@ -0,0 +1,75 @@
+-- PicLocate v3 image_embeddings migrations
+-- Run in the Supabase SQL editor (safe to re-run)
+
+-- =====================================================
+-- 1. CHANGE TRACKING (delta sync into the local index)
+-- =====================================================
+-- updated_at is bumped on every insert/upsert so workers can fetch only rows
+-- changed since their last sync, paging by (updated_at, file_id).
+-- clock_timestamp() is the time of the write itself (NOW() is the start of the
+-- transaction). A row still becomes visible only when its transaction commits,
+-- possibly after a sync has moved past its stamp, so the app re-reads an
+-- overlap window before the high-water mark (SUPABASE_SYNC_OVERLAP).
+ALTER TABLE image_embeddings ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ;
+UPDATE image_embeddings SET updated_at = COALESCE(created_at, NOW()) WHERE updated_at IS NULL;
+ALTER TABLE image_embeddings ALTER COLUMN updated_at SET DEFAULT clock_timestamp();
+
+CREATE OR REPLACE FUNCTION set_image_embeddings_updated_at()
+RETURNS TRIGGER AS $$
+BEGIN
+  NEW.updated_at = clock_timestamp();
+  RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_image_embeddings_updated_at ON image_embeddings;
+CREATE TRIGGER trg_image_embeddings_updated_at
+  BEFORE INSERT OR UPDATE ON image_embeddings
+  FOR EACH ROW EXECUTE FUNCTION set_image_embeddings_updated_at();
+
+CREATE INDEX IF NOT EXISTS idx_image_embeddings_updated_at ON image_embeddings(updated_at, file_id);
+
+-- =====================================================
+-- 2. SERVER-SIDE VECTOR SEARCH (search_images_supabase)
+-- =====================================================
+-- Cosine HNSW index (pgvector >= 0.5). On older pgvector use instead:
+--   CREATE INDEX idx_image_embeddings_embedding_ivfflat ON image_embeddings
+--     USING ivfflat (embedding vector_cosine_ops) WITH (lists = 100);
+CREATE INDEX IF NOT EXISTS idx_image_embeddings_embedding_hnsw
+  ON image_embeddings USING hnsw (embedding vector_cosine_ops);
+CREATE INDEX IF NOT EXISTS idx_image_embeddings_objects ON image_embeddings USING gin (objects);
+CREATE INDEX IF NOT EXISTS idx_image_embeddings_folder ON image_embeddings(folder);
+
+-- Top match_count images by cosine distance, optionally restricted to images
+-- containing all required_objects and/or one folder. Called via
+-- supabase.rpc("match_image_embeddings", {...}); returns no embeddings.
+CREATE OR REPLACE FUNCTION match_image_embeddings(
+  query_embedding VECTOR(512),
+  match_count INT DEFAULT 10,
+  required_objects TEXT[] DEFAULT NULL,
+  folder_filter TEXT DEFAULT NULL
+)
+RETURNS TABLE (
+  file_id TEXT,
+  file_name TEXT,
+  objects TEXT[],
+  colors JSONB,
+  folder TEXT,
+  ocr_text TEXT,
+  room_type TEXT,
+  similarity FLOAT
+)
+LANGUAGE plpgsql AS $$
+BEGIN
+  -- Filters are applied after the index scan, so widen the HNSW candidate list
+  PERFORM set_config('hnsw.ef_search', GREATEST(40, LEAST(1000, match_count * 4))::TEXT, TRUE);
+  RETURN QUERY
+    SELECT e.file_id, e.file_name, e.objects, to_jsonb(e.colors), e.folder, e.ocr_text, e.room_type,
+           (1 - (e.embedding <=> query_embedding))::FLOAT AS similarity
+    FROM image_embeddings e
+    WHERE (required_objects IS NULL OR e.objects @> required_objects)
+      AND (folder_filter IS NULL OR e.folder = folder_filter)
+    ORDER BY e.embedding <=> query_embedding
+    LIMIT match_count;
+END;
+$$;
@@ -0,0 +1,155 @@
+"""
+Paginated streaming reads of Supabase tables (used for v3 `image_embeddings`)
+- Keyset pagination on (cursor column, file_id): no OFFSET scans, no reliance
+  on the server's max-rows limit, stable while rows are being written
+- Only the requested columns are projected
+- `since` high-water mark so later syncs only fetch rows changed since then;
+  `rewind_timestamp` widens it into an overlap window, since a row stamped
+  inside a long transaction can become visible after the mark moved past it
+- IndexedIdSet: in-memory "already stored?" checks instead of one query per id
+"""
+
+import threading
+from datetime import datetime, timedelta
+from typing import Callable, Iterator, List, Optional
+
+DEFAULT_PAGE_SIZE = 500
+
+
+def parse_timestamp(value) -> Optional[datetime]:
+    """datetime for a PostgREST timestamp string, or None if it is missing or unparsable"""
+    try:
+        return datetime.fromisoformat(str(value).replace("Z", "+00:00")) if value else None
+    except ValueError:
+        return None
+
+
+def rewind_timestamp(value, seconds: float):
+    """`value` moved `seconds` earlier (the overlap window of a delta sync); unparsable values are kept"""
+    moment = parse_timestamp(value)
+    return (moment - timedelta(seconds=seconds)).isoformat() if moment and seconds else value
+
+
+def _quote(value) -> str:
+    """Quote a value for a PostgREST or=() filter (timestamps contain ':' and '+')"""
+    return '"' + str(value).replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def iter_table_pages(client, table: str, columns: str, cursor_column: str = "updated_at",
+                     since=None, page_size: int = DEFAULT_PAGE_SIZE,
+                     filters: Optional[Callable] = None, key_column: str = "file_id") -> Iterator[List[dict]]:
+    """
+    Yield the rows of `table` page by page, ordered by (cursor_column, key_column).
+
+    Only rows with cursor_column > since are returned when `since` is given.
+    `filters` optionally narrows every page query, e.g. lambda q: q.eq("folder", "Root").
+    Both cursor_column and key_column must be part of `columns`.
+    """
+    last = None
+    while True:
+        query = client.table(table).select(columns)
+        if filters:
+            query = filters(query)
+        if last is not None:
+            value, key = last
+            if cursor_column == key_column:
+                query = query.gt(key_column, key)
+            else:
+                query = query.or_(
+                    f"{cursor_column}.gt.{_quote(value)},"
+                    f"and({cursor_column}.eq.{_quote(value)},{key_column}.gt.{_quote(key)})"
+                )
+        elif since is not None:
+            query = query.gt(cursor_column, since)
+
+        query = query.order(cursor_column)
+        if cursor_column != key_column:
+            query = query.order(key_column)
+        rows = query.limit(page_size).execute().data or []
+        if not rows:
+            return
+        yield rows
+        # A short page is not treated as the end: the server's max-rows setting
+        # may be smaller than page_size, so stop only on an empty page
+        last = (rows[-1][cursor_column], rows[-1][key_column])
+
+
+def iter_table_ids(client, table: str, key_column: str = "file_id",
+                   page_size: int = 5000) -> Iterator[str]:
+    """Stream every key of `table` (cheap: no embeddings are transferred)"""
+    for rows in iter_table_pages(client, table, key_column, cursor_column=key_column,
+                                 page_size=page_size, key_column=key_column):
+        for row in rows:
+            yield row[key_column]
+
+
+class IndexedIdSet:
+    """
+    In-memory set of keys already stored in a table (e.g. indexed Drive file ids).
+
+    `preload` fetches every key once with a paged id-only sweep; without it,
+    `prefetch` checks unknown keys in batched `in_` queries. Membership tests
+    are then answered from memory, and `add` keeps the set current as new rows
+    are written.
+    """
+
+    def __init__(self, table: str, key_column: str = "file_id", batch_size: int = 300):
+        self.table = table
+        self.key_column = key_column
+        self.batch_size = batch_size
+        self.loaded = False
+        self._present = set()
+        self._checked = set()
+        self._lock = threading.Lock()
+
+    def preload(self, client) -> int:
+        """Replace the set with every key currently in the table"""
+        keys = set(iter_table_ids(client, self.table, self.key_column))
+        with self._lock:
+            self._present = keys
+            self._checked = set()
+            self.loaded = True
+        return len(keys)
+
+    def prefetch(self, client, keys) -> None:
+        """Look up keys whose state is unknown, a batch of ids per query"""
+        with self._lock:
+            if self.loaded:
+                return
+            unknown = [k for k in dict.fromkeys(keys) if k not in self._present and k not in self._checked]
+        for start in range(0, len(unknown), self.batch_size):
+            batch = unknown[start:start + self.batch_size]
+            rows = client.table(self.table).select(self.key_column).in_(self.key_column, batch).execute().data or []
+            with self._lock:
+                self._present.update(row[self.key_column] for row in rows)
+                self._checked.update(batch)
+
+    def is_known(self, key) -> bool:
+        """True if membership of key can be answered without a query"""
+        return self.loaded or key in self._present or key in self._checked
+
+    def add(self, key) -> None:
+        with self._lock:
+            self._present.add(key)
+
+    def update(self, keys) -> None:
+        with self._lock:
+            self._present.update(keys)
+
+    def discard(self, key) -> None:
+        with self._lock:
+            self._present.discard(key)
+            self._checked.add(key)
+
+    def clear(self) -> None:
+        """Forget everything (the table was emptied)"""
+        with self._lock:
+            self._present = set()
+            self._checked = set()
+            self.loaded = True
+
+    def __contains__(self, key) -> bool:
+        return key in self._present
+
+    def __len__(self) -> int:
+        return len(self._present)
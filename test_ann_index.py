@@ -0,0 +1,119 @@
+"""
+Test the ANN indexes attached to the v3 ImageIndex
+"""
+
+import threading
+
+import numpy as np
+
+from vector_index import ImageIndex
+from ann_index import ExactIndex, IVFIndex, create_ann_index, compare_with_exact
+
+
+def _clustered_embeddings(n, clusters=16, dim=512, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim)).astype(np.float32)
+    points = centers[rng.integers(0, clusters, size=n)] + 0.3 * rng.normal(size=(n, dim)).astype(np.float32)
+    return points / np.linalg.norm(points, axis=1, keepdims=True)
+
+
+def _fill(index, embeddings):
+    for i, emb in enumerate(embeddings):
+        index[f"f{i}"] = {"name": f"{i}.jpg", "embedding": emb, "objects": [], "colors": [], "folder": "Root"}
+
+
+def test_exact_index_matches_brute_force():
+    """ExactIndex returns the true nearest rows"""
+    print("Testing ExactIndex")
+    index = ImageIndex()
+    embeddings = _clustered_embeddings(200)
+    _fill(index, embeddings)
+    exact = ExactIndex(index)
+    query = embeddings[7]
+    assert exact.search(query, 1)[0] == index.row_of("f7")
+
+
+def test_ivf_index_is_incremental_and_accurate():
+    """IVF trains once enough vectors arrive and keeps high recall"""
+    print("Testing IVFIndex")
+    index = ImageIndex()
+    ivf = create_ann_index(index, "ivf", min_train_size=256, nprobe=8)
+    assert isinstance(ivf, IVFIndex)
+
+    embeddings = _clustered_embeddings(1000)
+    _fill(index, embeddings)
+    assert ivf.wait_for_training(30)
+    assert ivf.centroids is not None
+    assert sum(len(bucket) for bucket in ivf.lists) == len(index)
+
+    report = compare_with_exact(ivf, embeddings[:50], k=10, nprobe=8)
+    print(f"   IVF report: {report}")
+    assert report["recall_at_k"] >= 0.9
+
+    # Deleting / clearing the ImageIndex keeps the IVF lists in sync
+    del index["f0"]
+    assert "f0" not in ivf._assignment
+    index.clear()
+    assert ivf.centroids is None
+
+
+def test_ivf_training_does_not_block_writers_or_searches():
+    """While k-means runs, adds and searches go on; changes made meanwhile are reconciled"""
+    print("Testing background IVF training")
+    index = ImageIndex()
+    ivf = create_ann_index(index, "ivf", min_train_size=256, nprobe=8)
+    assert isinstance(ivf, IVFIndex)
+    gate = threading.Event()
+    kmeans = ivf._kmeans
+    ivf._kmeans = lambda matrix: (gate.wait(10), kmeans(matrix))[1]
+
+    embeddings = _clustered_embeddings(600)
+    _fill(index, embeddings)  # would hang here if training ran under the index lock
+    assert ivf.training and ivf.centroids is None
+    assert compare_with_exact(ivf, embeddings[:10], k=5)["recall_at_k"] == 1.0  # exact until trained
+    del index["f3"]
+    index["f600"] = {"name": "600.jpg", "embedding": embeddings[0], "objects": [], "colors": [], "folder": "Root"}
+
+    gate.set()
+    assert ivf.wait_for_training(30)
+    assert ivf.centroids is not None and ivf.trainings == 1
+    assert "f3" not in ivf._assignment and "f600" in ivf._assignment
+    assert set(ivf._assignment) == set(index.ids)
+    assert sum(len(bucket) for bucket in ivf.lists) == len(index)
+
+
+def test_failed_ivf_training_stops_collecting():
+    """A k-means error leaves the index untrained but no longer collecting changes"""
+    print("Testing failed IVF training")
+    index = ImageIndex()
+    ivf = IVFIndex(index, min_train_size=10_000, background=False)
+    _fill(index, _clustered_embeddings(50))
+
+    def broken_kmeans(matrix):
+        raise MemoryError("k-means ran out of memory")
+    ivf._kmeans = broken_kmeans
+    try:
+        ivf.train()
+    except MemoryError:
+        pass
+    assert ivf.centroids is None and not ivf._collecting and not ivf._changed_while_training
+
+
+def test_ivf_below_training_size_is_exact():
+    """Small collections are answered by brute force"""
+    print("Testing IVFIndex fallback")
+    index = ImageIndex()
+    ivf = create_ann_index(index, "ivf", min_train_size=10_000)
+    embeddings = _clustered_embeddings(100)
+    _fill(index, embeddings)
+    report = compare_with_exact(ivf, embeddings[:20], k=5)
+    assert report["recall_at_k"] == 1.0
+
+
+if __name__ == "__main__":
+    test_exact_index_matches_brute_force()
+    test_ivf_index_is_incremental_and_accurate()
+    test_ivf_training_does_not_block_writers_or_searches()
+    test_failed_ivf_training_stops_collecting()
+    test_ivf_below_training_size_is_exact()
+    print("All ANN index tests passed")
@@ -0,0 +1,73 @@
+"""
+Test the micro-batching encoder with a numpy stand-in for the CLIP forward pass
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from clip_batch_encoder import BatchingEncoder
+
+
+def _recording_encoder(calls, delay=0.0):
+    def encode_batch(items):
+        calls.append(len(items))
+        time.sleep(delay)
+        return np.array([[item, item * 2] for item in items], dtype=np.float32)
+    return encode_batch
+
+
+def test_concurrent_callers_share_batches():
+    """Concurrent single-item calls are coalesced and each caller gets its own row"""
+    print("Testing request coalescing")
+    calls = []
+    encoder = BatchingEncoder(_recording_encoder(calls, delay=0.01), max_batch_size=8, max_wait=0.05)
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        rows = list(pool.map(encoder.encode, range(64)))
+    encoder.close()
+    assert [row.tolist() for row in rows] == [[i, i * 2] for i in range(64)]
+    assert sum(calls) == 64 and max(calls) == 8
+    assert len(calls) < 64 / 2 and encoder.stats()["avg_batch_size"] > 2
+
+
+def test_time_window_flushes_partial_batch():
+    """A lone request is not held longer than the wait window"""
+    print("Testing batch time window")
+    calls = []
+    encoder = BatchingEncoder(_recording_encoder(calls), max_batch_size=32, max_wait=0.02)
+    start = time.monotonic()
+    assert encoder.encode(3).tolist() == [3, 6]
+    assert time.monotonic() - start < 1.0 and calls == [1]
+    encoder.close()
+
+
+def test_errors_reach_every_caller_and_encode_many():
+    """A failing batch raises in each caller; encode_many batches in order without the worker"""
+    print("Testing error routing and encode_many")
+
+    def failing(items):
+        raise RuntimeError("model crashed")
+
+    encoder = BatchingEncoder(failing, max_batch_size=4, max_wait=0.05)
+    futures = [encoder.submit(i) for i in range(3)]
+    for future in futures:
+        try:
+            future.result(timeout=5)
+            assert False, "expected the batch error"
+        except RuntimeError as e:
+            assert "model crashed" in str(e)
+    encoder.close()
+
+    calls = []
+    encoder = BatchingEncoder(_recording_encoder(calls), max_batch_size=4)
+    rows = encoder.encode_many(list(range(10)))
+    assert calls == [4, 4, 2] and [row[0] for row in rows] == list(range(10))
+    assert encoder._worker is None  # no background thread needed
+
+
+if __name__ == "__main__":
+    test_concurrent_callers_share_batches()
+    test_time_window_flushes_partial_batch()
+    test_errors_reach_every_caller_and_encode_many()
+    print("All CLIP batch encoder tests passed")
@@ -0,0 +1,239 @@
+"""
+Test the concurrent breadth-first Drive crawler against an in-memory folder tree
+"""
+
+import os
+import tempfile
+import threading
+import time
+
+from drive_crawler import (DriveCrawler, FOLDER_MIME_TYPE, iter_folder_pages, collect_drive_changes,
+                           load_change_token, save_change_token)
+
+
+def _tree(folders=6, images_per_folder=5):
+    """root -> f0..f{folders-1}, each with a nested subfolder; every folder holds images"""
+    children = {"root": [{"id": f"f{i}", "name": f"Folder {i}"} for i in range(folders)]}
+    for i in range(folders):
+        children[f"f{i}"] = [{"id": f"f{i}s", "name": "Sub"}]
+        children[f"f{i}s"] = []
+    images = {}
+    for folder_id in children:
+        images[folder_id] = [{"id": f"{folder_id}-img{j}", "name": f"{folder_id}_{j}.jpg"} for j in range(images_per_folder)]
+    images["f1"].append({"id": "f1-backup", "name": "גיבוי Samsung 001.jpg"})
+    return children, images
+
+
+def _lister(children, images, delay=0.0, page_size=2):
+    """Yields (images, subfolders) pages like iter_folder_pages"""
+    def lister(service, folder_id):
+        entries = [("image", f) for f in images.get(folder_id, [])] + [("folder", f) for f in children.get(folder_id, [])]
+        for start in range(0, max(1, len(entries)), page_size):
+            time.sleep(delay)
+            page = entries[start:start + page_size]
+            yield [f for kind, f in page if kind == "image"], [f for kind, f in page if kind == "folder"]
+    return lister
+
+
+def test_crawls_every_folder_once_with_paths():
+    """All images are processed exactly once with the right folder paths; backups are skipped"""
+    print("Testing full concurrent crawl")
+    children, images = _tree()
+    indexed = {}
+    lock = threading.Lock()
+
+    def process(service, file, folder_id, folder_path):
+        with lock:
+            assert file["id"] not in indexed
+            indexed[file["id"]] = folder_path
+        return True
+
+    crawler = DriveCrawler(None, process, lister=_lister(children, images, delay=0.01),
+                           list_workers=3, process_workers=3)
+    stats = crawler.crawl("root", "Root")
+    assert stats["folders"] == 13
+    assert stats["skipped_backup"] == 1 and "f1-backup" not in indexed
+    assert len(indexed) == 13 * 5 == stats["indexed"]
+    assert indexed["f2-img0"] == "Folder 2" and indexed["f2s-img0"] == "Folder 2/Sub"
+    assert indexed["root-img0"] == "Root"
+    assert crawler._in_flight == 0  # no budget, no in-flight bookkeeping
+
+
+def test_max_images_is_exact_and_skips_indexed():
+    """Already indexed images are skipped and max_images is never overshot, even with failures"""
+    print("Testing max_images semantics")
+    children, images = _tree()
+    index = set(["root-img0", "root-img1"])
+    lock = threading.Lock()
+
+    def process(service, file, folder_id, folder_path):
+        time.sleep(0.002)
+        if file["id"].endswith("img3"):
+            return False  # failed downloads do not count towards the limit
+        with lock:
+            index.add(file["id"])
+        return True
+
+    crawler = DriveCrawler(None, process, is_indexed=lambda fid: fid in {"root-img0", "root-img1"},
+                           current_count=lambda: len(index), max_images=20,
+                           lister=_lister(children, images), list_workers=4, process_workers=4)
+    stats = crawler.crawl("root", "Root")
+    assert len(index) == 20
+    assert stats["skipped_indexed"] == 2 and stats["indexed"] == 18
+
+
+def test_prefetch_indexed_once_per_page():
+    """The bulk indexed-check sees every non-backup image before it is dispatched"""
+    print("Testing indexed prefetch hook")
+    children, images = _tree(folders=2, images_per_folder=3)
+    prefetched = []
+    known = {}
+
+    def prefetch(file_ids):
+        prefetched.append(file_ids)
+        known.update((fid, fid.endswith("img0")) for fid in file_ids)
+
+    crawler = DriveCrawler(None, lambda *args: True, is_indexed=lambda fid: known[fid],
+                           prefetch_indexed=prefetch, lister=_lister(children, images))
+    stats = crawler.crawl("root", "Root")
+    assert sorted(fid for page in prefetched for fid in page) == sorted(known)
+    assert len(known) == 5 * 3 and "f1-backup" not in known
+    assert stats["skipped_indexed"] == 5 and stats["indexed"] == 10
+
+
+class _FakeFiles:
+    """files().list(...) of the Drive API, paging a fixed folder listing"""
+
+    def __init__(self, entries, calls):
+        self.entries = entries
+        self.calls = calls
+
+    def list(self, q, fields, pageSize, pageToken=None):
+        self.calls.append({"q": q, "fields": fields, "pageToken": pageToken})
+        start = int(pageToken or 0)
+        page = {"files": self.entries[start:start + pageSize]}
+        if start + pageSize < len(self.entries):
+            page["nextPageToken"] = str(start + pageSize)
+        return type("Request", (), {"execute": lambda _: page})()
+
+
+def test_iter_folder_pages_follows_page_tokens():
+    """Folders larger than one page are listed completely with a single combined query"""
+    print("Testing paged folder listing")
+    entries = [{"id": f"img{i}", "name": f"{i}.jpg", "mimeType": "image/jpeg"} for i in range(2500)]
+    entries.insert(1200, {"id": "sub", "name": "Sub", "mimeType": FOLDER_MIME_TYPE})
+    calls = []
+    service = type("Service", (), {"files": lambda _: _FakeFiles(entries, calls)})()
+
+    pages = list(iter_folder_pages(service, "folder1"))
+    assert len(pages) == 3 and len(calls) == 3
+    assert sum(len(images) for images, _ in pages) == 2500
+    assert [f["id"] for _, folders in pages for f in folders] == ["sub"]
+    assert "nextPageToken" in calls[0]["fields"] and "mimeType" in calls[0]["q"] and FOLDER_MIME_TYPE in calls[0]["q"]
+
+
+class _FakeDrive:
+    """files().get plus changes().getStartPageToken/list of the Drive API over an in-memory change log"""
+
+    def __init__(self, folders, changes):
+        self.folders = folders
+        self.change_log = changes
+        self.gets = []
+
+    def _request(self, result):
+        return type("Request", (), {"execute": lambda _: result})()
+
+    def files(self):
+        drive = self
+
+        class Files:
+            def get(self, fileId, fields, supportsAllDrives=True):
+                drive.gets.append(fileId)
+                if fileId not in drive.folders:
+                    raise KeyError(fileId)  # like an HttpError 404
+                return drive._request(dict(drive.folders[fileId], id=fileId))
+        return Files()
+
+    def changes(self):
+        drive = self
+
+        class Changes:
+            def getStartPageToken(self, supportsAllDrives=True):
+                return drive._request({"startPageToken": str(len(drive.change_log))})
+
+            def list(self, pageToken, fields, pageSize, **kwargs):
+                start = int(pageToken)
+                page = {"changes": drive.change_log[start:start + pageSize]}
+                if start + pageSize < len(drive.change_log):
+                    page["nextPageToken"] = str(start + pageSize)
+                else:
+                    page["newStartPageToken"] = str(len(drive.change_log))
+                return drive._request(page)
+        return Changes()
+
+
+def _image_change(file_id, name, parent, trashed=False):
+    return {"fileId": file_id, "removed": False,
+            "file": {"id": file_id, "name": name, "mimeType": "image/jpeg", "parents": [parent], "trashed": trashed}}
+
+
+def test_changes_feed_becomes_adds_updates_and_deletes():
+    """Changes under the root are classified; outside, trashed, removed and backup files are deleted"""
+    print("Testing Drive changes feed")
+    folders = {
+        "A": {"name": "Kitchens", "parents": ["root"]},
+        "B": {"name": "Lofts", "parents": ["root"]},
+        "X": {"name": "Elsewhere", "parents": ["other-root"]},
+        "D": {"name": "Old", "parents": ["root"], "trashed": True},
+    }
+    log = [
+        _image_change("new1", "new1.jpg", "A"),
+        _image_change("mod1", "mod1.jpg", "B"),
+        _image_change("gone1", "gone1.jpg", "A", trashed=True),
+        {"fileId": "removed1", "removed": True},
+        _image_change("moved-out", "moved.jpg", "X"),
+        _image_change("backup1", "גיבוי Samsung 7.jpg", "A"),
+        {"fileId": "doc1", "removed": False,
+         "file": {"id": "doc1", "name": "brief.pdf", "mimeType": "application/pdf", "parents": ["A"]}},
+        {"fileId": "C", "removed": False,
+         "file": {"id": "C", "name": "Moved In", "mimeType": FOLDER_MIME_TYPE, "parents": ["A"]}},
+        _image_change("inC", "c.jpg", "C"),
+        {"fileId": "D", "removed": False,
+         "file": {"id": "D", "name": "Old", "mimeType": FOLDER_MIME_TYPE, "parents": ["root"], "trashed": True}},
+        _image_change("flip", "flip.jpg", "B", trashed=True),
+        _image_change("flip", "flip.jpg", "B"),  # restored later: the last change wins
+    ]
+    drive = _FakeDrive(folders, log)
+
+    changes, token = collect_drive_changes(drive, "0", "root", "Shared", page_size=3)
+    assert token == str(len(log))
+    assert sorted(changes.upserts) == ["flip", "mod1", "new1"]
+    assert changes.upserts["new1"][1:] == ("A", "Shared/Kitchens")
+    assert changes.deletes == {"gone1", "removed1", "moved-out", "backup1"}
+    assert changes.folders_to_crawl == {"C": "Shared/Kitchens/Moved In"}  # and "inC" comes with that crawl
+    assert changes.removed_folder_paths == {"Shared/Old"}
+    assert drive.gets.count("A") == 1  # folder lookups are cached
+
+    # Nothing new since the returned token
+    again, same_token = collect_drive_changes(drive, token, "root", "Shared")
+    assert len(again) == 0 and same_token == token
+
+
+def test_change_token_roundtrip():
+    print("Testing change token persistence")
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "token.json")
+        assert load_change_token(path, "root") is None
+        save_change_token(path, "root", "1234")
+        assert load_change_token(path, "root") == "1234"
+        assert load_change_token(path, "another-root") is None
+
+
+if __name__ == "__main__":
+    test_crawls_every_folder_once_with_paths()
+    test_max_images_is_exact_and_skips_indexed()
+    test_prefetch_indexed_once_per_page()
+    test_iter_folder_pages_follows_page_tokens()
+    test_changes_feed_becomes_adds_updates_and_deletes()
+    test_change_token_roundtrip()
+    print("All Drive crawler tests passed")
@@ -0,0 +1,146 @@
+"""
+Test the write-behind upsert buffer against an in-memory Supabase table
+"""
+
+import threading
+import time
+
+from embedding_writer import BufferedUpserter
+
+
+class _FakeTable:
+    """client.table(name).upsert(rows, on_conflict).execute() with optional injected failures"""
+
+    def __init__(self, failures=0, delay=0.0, reject=None):
+        self.rows = {}
+        self.batches = []
+        self.failures = failures
+        self.delay = delay
+        self.reject = reject  # rows the table always refuses (e.g. a wrong vector dimension)
+        self.lock = threading.Lock()
+
+    def table(self, name):
+        return self
+
+    def upsert(self, rows, on_conflict):
+        keys = [row[on_conflict] for row in rows]
+        assert len(keys) == len(set(keys)), "Postgres rejects duplicate keys in one upsert"
+
+        def execute():
+            time.sleep(self.delay)
+            with self.lock:
+                if self.failures:
+                    self.failures -= 1
+                    raise ConnectionError("503 Service Unavailable")
+                if self.reject and any(self.reject(row) for row in rows):
+                    raise ValueError("expected 512 dimensions")
+                self.batches.append(len(rows))
+                self.rows.update((row[on_conflict], row) for row in rows)
+        return type("Request", (), {"execute": lambda _: execute()})()
+
+
+def _row(i, version=0):
+    return {"file_id": f"f{i}", "embedding": [float(i)] * 4, "version": version}
+
+
+def test_rows_are_flushed_in_batches():
+    """Rows flush in batch_size upserts; flush() waits for the tail; duplicates collapse"""
+    print("Testing batched upserts")
+    client = _FakeTable()
+    flushed = []
+    writer = BufferedUpserter(client, "image_embeddings", batch_size=10, max_age=60,
+                              on_flushed=lambda rows: flushed.extend(row["file_id"] for row in rows))
+    for i in range(25):
+        writer.put(_row(i))
+    writer.put(_row(24, version=1))
+    assert writer.flush(timeout=5)
+    assert len(client.rows) == 25 and client.rows["f24"]["version"] == 1
+    assert sum(client.batches) == 25 and max(client.batches) == 10 and len(client.batches) <= 3
+    assert sorted(flushed) == sorted(client.rows)
+    stats = writer.stats()
+    assert stats["queue_depth"] == 0 and stats["flushed_rows"] == 25 and stats["queued_total"] == 26
+    writer.close()
+
+
+def test_age_triggers_flush_and_put_does_not_block():
+    """A partial batch is written once its oldest row reaches max_age; put returns immediately"""
+    print("Testing age-based flush")
+    client = _FakeTable(delay=0.2)
+    writer = BufferedUpserter(client, "image_embeddings", batch_size=100, max_age=0.05)
+    start = time.monotonic()
+    for i in range(5):
+        writer.put(_row(i))
+    assert time.monotonic() - start < 0.1  # no network round-trip per row
+    deadline = time.monotonic() + 5
+    while len(client.rows) < 5 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert len(client.rows) == 5 and client.batches == [5]
+    writer.close()
+
+
+def test_retries_with_backoff_then_reports_failures():
+    """Transient errors are retried; persistent ones are reported by key, and close() drains"""
+    print("Testing retry and failure reporting")
+    client = _FakeTable(failures=2)
+    writer = BufferedUpserter(client, "image_embeddings", batch_size=3, max_age=60, backoff=0.01, max_retries=3)
+    for i in range(3):
+        writer.put(_row(i))
+    assert writer.flush(timeout=5)
+    assert len(client.rows) == 3 and writer.stats()["retries"] == 2
+
+    failed = []
+    client.failures = 100
+    writer = BufferedUpserter(client, "image_embeddings", batch_size=2, max_age=60, backoff=0.001, max_retries=1,
+                              on_failed=lambda rows, error: failed.extend(row["file_id"] for row in rows))
+    writer.put(_row(7))
+    writer.close(timeout=5)
+    assert failed == ["f7"] and writer.stats()["failed_rows"] == 1
+    try:
+        writer.put(_row(8))
+        assert False, "expected RuntimeError after close"
+    except RuntimeError:
+        pass
+
+
+def test_bad_rows_are_isolated_from_their_batch():
+    """A batch that keeps failing is split so only the rows that fail on their own are reported"""
+    print("Testing failing batch bisection")
+    client = _FakeTable(reject=lambda row: row["file_id"] in ("f3", "f6"))
+    stored, failed = [], []
+    writer = BufferedUpserter(client, "image_embeddings", batch_size=8, max_age=60, backoff=0.001, max_retries=1,
+                              on_flushed=lambda rows: stored.extend(row["file_id"] for row in rows),
+                              on_failed=lambda rows, error: failed.extend(row["file_id"] for row in rows))
+    for i in range(8):
+        writer.put(_row(i))
+    assert writer.flush(timeout=5)
+    assert sorted(failed) == ["f3", "f6"]
+    assert sorted(stored) == sorted(client.rows) and len(client.rows) == 6
+    stats = writer.stats()
+    assert stats["failed_rows"] == 2 and stats["flushed_rows"] == 6 and stats["split_batches"] > 0
+    writer.close()
+
+
+def test_key_state_follows_each_row():
+    """A key is pending until its row is written, then stored or failed"""
+    print("Testing per-key write state")
+    client = _FakeTable(reject=lambda row: row["file_id"] == "f1")
+    writer = BufferedUpserter(client, "image_embeddings", batch_size=10, max_age=60, backoff=0.001, max_retries=0)
+    writer.put(_row(0))
+    writer.put(_row(1))
+    assert writer.key_state("f0") == "pending" and writer.key_state("f9") == "stored"
+    assert writer.flush(timeout=5)
+    assert writer.key_state("f0") == "stored" and writer.key_state("f1") == "failed"
+    client.reject = None
+    writer.put(_row(1, version=1))
+    assert writer.flush(timeout=5)
+    assert writer.key_state("f1") == "stored"
+    writer.close()
+
+
+if __name__ == "__main__":
+    test_rows_are_flushed_in_batches()
+    test_age_triggers_flush_and_put_does_not_block()
+    test_retries_with_backoff_then_reports_failures()
+    test_bad_rows_are_isolated_from_their_batch()
+    test_key_state_follows_each_row()
+    print("All embedding writer tests passed")
@@ -0,0 +1,75 @@
+"""
+Test the checksum-keyed feature cache (round trip, versioning, eviction)
+"""
+
+import numpy as np
+
+from feature_cache import FeatureCache
+
+
+def _features(seed):
+    return {
+        "embedding": np.random.default_rng(seed).normal(size=(1, 512)).astype(np.float32),
+        "objects": ["bed", "lamp"],
+        "colors": [[240, 230, 220], [30, 30, 30]],
+        "room_type": "bedroom",
+        "ocr_text": "חדר שינה",
+    }
+
+
+def test_round_trip_and_version(tmp_path):
+    """Features come back unchanged; another feature version is a miss"""
+    print("Testing feature cache round trip")
+    path = str(tmp_path / "features.sqlite")
+    cache = FeatureCache(path, version="clip-a")
+    assert cache.get("abc") is None and cache.get(None) is None
+    assert cache.put("abc", _features(1))
+
+    cached = cache.get("abc")
+    assert cached is not None
+    np.testing.assert_array_equal(cached["embedding"], _features(1)["embedding"])
+    assert cached["embedding"].dtype == np.float32 and cached["embedding"].shape == (1, 512)
+    assert cached["objects"] == ["bed", "lamp"] and cached["ocr_text"] == "חדר שינה"
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+    cache.close()
+
+    reopened = FeatureCache(path, version="clip-a")
+    cached = reopened.get("abc")
+    assert cached is not None and cached["room_type"] == "bedroom"
+    reopened.close()
+
+    other = FeatureCache(path, version="clip-b")
+    assert other.get("abc") is None and len(other) == 0
+    other.put("abc", _features(2))
+    assert other.get("abc") is not None
+    other.close()
+
+
+def test_unserializable_values_are_not_cached(tmp_path):
+    print("Testing unserializable features")
+    cache = FeatureCache(str(tmp_path / "features.sqlite"))
+    assert not cache.put("abc", {"phash": b"\x00" * 8})
+    assert cache.get("abc") is None
+
+
+def test_lru_eviction(tmp_path):
+    """With max_entries set, the least recently used entries go first"""
+    print("Testing feature cache eviction")
+    cache = FeatureCache(str(tmp_path / "features.sqlite"), max_entries=3)
+    for i in range(3):
+        cache.put(f"c{i}", {"n": i})
+    assert cache.get("c0") == {"n": 0}  # c0 becomes most recent
+    cache.put("c3", {"n": 3})
+    assert len(cache) == 3
+    assert cache.get("c1") is None
+    assert cache.get("c0") is not None and cache.get("c3") is not None
+
+
+if __name__ == "__main__":
+    import tempfile
+    from pathlib import Path
+
+    for test in (test_round_trip_and_version, test_unserializable_values_are_not_cached, test_lru_eviction):
+        with tempfile.TemporaryDirectory() as directory:
+            test(Path(directory))
+    print("All feature cache tests passed")
@@ -0,0 +1,51 @@
+"""
+Test the compiled single-pass Hebrew -> English phrase translator
+"""
+
+from hebrew_translator import PhraseTranslator
+
+MAPPING = {
+    'חדר שינה': 'bedroom',
+    'חדר': 'room',
+    'חדר שינה ראשי': 'master bedroom',
+    'מטבח': 'kitchen',
+    'שולחן': 'table',
+    'שולחן אוכל': 'dining table',
+    'לבן': 'white',
+}
+
+
+def test_longest_match_wins_regardless_of_order():
+    """Overlapping phrases resolve to the longest match, independent of dict order"""
+    print("Testing longest-match translation")
+    forward = PhraseTranslator(MAPPING)
+    backward = PhraseTranslator(dict(reversed(list(MAPPING.items()))))
+    for translator in (forward, backward):
+        assert translator.translate("חדר שינה ראשי לבן") == "master bedroom white"
+        assert translator.translate("חדר שינה עם שולחן אוכל") == "bedroom עם dining table"
+        assert translator.translate("חדר ומטבח") == "room וkitchen"  # substring semantics, like str.replace
+    assert forward.find("שולחן אוכל במטבח") == [("שולחן אוכל", "dining table"), ("מטבח", "kitchen")]
+
+
+def test_single_pass_does_not_retranslate():
+    """Replacements are never re-scanned"""
+    print("Testing single pass")
+    translator = PhraseTranslator({"a": "b", "b": "c"})
+    assert translator.translate("ab") == "bc"
+
+
+def test_whole_words():
+    """Whole-word mode leaves words that merely contain a phrase alone"""
+    print("Testing whole-word translation")
+    translator = PhraseTranslator(MAPPING, whole_words=True)
+    assert translator.translate("מטבח, חדר שינה") == "kitchen, bedroom"
+    assert translator.translate("במטבח") == "במטבח"
+    assert "מטבח לבן" in translator and "kitchen" not in translator
+    assert PhraseTranslator({}).translate("מטבח") == "מטבח"
+
+
+if __name__ == "__main__":
+    test_longest_match_wins_regardless_of_order()
+    test_single_pass_does_not_retranslate()
+    test_whole_words()
+    print("All Hebrew translator tests passed")
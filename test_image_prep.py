@@ -0,0 +1,70 @@
+"""
+Test decode-once image preparation: draft-mode downscaling, pixel cap and shared buffers
+"""
+
+import io
+
+import numpy as np
+from PIL import Image
+
+from image_prep import ImageTooLargeError, prepare_image
+
+
+def _jpeg(width, height, color=(200, 30, 30)):
+    buffer = io.BytesIO()
+    Image.new("RGB", (width, height), color).save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def test_large_jpeg_is_decoded_at_working_size():
+    """A 12 MP JPEG comes back no larger than max_side, with the original size recorded"""
+    print("Testing draft-mode decode")
+    prepared = prepare_image(_jpeg(4000, 3000), max_side=1600)
+    assert prepared.original_size == (4000, 3000)
+    assert max(prepared.size) == 1600 and prepared.size == (1600, 1200)
+    assert abs(prepared.scale - 0.4) < 1e-6
+    assert prepared.to_original_bbox({"x": 40, "y": 80, "w": 400, "h": 120}) == {"x": 100, "y": 200, "w": 1000, "h": 300}
+
+    small = prepare_image(_jpeg(640, 480), max_side=1600)
+    assert small.size == (640, 480) and small.scale == 1.0
+
+
+def test_pixel_cap_rejects_before_decoding():
+    print("Testing decompression-bomb cap")
+    try:
+        prepare_image(_jpeg(3000, 3000), max_pixels=8_000_000)
+        assert False, "expected ImageTooLargeError"
+    except ImageTooLargeError:
+        pass
+
+
+def test_buffers_are_built_once():
+    """rgb / gray / lab / small_bgr are computed once and shared"""
+    print("Testing shared analyzer buffers")
+    prepared = prepare_image(_jpeg(800, 600, color=(255, 255, 255)))
+    assert prepared.rgb is prepared.rgb and prepared.rgb.shape == (600, 800, 3)
+    assert prepared.gray is prepared.gray and prepared.gray.shape == (600, 800)
+    assert prepared.small_bgr().shape == (100, 100, 3)
+    lab = prepared.lab
+    assert lab.dtype == np.float32 and lab is prepared.lab
+    assert lab[..., 0].mean() > 95  # white -> L close to 100 (skimage scale)
+    prepared.release()
+    assert not prepared._buffers
+
+
+def test_detail_gray_for_ocr():
+    """OCR gets a sharper grayscale than the working image, decoded only on request"""
+    print("Testing OCR detail decode")
+    prepared = prepare_image(_jpeg(4000, 3000), max_side=1600, keep_source=True)
+    assert prepared.detail_gray(2400).shape == (1800, 2400)
+    assert prepared.detail_gray(0).shape == (3000, 4000)  # full resolution
+    assert prepared.detail_gray(1000) is prepared.gray  # never below the working size
+    assert prepare_image(_jpeg(4000, 3000), max_side=1600).detail_gray(2400).shape == (1200, 1600)  # no source kept
+
+
+if __name__ == "__main__":
+    test_large_jpeg_is_decoded_at_working_size()
+    test_pixel_cap_rejects_before_decoding()
+    test_buffers_are_built_once()
+    test_detail_gray_for_ocr()
+    print("All image preparation tests passed")
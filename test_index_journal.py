@@ -0,0 +1,154 @@
+"""
+Test the crawl checkpoint journal: an interrupted crawl resumes without re-listing
+finished folders or re-processing finished images
+"""
+
+import os
+import tempfile
+import threading
+
+from drive_crawler import DriveCrawler
+from index_journal import IndexJournal, load_journal
+
+
+def _tree():
+    """root -> a (-> a1), b, c; three images per folder"""
+    children = {"root": [{"id": "a", "name": "A"}, {"id": "b", "name": "B"}, {"id": "c", "name": "C"}],
+                "a": [{"id": "a1", "name": "A1"}]}
+    folders = ["root", "a", "b", "c", "a1"]
+    images = {folder: [{"id": f"{folder}-{j}", "name": f"{folder}_{j}.jpg"} for j in range(3)] for folder in folders}
+    return children, images
+
+
+def _lister(children, images, broken=(), listed=None):
+    def lister(service, folder_id):
+        if listed is not None:
+            listed.append(folder_id)
+        if folder_id in broken:
+            raise ConnectionError("connection reset")  # the crash hits while this folder is listed
+        yield images.get(folder_id, [])[:2], children.get(folder_id, [])
+        yield images.get(folder_id, [])[2:], []
+    return lister
+
+
+def test_interrupted_crawl_resumes_from_journal():
+    print("Testing crawl resume from the journal")
+    children, images = _tree()
+    processed = {}
+    lock = threading.Lock()
+
+    def process(service, file, folder_id, folder_path):
+        with lock:
+            processed[file["id"]] = processed.get(file["id"], 0) + 1
+        return not file["id"].endswith("-2") or folder_id != "b"  # b-2 fails the first time
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "journal.jsonl")
+        journal = IndexJournal(path, flush_every=2)
+        journal.start("job1", "root", "Root", change_token="42")
+        DriveCrawler(None, process, lister=_lister(children, images, broken={"a"}), journal=journal,
+                     list_workers=2, process_workers=2).crawl("root", "Root")
+        journal.close()  # interrupted: never finished
+
+        state = load_journal(path)
+        assert state is not None
+        assert state.job_id == "job1" and state.change_token == "42" and not state.finished
+        assert state.listed == {"root", "b", "c"}
+        assert state.pending_folders == [("a", "A")]  # a1 was never seen
+        assert [file["id"] for file, _, _ in state.pending_images] == ["b-2"]
+
+        listed = []
+        journal.resume()
+        retry = lambda *args: process(*args) or True  # b-2 succeeds this time
+        stats = DriveCrawler(None, retry,
+                             lister=_lister(children, images, listed=listed), journal=journal,
+                             list_workers=2, process_workers=2).crawl("root", "Root", resume=state)
+        journal.finish()
+        assert sorted(listed) == ["a", "a1"]
+        assert stats["indexed"] == 7  # b-2 + a + a1
+        assert set(processed) == {file["id"] for files in images.values() for file in files}
+        assert processed["b-2"] == 2 and all(count == 1 for fid, count in processed.items() if fid != "b-2")
+
+        final = load_journal(path)
+        assert final is not None
+        assert final.finished and final.status == "completed"
+        assert not final.pending_folders and not final.pending_images
+
+
+def test_torn_last_line_is_ignored():
+    print("Testing torn journal line")
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "journal.jsonl")
+        journal = IndexJournal(path)
+        journal.start("job2", "root", "Root")
+        journal.folder_page("root", "Root", [{"id": "x", "name": "x.jpg"}], [])
+        journal.folder_listed("root")
+        journal.close()
+        with open(path, "a", encoding="utf-8") as f:
+            f.write('{"event": "done", "file_ids": ["x"')  # crash mid-write
+        state = load_journal(path)
+        assert state is not None
+        assert state.summary()["pending_images"] == 1
+        assert load_journal(os.path.join(directory, "missing.jsonl")) is None
+
+
+def _done(path):
+    state = load_journal(path)
+    assert state is not None
+    return state.done
+
+
+def test_files_are_done_only_once_their_rows_are_stored():
+    """Files with a pending row are journaled from the writer callbacks; failed rows stay pending"""
+    print("Testing journal row-state hook")
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "journal.jsonl")
+        rows = {"x0": "pending", "x1": "pending", "x2": "failed"}  # x3: nothing written (e.g. skipped)
+        journal = IndexJournal(path, flush_every=1, row_state=lambda file_id: rows.get(file_id, "stored"))
+        journal.start("job3", "root", "Root")
+        journal.folder_page("root", "Root", [{"id": f"x{i}", "name": f"x{i}.jpg"} for i in range(5)], [])
+        journal.folder_listed("root")
+        for i in range(4):
+            journal.file_done(f"x{i}")  # returns at once, rows or no rows
+        assert _done(path) == {"x3"}
+
+        journal.rows_stored(["x0", "unrelated"])
+        journal.rows_failed(["x1"])
+        assert _done(path) == {"x0", "x3"}
+
+        journal.rows_stored(["x3"])  # reported after file_done already saw it stored: no duplicate
+        journal.close()
+        state = load_journal(path)
+        assert state is not None
+        assert [file["id"] for file, _, _ in state.pending_images] == ["x1", "x2", "x4"]
+        assert state.failures == {"x1": 1, "x2": 1}
+
+
+def test_files_failing_too_often_are_given_up():
+    """A file that failed max_attempts times is not retried by the next resume"""
+    print("Testing journal retry cap")
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "journal.jsonl")
+        journal = IndexJournal(path)
+        journal.start("job4", "root", "Root")
+        journal.folder_page("root", "Root", [{"id": "bad", "name": "bad.jpg"}, {"id": "ok", "name": "ok.jpg"}], [])
+        journal.folder_listed("root")
+        for _ in range(2):
+            journal.file_failed("bad")
+        journal.file_failed("ok")
+        journal.close()
+
+        state = load_journal(path, max_attempts=2)
+        assert state is not None
+        assert [file["id"] for file, _, _ in state.pending_images] == ["ok"]
+        assert state.given_up == ["bad"] and state.summary()["files_given_up"] == 1
+        retry = load_journal(path, max_attempts=3)
+        assert retry is not None and len(retry.pending_images) == 2
+
+
+if __name__ == "__main__":
+    test_interrupted_crawl_resumes_from_journal()
+    test_torn_last_line_is_ignored()
+    test_files_are_done_only_once_their_rows_are_stored()
+    test_files_failing_too_often_are_given_up()
+    print("All index journal tests passed")
@@ -0,0 +1,89 @@
+"""
+Test the memory-mapped ImageIndex snapshot used for fast v3 cold starts
+"""
+
+import numpy as np
+
+from vector_index import ImageIndex
+from ann_index import IVFIndex, create_ann_index
+from index_snapshot import save_index_snapshot, load_index_snapshot
+
+
+def _unit(seed, dim=512):
+    vec = np.random.default_rng(seed).normal(size=dim).astype(np.float32)
+    return vec / np.linalg.norm(vec)
+
+
+def _entry(seed, **extra):
+    entry = {
+        "name": f"תמונה_{seed}.jpg",
+        "embedding": _unit(seed),
+        "objects": ["sink", "oven"] if seed % 2 else ["bed"],
+        "colors": [(seed, 0, 255)],
+        "folder": f"folder_{seed % 3}",
+        "ocr_text": "Menu" if seed == 4 else "",
+        "room_type": "kitchen" if seed % 2 else "bedroom",
+    }
+    entry.update(extra)
+    return entry
+
+
+def test_snapshot_round_trip(tmp_path):
+    """A restored index is searchable, memory-mapped and keeps every column"""
+    print("Testing index snapshot round trip")
+    index = ImageIndex()
+    for i in range(20):
+        index[f"f{i}"] = _entry(i)
+    index["uploaded_1"] = _entry(99, is_uploaded=True, image_data=b"...")
+    stamp = save_index_snapshot(index, str(tmp_path), model_name="clip-a", synced_at="2025-01-01T00:00:00")
+    assert stamp is not None
+    assert stamp["count"] == 20 and stamp["synced_at"] == "2025-01-01T00:00:00"
+
+    restored = ImageIndex()
+    ann = create_ann_index(restored, "ivf", min_train_size=8)
+    assert isinstance(ann, IVFIndex)
+    loaded = load_index_snapshot(restored, str(tmp_path), model_name="clip-a")
+    assert loaded is not None
+    assert loaded["snapshot_id"] == stamp["snapshot_id"]
+    assert len(restored) == 20 and "uploaded_1" not in restored
+    assert isinstance(restored.matrix.base, np.memmap) or isinstance(restored.matrix, np.memmap)
+
+    query = _unit(1000)
+    np.testing.assert_allclose(restored.similarities(query)[[restored.row_of(f) for f in index.ids[:20]]],
+                               index.similarities(query)[:20], rtol=1e-6)
+    assert restored["f3"]["name"] == "תמונה_3.jpg" and "embedding" not in restored["f3"]
+    assert list(restored.label_overlap({"sink"})) == list(index.label_overlap({"sink"})[:20])
+    np.testing.assert_allclose(restored.color_scores([[0, 0, 255]]), index.color_scores([[0, 0, 255]])[:20])
+    assert ann.wait_for_training(30)  # retrained in the background after the bulk load
+    assert ann.centroids is not None and sum(len(b) for b in ann.lists) == 20
+
+    # Updates after the restore go to private memory, never back to the snapshot file
+    restored["f0"] = _entry(500)
+    restored["f_new"] = _entry(501)
+    del restored["f1"]
+    again = ImageIndex()
+    load_index_snapshot(again, str(tmp_path), model_name="clip-a")
+    np.testing.assert_allclose(again.embedding_of("f0"), _unit(0))
+    assert "f1" in again and "f_new" not in again
+
+
+def test_snapshot_rejects_other_model(tmp_path):
+    """Snapshots built with another CLIP model are ignored"""
+    print("Testing index snapshot model check")
+    index = ImageIndex()
+    index["f0"] = _entry(0)
+    save_index_snapshot(index, str(tmp_path), model_name="clip-a")
+    assert load_index_snapshot(ImageIndex(), str(tmp_path), model_name="clip-b") is None
+    assert load_index_snapshot(ImageIndex(), str(tmp_path), model_name="clip-a") is not None
+    assert load_index_snapshot(ImageIndex(), str(tmp_path / "missing")) is None
+
+
+if __name__ == "__main__":
+    import pathlib
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as tmp:
+        test_snapshot_round_trip(pathlib.Path(tmp))
+    with tempfile.TemporaryDirectory() as tmp:
+        test_snapshot_rejects_other_model(pathlib.Path(tmp))
+    print("All index snapshot tests passed")
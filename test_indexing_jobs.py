@@ -0,0 +1,161 @@
+"""
+Test the indexing job subsystem: pause / resume / cancel of a staged pipeline,
+per-stage latency, error counts, throughput / ETA and crawler progress reporting
+"""
+
+import threading
+import time
+
+from drive_crawler import DriveCrawler
+from indexing_jobs import IndexingJob, JobCancelled, JobManager
+from indexing_pipeline import IndexingPipeline, PipelineStage
+
+
+def test_pause_resume_and_cancel_a_pipeline():
+    """Paused stages hold records, resume releases them, cancel drops what is left"""
+    print("Testing pause / resume / cancel")
+    job = IndexingJob()
+    job.status = "running"
+    processed = []
+    lock = threading.Lock()
+
+    def persist(record):
+        with lock:
+            processed.append(record)
+        return record
+
+    with IndexingPipeline([PipelineStage("persist", job.stage("persist", persist), workers=2)],
+                          queue_size=64) as pipeline:
+        assert job.pause() and job.paused and not job.pause()
+        futures = [pipeline.submit(i) for i in range(10)]
+        time.sleep(0.05)
+        assert processed == []  # nothing runs while paused
+
+        assert job.resume()
+        assert [future.result(timeout=2) for future in futures] == list(range(10))
+
+        job.pause()
+        held = [pipeline.submit(i) for i in range(10, 15)]
+        assert job.cancel() and job.status == "cancelling"
+        assert [future.result(timeout=2) for future in held] == [None] * 5  # dropped, not processed
+    assert sorted(processed) == list(range(10))
+    try:
+        job.checkpoint()
+        assert False, "checkpoint must raise once cancelled"
+    except JobCancelled:
+        pass
+
+
+def test_stage_latency_errors_and_eta():
+    print("Testing job metrics")
+    job = IndexingJob(window=60)
+    job.status = "running"
+    job._start_time = time.monotonic() - 10  # ten active seconds
+
+    def decode(record):
+        time.sleep(0.01)
+        if record == "bad":
+            raise ValueError("corrupt image")
+        return record
+
+    wrapped = job.stage("decode", decode)
+    assert wrapped("ok") == "ok"
+    try:
+        wrapped("bad")
+    except ValueError:
+        pass
+    with job.timed("clip"):
+        pass
+    job.record_error("download", ConnectionError("reset"))
+
+    # 2 of 4 folders listed with 40 images between them, 20 images finished
+    job.folders_queued(4)
+    job.folder_listed()
+    job.folder_listed()
+    job.images_listed(40)
+    for _ in range(15):
+        job.image_done("indexed")
+    for _ in range(5):
+        job.image_done("skipped")
+
+    status = job.status_dict()
+    assert status["stages"]["decode"]["count"] == 2 and status["stages"]["decode"]["avg_ms"] >= 10
+    assert status["stages"]["clip"]["count"] == 1
+    assert status["errors"]["by_class"] == {"ValueError": 1, "ConnectionError": 1}
+    assert status["errors"]["by_stage"] == {"decode": 1, "download": 1}
+    assert status["folders"]["pending"] == 2
+    assert status["images"]["done"] == 20
+    assert status["images"]["remaining_estimate"] == 20 + 2 * 20  # unfinished + pending folders x 20 per folder
+    assert abs(status["throughput"]["images_per_sec"] - 2.0) < 0.1
+    assert 28 <= status["eta_seconds"] <= 32  # 60 images at ~2/s
+
+    job.cancel()
+    job.image_done("failed")  # failures after a cancel are cancellations
+    assert job.status_dict()["images"]["cancelled"] == 1
+
+
+def test_manager_runs_one_job_at_a_time():
+    print("Testing job manager")
+    manager = JobManager(history=2)
+    release = threading.Event()
+
+    def target(job, value):
+        release.wait(2)
+        job.checkpoint()
+        return {"value": value}
+
+    job, started = manager.start(target, 1, kind="full")
+    assert started and manager.active() is job
+    again, started = manager.start(target, 2)
+    assert not started and again is job
+
+    release.set()
+    for _ in range(200):
+        if job.status == "completed":
+            break
+        time.sleep(0.01)
+    assert job.status == "completed" and job.result == {"value": 1}
+    assert manager.active() is None
+
+    release.clear()
+    cancelled, started = manager.start(target, 3, kind="incremental")
+    assert started and cancelled.cancel()
+    release.set()
+    for _ in range(200):
+        if cancelled.status == "cancelled":
+            break
+        time.sleep(0.01)
+    assert cancelled.status == "cancelled" and cancelled.result is None
+    assert [entry["job_id"] for entry in manager.list()] == [cancelled.job_id, job.job_id]
+    assert manager.get(job.job_id) is job and manager.get("missing") is None
+
+
+def test_crawler_reports_progress_to_the_job():
+    print("Testing crawler progress reporting")
+    children = {"root": [{"id": "a", "name": "A"}, {"id": "b", "name": "B"}]}
+    images = {folder: [{"id": f"{folder}-{j}", "name": f"{folder}_{j}.jpg"} for j in range(4)]
+              for folder in ("root", "a", "b")}
+    images["a"].append({"id": "a-backup", "name": "גיבוי Samsung 002.jpg"})
+
+    def lister(service, folder_id):
+        yield images.get(folder_id, []), children.get(folder_id, [])
+
+    job = IndexingJob()
+    job.status = "running"
+    stats = DriveCrawler(None, lambda service, file, folder_id, folder_path: not file["id"].endswith("-3"),
+                         lister=lister, job=job, list_workers=2, process_workers=2).crawl("root", "Root")
+    status = job.status_dict()
+    assert stats["indexed"] == 9 and stats["failed"] == 3
+    assert status["folders"] == {"queued": 3, "listed": 3, "pending": 0}
+    assert status["images"]["listed"] == 13
+    assert status["images"]["indexed"] == 9 and status["images"]["failed"] == 3
+    assert status["images"]["skipped"] == 1  # the backup file
+    assert status["images"]["remaining_estimate"] == 0
+
+
+if __name__ == "__main__":
+    test_pause_resume_and_cancel_a_pipeline()
+    test_stage_latency_errors_and_eta()
+    test_manager_runs_one_job_at_a_time()
+    test_crawler_reports_progress_to_the_job()
+    print("All indexing job tests passed")
@@ -0,0 +1,91 @@
+"""
+Test the staged indexing pipeline: routing, drops/failures and bounded memory
+"""
+
+import threading
+import time
+
+from indexing_pipeline import IndexingPipeline, PipelineStage
+
+
+def test_records_flow_through_all_stages():
+    """Each future resolves to its own record's final result; drops and failures are routed back"""
+    print("Testing stage routing")
+
+    def decode(record):
+        if record % 7 == 0:
+            return None  # e.g. duplicate image
+        if record % 11 == 0:
+            raise ValueError(f"corrupt image {record}")
+        return record * 10
+
+    stages = [
+        PipelineStage("download", lambda r: (time.sleep(0.002), r)[1], workers=4),
+        PipelineStage("decode", decode, workers=2),
+        PipelineStage("infer", lambda r: r + 1, workers=2),
+        PipelineStage("persist", lambda r: {"stored": r}, workers=3),
+    ]
+    with IndexingPipeline(stages, queue_size=4) as pipeline:
+        futures = {i: pipeline.submit(i) for i in range(1, 60)}
+    for i, future in futures.items():
+        if i % 7 == 0:
+            assert future.result() is None
+        elif i % 11 == 0:
+            assert isinstance(future.exception(), ValueError)
+        else:
+            assert future.result() == {"stored": i * 10 + 1}
+
+    stats = pipeline.stats()
+    assert stats["submitted"] == 59 and stats["closed"]
+    assert stats["stages"]["download"]["processed"] == 59
+    assert stats["stages"]["decode"]["dropped"] == 8 and stats["stages"]["decode"]["failed"] == 5
+    assert stats["stages"]["persist"]["processed"] == 59 - 8 - 5
+    assert not any(t.is_alive() for t in pipeline._threads)
+
+
+def test_backpressure_bounds_records_in_flight():
+    """A slow last stage throttles submit, so the pipeline never holds more than its queues and workers"""
+    print("Testing backpressure")
+    lock = threading.Lock()
+    live = {"now": 0, "peak": 0}
+
+    def download(record):
+        with lock:
+            live["now"] += 1
+            live["peak"] = max(live["peak"], live["now"])
+        return record
+
+    def persist(record):
+        time.sleep(0.005)
+        with lock:
+            live["now"] -= 1
+        return record
+
+    stages = [PipelineStage("download", download, workers=4),
+              PipelineStage("decode", lambda r: r, workers=1),
+              PipelineStage("persist", persist, workers=1)]
+    with IndexingPipeline(stages, queue_size=2) as pipeline:
+        for i in range(60):
+            pipeline.submit(i)
+    # Records past download: at most one per worker plus one per queue slot after the first queue
+    assert live["now"] == 0
+    assert live["peak"] <= (4 + 1 + 1) + 2 * 2, live["peak"]
+
+
+def test_submit_after_close_is_rejected():
+    print("Testing closed pipeline")
+    pipeline = IndexingPipeline([PipelineStage("only", lambda r: r)])
+    assert pipeline.submit("a").result(timeout=5) == "a"
+    pipeline.close()
+    try:
+        pipeline.submit("b")
+        assert False, "expected RuntimeError"
+    except RuntimeError:
+        pass
+
+
+if __name__ == "__main__":
+    test_records_flow_through_all_stages()
+    test_backpressure_bounds_records_in_flight()
+    test_submit_after_close_is_rejected()
+    print("All indexing pipeline tests passed")
@@ -0,0 +1,99 @@
+"""
+Test the multi-process model pool with numpy stand-in "models": images cross
+through shared memory, results come back in order, errors propagate
+"""
+
+import os
+import time
+
+import numpy as np
+
+from model_worker_pool import ModelWorkerPool, worker_layout
+
+
+def _numpy_models(scale=1):
+    """Worker loader: per-image channel means and the worker's pid"""
+    return {
+        "mean": lambda images: [image.reshape(-1, 3).mean(axis=0) * scale for image in images],
+        "pid": lambda images: [os.getpid() for _ in images],
+        "fail": lambda images: 1 / 0,
+    }
+
+
+def _images(count, seed=0):
+    rng = np.random.default_rng(seed)
+    return [rng.integers(0, 256, size=(40 + i, 60 + 2 * i, 3), dtype=np.uint8) for i in range(count)]
+
+
+def test_worker_layout():
+    print("Testing worker layout")
+    assert worker_layout(cpu_count=32) == (8, 4)
+    assert worker_layout(cpu_count=2) == (1, 2)
+    assert worker_layout(workers=4, cpu_count=32) == (4, 8)
+    assert worker_layout(threads_per_worker=2, cpu_count=32) == (16, 2)
+    assert worker_layout(workers=3, threads_per_worker=1, cpu_count=32) == (3, 1)
+
+
+def test_images_round_trip_through_worker_processes():
+    print("Testing model pool round trip")
+    pool = ModelWorkerPool(workers=2, threads_per_worker=1, loader=_numpy_models, loader_kwargs={"scale": 2})
+    images = _images(9)
+    try:
+        results = pool.map("mean", images, chunk_size=2)
+        for image, result in zip(images, results):
+            np.testing.assert_allclose(result, image.reshape(-1, 3).mean(axis=0) * 2)
+
+        pids = set(pool.run("pid", images[:1]) + [pid for future in [pool.submit("pid", [image]) for image in images]
+                                                  for pid in future.result()])
+        assert os.getpid() not in pids
+
+        encoder = pool.encoder("mean", max_batch_size=4, max_wait=0.5, convert=lambda row: row.tolist())
+        assert encoder.encode(images[3]) == (images[3].reshape(-1, 3).mean(axis=0) * 2).tolist()
+        assert len(encoder.encode_many(images)) == 9 and encoder.encode_many([]) == []
+
+        # Single submissions are micro-batched: 8 images reach the workers as 2 tasks of 4
+        tasks = pool.stats()["tasks"]
+        futures = [encoder.submit(image) for image in images[:8]]
+        for image, future in zip(images[:8], futures):
+            assert future.result(timeout=30) == (image.reshape(-1, 3).mean(axis=0) * 2).tolist()
+        assert pool.stats()["tasks"] - tasks == 2
+        assert encoder.stats()["batches"] == 3 and encoder.stats()["items"] == 9
+        try:
+            pool.encoder("fail").encode(images[0], timeout=30)
+            assert False, "worker errors must reach single-image callers"
+        except ZeroDivisionError:
+            pass
+        encoder.close()
+        try:
+            pool.run("fail", images[:1])
+            assert False, "worker errors must reach the caller"
+        except ZeroDivisionError:
+            pass
+
+        for _ in range(100):  # failures are counted by a done-callback
+            if pool.stats()["failed"] == 2:
+                break
+            time.sleep(0.01)
+        stats = pool.stats()
+        assert stats["started"] and stats["workers"] == 2 and stats["failed"] == 2
+        assert stats["bytes"] >= sum(image.nbytes for image in images)
+    finally:
+        pool.close()
+
+
+def test_rejects_non_rgb_input_before_starting_workers():
+    print("Testing input validation")
+    pool = ModelWorkerPool(workers=1, loader=_numpy_models)
+    try:
+        pool.submit("mean", [np.zeros((10, 10), np.uint8)])
+        assert False, "grayscale input must be rejected"
+    except ValueError:
+        pass
+    assert not pool.stats()["started"]
+
+
+if __name__ == "__main__":
+    test_worker_layout()
+    test_images_round_trip_through_worker_processes()
+    test_rejects_non_rgb_input_before_starting_workers()
+    print("All model worker pool tests passed")
@@ -0,0 +1,64 @@
+"""
+Test OCR text-presence gating and text clean-up (no tesseract needed)
+"""
+
+import cv2
+import numpy as np
+
+from ocr_engine import OCRPool, clean_ocr_text, has_text, languages_for_script
+
+
+def _photo_without_text(seed=0):
+    """Smooth gradients plus noise, like a wall or floor"""
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:600, 0:800]
+    image = (x / 800 * 120 + y / 600 * 80 + 30).astype(np.float32)
+    image += rng.normal(0, 4, image.shape)
+    return np.clip(image, 0, 255).astype(np.uint8)
+
+
+def _sign_with_text():
+    image = np.full((600, 800), 235, np.uint8)
+    for row, line in enumerate(["KITCHEN ENTRANCE", "OPEN 09:00 - 18:00", "NO PARKING HERE", "EXIT ->"]):
+        cv2.putText(image, line, (40, 120 + row * 90), cv2.FONT_HERSHEY_SIMPLEX, 1.2, 20, 2)
+    return image
+
+
+def test_text_presence_gate():
+    """Printed lines are detected; smooth text-free photos are not"""
+    print("Testing text-presence detector")
+    assert has_text(_sign_with_text())
+    assert not has_text(_photo_without_text())
+    assert not has_text(np.zeros((300, 300), np.uint8))
+
+
+def test_pool_skips_text_free_images_without_tesseract():
+    """Gated images resolve to "" immediately and never start a worker process"""
+    print("Testing OCR gating in the pool")
+    pool = OCRPool(workers=2)
+    assert pool.extract(_photo_without_text(1), detail=lambda: 1 / 0) == ""  # detail is never built
+    assert pool._executor is None
+    assert pool.stats()["skipped_no_text"] == 1 and pool.stats()["recognized"] == 0
+    pool.close()
+
+
+def test_clean_ocr_text():
+    assert clean_ocr_text("  Kitchen\n\nמטבח \r 2 ") == "Kitchen מטבח 2"
+    assert clean_ocr_text(None) == ""
+
+
+def test_detected_script_narrows_configured_languages():
+    print("Testing OSD script -> language packs")
+    assert languages_for_script("Hebrew", "eng+heb") == "heb"
+    assert languages_for_script("Latin", "eng+heb+fra") == "eng+fra"
+    assert languages_for_script("Arabic", "ara+eng") == "ara"
+    assert languages_for_script("Arabic", "eng+heb") == "eng+heb"  # not configured: keep everything
+    assert languages_for_script(None, "deu") == "deu"
+
+
+if __name__ == "__main__":
+    test_text_presence_gate()
+    test_pool_skips_text_free_images_without_tesseract()
+    test_clean_ocr_text()
+    test_detected_script_narrows_configured_languages()
+    print("All OCR engine tests passed")
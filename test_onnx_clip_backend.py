@@ -0,0 +1,57 @@
+"""
+Test the ONNX CLIP backend helpers that do not need a model: normalization,
+the agreement check used as the compatibility gate, and backend selection
+"""
+
+import numpy as np
+
+from onnx_clip_backend import embedding_agreement, load_clip_backend, normalize_rows, onnx_paths, probe_images
+
+
+def test_agreement_of_perturbed_embeddings():
+    """Small perturbations (int8-like noise) keep cosine near 1; unrelated vectors do not"""
+    print("Testing embedding agreement")
+    rng = np.random.default_rng(0)
+    reference = rng.normal(size=(8, 512)).astype(np.float32)
+    rows = normalize_rows(reference)
+    assert np.allclose(np.linalg.norm(rows, axis=1), 1.0, atol=1e-5)
+    assert normalize_rows(np.zeros((1, 4))).tolist() == [[0.0, 0.0, 0.0, 0.0]]
+
+    same = embedding_agreement(reference, reference * 3.0)
+    assert same["min_cosine"] >= 0.9999
+    noisy = embedding_agreement(reference, reference + rng.normal(scale=0.05, size=reference.shape))
+    assert 0.99 < noisy["min_cosine"] <= noisy["mean_cosine"] < 1.0
+    unrelated = embedding_agreement(reference, rng.normal(size=reference.shape))
+    assert unrelated["mean_cosine"] < 0.2
+
+
+def test_probe_images_and_paths():
+    print("Testing probe images and export paths")
+    images = probe_images(count=3, size=64)
+    assert len(images) == 3 and all(image.shape == (64, 64, 3) and image.dtype == np.uint8 for image in images)
+    assert not np.array_equal(images[0], images[1])
+    assert onnx_paths("m")["vision"].endswith("vision.onnx")
+    assert onnx_paths("m", quantized=True)["text"].endswith("text.int8.onnx")
+
+
+def test_backend_selection(tmp_path):
+    """torch means no ONNX backend; unknown names fail loudly; a failed export falls back to torch"""
+    print("Testing backend selection")
+    assert load_clip_backend("torch", "clip", None, None, "unused") is None
+    try:
+        load_clip_backend("tensorrt", "clip", None, None, "unused")
+        assert False, "unknown backends must be rejected"
+    except ValueError:
+        pass
+    assert load_clip_backend("onnx-int8", "clip", None, None, str(tmp_path / "onnx")) is None  # no model to export
+
+
+if __name__ == "__main__":
+    test_agreement_of_perturbed_embeddings()
+    test_probe_images_and_paths()
+    import tempfile
+    from pathlib import Path
+
+    with tempfile.TemporaryDirectory() as directory:
+        test_backend_selection(Path(directory))
+    print("All ONNX CLIP backend tests passed")
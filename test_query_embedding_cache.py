@@ -0,0 +1,71 @@
+"""
+Test the LRU cache of CLIP text-query embeddings
+"""
+
+import numpy as np
+
+from query_embedding_cache import QueryEmbeddingCache
+
+
+def _vec(seed, dim=512):
+    return np.random.default_rng(seed).normal(size=dim).astype(np.float32)
+
+
+def test_hits_misses_and_normalization():
+    """Equivalent queries share one entry and are only computed once"""
+    print("Testing query cache hits/misses")
+    cache = QueryEmbeddingCache(max_entries=8)
+
+    assert cache.get(cache.make_key("Modern  Kitchen", "no people")) is None
+    cache.put(cache.make_key("Modern  Kitchen", "no people"), _vec(1))
+    second = cache.get(cache.make_key("modern kitchen ", "No People"))
+    assert second is not None
+    np.testing.assert_array_equal(second, _vec(1))
+    assert not second.flags.writeable
+
+    assert cache.get(cache.make_key("modern kitchen", "")) is None  # guidelines are part of the key
+    stats = cache.stats()
+    assert stats["hits"] == 1 and stats["misses"] == 2 and stats["entries"] == 1
+
+
+def test_lru_eviction():
+    """The least recently used entry is evicted first"""
+    print("Testing query cache eviction")
+    cache = QueryEmbeddingCache(max_entries=2)
+    cache.put(cache.make_key("a"), _vec(1))
+    cache.put(cache.make_key("b"), _vec(2))
+    assert cache.get(cache.make_key("a")) is not None  # "a" becomes most recent
+    cache.put(cache.make_key("c"), _vec(3))
+    assert cache.get(cache.make_key("b")) is None
+    assert cache.get(cache.make_key("a")) is not None
+    assert cache.get(cache.make_key("c")) is not None
+
+
+def test_persistence_round_trip(tmp_path):
+    """Saved entries are reloaded unless the model or the CLIP backend changed"""
+    print("Testing query cache persistence")
+    path = str(tmp_path / "query_cache.npz")
+    cache = QueryEmbeddingCache(persist_path=path, model_name="clip-a")
+    cache.put(cache.make_key("bathroom", "bright"), _vec(5))
+    assert cache.save()
+
+    reloaded = QueryEmbeddingCache(persist_path=path, model_name="clip-a")
+    np.testing.assert_array_equal(reloaded.get(reloaded.make_key("bathroom", "bright")), _vec(5))
+
+    other_model = QueryEmbeddingCache(persist_path=path, model_name="clip-b")
+    assert other_model.stats()["entries"] == 0
+
+    other_backend = QueryEmbeddingCache(persist_path=path, model_name="clip-a", backend="onnx-int8")
+    assert other_backend.stats()["entries"] == 0
+    assert other_backend.make_key("bathroom", "bright") != cache.make_key("bathroom", "bright")
+
+
+if __name__ == "__main__":
+    import pathlib
+    import tempfile
+
+    test_hits_misses_and_normalization()
+    test_lru_eviction()
+    with tempfile.TemporaryDirectory() as tmp:
+        test_persistence_round_trip(pathlib.Path(tmp))
+    print("All query cache tests passed")
@@ -0,0 +1,167 @@
+"""
+Test keyset pagination of Supabase tables against an in-memory PostgREST-like table
+"""
+
+import re
+
+from supabase_sync import iter_table_pages, iter_table_ids, parse_timestamp, rewind_timestamp, IndexedIdSet
+
+
+class _FakeQuery:
+    """Implements the subset of the supabase-py query builder used by supabase_sync"""
+
+    def __init__(self, table, columns):
+        self.table = table
+        self.columns = columns.split(",")
+        self.predicates = []
+        self.order_by = []
+        self.max_rows = None
+
+    def gt(self, column, value):
+        self.predicates.append(lambda row: row[column] > value)
+        return self
+
+    def eq(self, column, value):
+        self.predicates.append(lambda row: row[column] == value)
+        return self
+
+    def in_(self, column, values):
+        values = set(values)
+        self.predicates.append(lambda row: row[column] in values)
+        return self
+
+    def or_(self, expression):
+        match = re.fullmatch(r'(\w+)\.gt\."(.*)",and\((\w+)\.eq\."(.*)",(\w+)\.gt\."(.*)"\)', expression)
+        assert match is not None, expression
+        column, value, _, _, key_column, key = match.groups()
+        self.predicates.append(lambda row: row[column] > value or (row[column] == value and row[key_column] > key))
+        return self
+
+    def order(self, column):
+        self.order_by.append(column)
+        return self
+
+    def limit(self, count):
+        self.max_rows = count
+        return self
+
+    def execute(self):
+        self.table.requests += 1
+        rows = [row for row in self.table.rows if all(p(row) for p in self.predicates)]
+        rows.sort(key=lambda row: tuple(row[c] for c in self.order_by))
+        rows = rows[:min(self.max_rows or self.table.server_max_rows, self.table.server_max_rows)]
+        return type("Response", (), {"data": [{c: row[c] for c in self.columns} for row in rows]})
+
+
+class _FakeClient:
+    def __init__(self, rows, server_max_rows=1000):
+        self.rows = rows
+        self.server_max_rows = server_max_rows
+        self.requests = 0
+
+    def table(self, name):
+        return self
+
+    def select(self, columns):
+        return _FakeQuery(self, columns)
+
+
+def _rows(n):
+    # Several rows share a timestamp so pages must break ties on file_id
+    return [{"file_id": f"id{i:04d}", "updated_at": f"2025-01-01T00:00:{i // 7:02d}+00:00",
+             "embedding": [float(i)], "folder": "Root" if i % 2 else "Kitchen"} for i in range(n)]
+
+
+def test_pages_cover_table_past_server_limit():
+    """Every row is returned exactly once even beyond the server's max-rows cap"""
+    print("Testing keyset pagination")
+    client = _FakeClient(_rows(230), server_max_rows=100)
+    pages = list(iter_table_pages(client, "image_embeddings", "file_id,updated_at", page_size=50))
+    ids = [row["file_id"] for page in pages for row in page]
+    assert ids == sorted(ids) and len(ids) == len(set(ids)) == 230
+    assert all("embedding" not in row for page in pages for row in page)  # projection
+    assert [len(page) for page in pages] == [50, 50, 50, 50, 30]
+
+    # page_size above the server cap still reaches the end of the table
+    capped = [row for page in iter_table_pages(client, "image_embeddings", "file_id,updated_at", page_size=500)
+              for row in page]
+    assert len(capped) == 230
+
+
+def test_delta_since_high_water_mark():
+    """Only rows changed after `since` are fetched; filters narrow every page"""
+    print("Testing delta sync")
+    rows = _rows(70)
+    client = _FakeClient(rows)
+    since = rows[34]["updated_at"]
+    changed = [row for page in iter_table_pages(client, "image_embeddings", "file_id,updated_at", since=since, page_size=8)
+               for row in page]
+    assert [row["file_id"] for row in changed] == [row["file_id"] for row in rows if row["updated_at"] > since]
+
+    kitchen = [row for page in iter_table_pages(client, "image_embeddings", "file_id,updated_at,folder", page_size=8,
+                                                filters=lambda q: q.eq("folder", "Kitchen"))
+               for row in page]
+    assert len(kitchen) == 35 and all(row["folder"] == "Kitchen" for row in kitchen)
+
+
+def test_overlap_window_rereads_late_commits():
+    """Rewinding the high-water mark re-reads rows stamped just before it (e.g. a late commit)"""
+    print("Testing delta sync overlap window")
+    rows = _rows(70)
+    since = rows[34]["updated_at"]  # 00:00:04
+    assert rewind_timestamp(since, 2) == "2025-01-01T00:00:02+00:00"
+    assert rewind_timestamp(since, 0) == since and rewind_timestamp(None, 2) is None
+    assert rewind_timestamp("not a time", 2) == "not a time"
+    later, earlier = parse_timestamp("2025-01-01T00:00:01.5Z"), parse_timestamp("2025-01-01T00:00:01+00:00")
+    assert later is not None and earlier is not None and later > earlier
+
+    client = _FakeClient(rows)
+    window = [row["file_id"] for page in iter_table_pages(client, "image_embeddings", "file_id,updated_at",
+                                                           since=rewind_timestamp(since, 2), page_size=8)
+              for row in page]
+    assert window == [row["file_id"] for row in rows if row["updated_at"] > "2025-01-01T00:00:02+00:00"]
+    assert len(set(window)) == len(window)
+
+
+def test_iter_table_ids():
+    """Id sweeps page by file_id alone"""
+    print("Testing id sweep")
+    client = _FakeClient(_rows(25))
+    assert list(iter_table_ids(client, "image_embeddings", page_size=10)) == [f"id{i:04d}" for i in range(25)]
+
+
+def test_indexed_id_set_preload_and_batches():
+    """Membership is answered from memory after one sweep or a few batched in_ queries"""
+    print("Testing IndexedIdSet")
+    client = _FakeClient(_rows(40), server_max_rows=1000)
+    candidates = [f"id{i:04d}" for i in range(30, 60)]
+
+    batched = IndexedIdSet("image_embeddings", batch_size=8)
+    batched.prefetch(client, candidates + candidates[:5])
+    assert client.requests == 4  # 30 unique ids, 8 per query
+    assert all(batched.is_known(key) for key in candidates) and not batched.is_known("id0000")
+    assert [key for key in candidates if key in batched] == candidates[:10]
+    batched.prefetch(client, candidates)
+    assert client.requests == 4  # nothing left to look up
+    batched.add("id0055")
+    assert "id0055" in batched
+
+    preloaded = IndexedIdSet("image_embeddings")
+    assert preloaded.preload(client) == 40 and preloaded.loaded
+    requests = client.requests
+    preloaded.prefetch(client, candidates)
+    assert client.requests == requests  # a preloaded set never queries again
+    assert preloaded.is_known("id9999") and "id9999" not in preloaded and "id0039" in preloaded
+    preloaded.discard("id0039")
+    assert "id0039" not in preloaded and len(preloaded) == 39
+    preloaded.clear()
+    assert len(preloaded) == 0 and preloaded.is_known("id0001")
+
+
+if __name__ == "__main__":
+    test_pages_cover_table_past_server_limit()
+    test_delta_since_high_water_mark()
+    test_overlap_window_rereads_late_commits()
+    test_iter_table_ids()
+    test_indexed_id_set_preload_and_batches()
+    print("All Supabase sync tests passed")
@@ -0,0 +1,157 @@
+"""
+Test the columnar ImageIndex used by the v3 search engine
+"""
+
+import numpy as np
+
+from vector_index import ImageIndex, top_k_rows, diverse_top_k_rows
+
+
+def _unit(seed, dim=512):
+    vec = np.random.default_rng(seed).normal(size=dim).astype(np.float32)
+    return vec / np.linalg.norm(vec)
+
+
+def _entry(seed, folder="Root", objects=None, room_type="unknown"):
+    return {
+        "name": f"img_{seed}.jpg",
+        "embedding": _unit(seed),
+        "objects": objects or [],
+        "colors": [(0, 0, 0)],
+        "folder": folder,
+        "ocr_text": "",
+        "room_type": room_type,
+    }
+
+
+def test_matrix_tracks_dict():
+    """Embeddings are mirrored into the matrix and rows stay dense"""
+    print("Testing ImageIndex matrix sync")
+    index = ImageIndex(initial_capacity=2)
+    for i in range(5):
+        index[f"f{i}"] = _entry(i)
+
+    assert len(index) == 5
+    assert index.matrix.shape == (5, 512)
+    assert "embedding" not in index["f3"]
+    np.testing.assert_allclose(index.matrix[index.row_of("f3")], _unit(3))
+
+    del index["f1"]
+    assert len(index.ids) == 4 and "f1" not in index
+    for fid in index.ids:
+        np.testing.assert_allclose(index.embedding_of(fid), _unit(int(fid[1:])))
+
+    index["f0"] = _entry(42)  # overwrite keeps the same row
+    assert len(index.ids) == 4
+    np.testing.assert_allclose(index.embedding_of("f0"), _unit(42))
+
+    index.clear()
+    assert len(index) == 0 and index.matrix.shape == (0, 512)
+
+
+def test_similarities_match_loop():
+    """One matmul gives the same scores as the old per-image loop"""
+    print("Testing vectorized similarities")
+    index = ImageIndex()
+    for i in range(50):
+        index[f"f{i}"] = _entry(i)
+    query = _unit(1000)
+
+    sims = index.similarities(query)
+    for fid in index:
+        assert abs(sims[index.row_of(fid)] - float(query @ _unit(int(fid[1:])))) < 1e-5
+
+
+def test_top_k_rows():
+    """argpartition top-k returns the best rows in order and skips -inf"""
+    print("Testing top_k_rows")
+    scores = np.array([0.1, 0.9, -np.inf, 0.5, 0.7], dtype=np.float32)
+    assert list(top_k_rows(scores, 2)) == [1, 4]
+    assert list(top_k_rows(scores, 10)) == [1, 4, 3, 0]
+    assert len(top_k_rows(scores, 0)) == 0
+
+
+def test_diverse_top_k_rows():
+    """Folder diversity caps how many results come from one folder"""
+    print("Testing diverse_top_k_rows")
+    scores = np.array([0.99, 0.98, 0.97, 0.5, 0.4], dtype=np.float32)
+    groups = np.array([0, 0, 0, 1, 2])
+    assert list(diverse_top_k_rows(scores, 3, groups, 1)) == [0, 3, 4]
+    assert list(diverse_top_k_rows(scores, 3, groups, 2)) == [0, 1, 3]
+
+
+def test_label_bitsets_and_inverted_index():
+    """Object overlap popcounts and the label -> rows index match set arithmetic"""
+    print("Testing label bitsets")
+    rng = np.random.default_rng(0)
+    vocabulary = [f"label{i}" for i in range(150)]  # more than one 64-bit word
+    index = ImageIndex(initial_capacity=4)
+    objects = {}
+    for i in range(40):
+        objects[f"f{i}"] = list(rng.choice(vocabulary, size=rng.integers(0, 6)))
+        index[f"f{i}"] = _entry(i, objects=objects[f"f{i}"])
+    index["f3"] = _entry(3, objects=["sink", "oven"])  # overwrite replaces the labels
+    objects["f3"] = ["sink", "oven"]
+    del index["f5"]
+    del objects["f5"]
+
+    required = {"sink", "label7", "label120", "never-seen"}
+    overlap = index.label_overlap(required)
+    counts = index.label_counts()
+    for fid, objs in objects.items():
+        row = index.row_of(fid)
+        assert overlap[row] == len(set(objs) & required)
+        assert counts[row] == len(set(objs))
+
+    rows = np.array([index.row_of("f3"), index.row_of("f0")])
+    assert list(index.label_overlap({"oven"}, rows)) == [1, int("oven" in objects["f0"])]
+
+    expected = sorted(index.rows_of(fid for fid, objs in objects.items() if "label7" in objs).tolist())
+    assert list(index.rows_with_labels(["label7"])) == expected
+    assert list(index.rows_with_labels(["sink", "oven"])) == [index.row_of("f3")]
+    assert len(index.rows_with_labels(["never-seen"])) == 0
+
+
+def _reference_color_score(dominant_colors, targets):
+    """The original per-image color_match_score loop"""
+    if not targets or not dominant_colors:
+        return 1.0
+    score = 0
+    for target in targets:
+        min_distance = min(float(np.linalg.norm(np.array(c) - np.array(target))) for c in dominant_colors)
+        score += max(0, 1 - min_distance / np.sqrt(3 * 255 ** 2))
+    return score / len(targets)
+
+
+def test_color_scores_match_loop():
+    """Broadcasted colour scores equal the per-image loop, including ragged colour lists"""
+    print("Testing packed colour scores")
+    rng = np.random.default_rng(1)
+    index = ImageIndex(initial_capacity=2)
+    colors = {}
+    for i in range(30):
+        colors[f"f{i}"] = [tuple(int(v) for v in rng.integers(0, 256, size=3)) for _ in range(rng.integers(0, 6))]
+        entry = _entry(i)
+        entry["colors"] = colors[f"f{i}"]
+        index[f"f{i}"] = entry
+    del index["f2"]
+    del colors["f2"]
+
+    targets = [[128, 0, 128], [250, 250, 250]]
+    scores = index.color_scores(targets)
+    for fid, dominant in colors.items():
+        assert abs(scores[index.row_of(fid)] - _reference_color_score(dominant, targets)) < 1e-5
+
+    rows = np.array([index.row_of("f7"), index.row_of("f1")])
+    np.testing.assert_allclose(index.color_scores(targets, rows), scores[rows])
+    assert np.all(index.color_scores([]) == 1.0)
+
+
+if __name__ == "__main__":
+    test_matrix_tracks_dict()
+    test_similarities_match_loop()
+    test_top_k_rows()
+    test_diverse_top_k_rows()
+    test_label_bitsets_and_inverted_index()
+    test_color_scores_match_loop()
+    print("All ImageIndex tests passed")
@@ -0,0 +1,73 @@
+"""
+Test the batched YOLO detector wrapper against a stand-in model
+"""
+
+import numpy as np
+
+from yolo_detector import YOLODetector, detection_labels
+
+
+class _FakePILImage:
+    """Solid-colour stand-in for a PIL image (only np.asarray is used)"""
+
+    def __init__(self, rgb, size=(32, 32)):
+        self.pixels = np.full((size[1], size[0], 3), rgb, dtype=np.uint8)
+
+    def __array__(self, dtype=None, copy=None):
+        return self.pixels
+
+
+class _FakeBoxes:
+    def __init__(self, data):
+        self.data = np.asarray(data, dtype=np.float32).reshape(-1, 6)
+
+
+class _FakeYOLO:
+    """Records predict calls; 'detects' one box whose class comes from the first pixel's channel 0"""
+    names = {0: "Person", 1: "couch", 2: "dining table"}
+
+    def __init__(self):
+        self.calls = []
+
+    def predict(self, source, imgsz, conf, verbose):
+        self.calls.append({"count": len(source), "imgsz": imgsz, "conf": conf, "verbose": verbose, "source": source})
+        results = []
+        for image in source:
+            first = np.asarray(image)[0, 0]
+            cls = int(first[0]) % 3  # channel 0 as the model sees it
+            results.append(type("Result", (), {"boxes": _FakeBoxes([[10.7, 20.2, 110.9, 70.5, 0.9, cls]] if cls else [])})())
+        return results
+
+
+def test_batches_and_structured_detections():
+    """Images are detected in batch_size chunks with the configured imgsz/conf and come back in order"""
+    print("Testing batched detection")
+    model = _FakeYOLO()
+    detector = YOLODetector(model, imgsz=416, conf=0.4, batch_size=4)
+    images = [_FakePILImage((i, 0, 0)) for i in range(10)]
+    detections = detector.detect(images)
+
+    assert [call["count"] for call in model.calls] == [4, 4, 2]
+    assert all(call["imgsz"] == 416 and call["conf"] == 0.4 and call["verbose"] is False for call in model.calls)
+    assert len(detections) == 10 and detections[0] == [] and detections[3] == []
+    assert detections[1] == [{"label": "couch", "confidence": detections[1][0]["confidence"],
+                              "bbox": {"x": 10, "y": 20, "w": 100, "h": 50}}]
+    assert abs(detections[1][0]["confidence"] - 0.9) < 1e-6
+    assert detection_labels(detections[2]) == ["dining table"]
+
+
+def test_numpy_input_is_converted_to_bgr():
+    """RGB numpy arrays reach the model in BGR order; PIL images pass through untouched"""
+    print("Testing numpy channel order")
+    model = _FakeYOLO()
+    detector = YOLODetector(model)
+    rgb = np.zeros((8, 8, 3), dtype=np.uint8)
+    rgb[..., 2] = 1  # blue in RGB -> first channel in BGR -> class 1
+    assert detection_labels(detector.detect_one(rgb)) == ["couch"]
+    assert model.calls[0]["source"][0][0, 0].tolist() == [1, 0, 0]
+
+
+if __name__ == "__main__":
+    test_batches_and_structured_detections()
+    test_numpy_input_is_converted_to_bgr()
+    print("All YOLO detector tests passed")
@@ -0,0 +1,454 @@
+"""
+Columnar in-memory image index for the v3 search engine
+- Drop-in replacement for the plain `image_index` dict (file_id -> metadata)
+- CLIP embeddings mirrored into one contiguous float32 N x 512 matrix
+- Folder / room type kept as integer codes for vectorized filtering
+- YOLO labels kept as per-row uint64 bitsets plus an inverted label -> ids index
+- Dominant colours packed into an N x k x 3 float32 tensor for broadcasted matching
+- Top-k selection helpers (matmul + argpartition) shared by all search paths
+"""
+
+import json
+import threading
+from typing import Dict, Iterable, List, Optional, Set
+
+import numpy as np
+
+EMBEDDING_DIM = 512
+MAX_RGB_DISTANCE = float(np.sqrt(3 * 255 ** 2))
+
+_POPCOUNT_TABLE = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def to_embedding_row(embedding, dim: int = EMBEDDING_DIM) -> np.ndarray:
+    """Convert a torch tensor / list / pgvector string into a flat float32 row"""
+    if isinstance(embedding, str):
+        # pgvector columns come back from PostgREST as "[0.1,0.2,...]"
+        embedding = json.loads(embedding)
+    if hasattr(embedding, "detach"):
+        embedding = embedding.detach().cpu().numpy()
+    row = np.asarray(embedding, dtype=np.float32).reshape(-1)
+    if row.shape[0] != dim:
+        raise ValueError(f"Expected embedding of size {dim}, got {row.shape[0]}")
+    return row
+
+
+def popcount_rows(words: np.ndarray) -> np.ndarray:
+    """Number of set bits in each row of a (rows x words) uint64 bitset matrix"""
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(words).sum(axis=-1, dtype=np.int32)
+    words = np.ascontiguousarray(words)
+    return _POPCOUNT_TABLE[words.view(np.uint8)].sum(axis=-1, dtype=np.int32)
+
+
+class _Vocabulary:
+    """Maps string labels (folders, room types) to dense integer codes"""
+
+    def __init__(self):
+        self.codes: Dict[str, int] = {}
+        self.labels: List[str] = []
+
+    def encode(self, label: str) -> int:
+        code = self.codes.get(label)
+        if code is None:
+            code = len(self.labels)
+            self.codes[label] = code
+            self.labels.append(label)
+        return code
+
+    def lookup(self, label: str) -> int:
+        """Return the code for a label, or -1 if it has never been seen"""
+        return self.codes.get(label, -1)
+
+
+class ImageIndex(dict):
+    """
+    Dict of file_id -> image metadata whose embeddings live in a shared matrix.
+
+    Assigning `index[file_id] = {...,"embedding": tensor}` stores the metadata
+    (without the embedding) in the dict and writes the embedding into row
+    `index.row_of(file_id)` of `index.matrix`. Rows are kept dense: deleting an
+    entry moves the last row into the freed slot.
+    """
+
+    def __init__(self, dim: int = EMBEDDING_DIM, initial_capacity: int = 1024, color_slots: int = 3):
+        super().__init__()
+        self.dim = dim
+        self._lock = threading.RLock()
+        self._capacity = max(1, initial_capacity)
+        self._matrix = np.zeros((self._capacity, dim), dtype=np.float32)
+        self._folder_codes = np.zeros(self._capacity, dtype=np.int32)
+        self._room_codes = np.zeros(self._capacity, dtype=np.int32)
+        self._label_bits = np.zeros((self._capacity, 1), dtype=np.uint64)
+        self._colors = np.zeros((self._capacity, max(1, color_slots), 3), dtype=np.float32)
+        self._color_counts = np.zeros(self._capacity, dtype=np.int32)
+        self._ids: List[str] = []
+        self._rows: Dict[str, int] = {}
+        self._label_postings: Dict[int, Set[str]] = {}
+        self._ocr_texts: List[str] = []
+        self.folders = _Vocabulary()
+        self.rooms = _Vocabulary()
+        self.labels = _Vocabulary()
+        self._listeners = []
+
+    @property
+    def lock(self) -> threading.RLock:
+        """Held while the index changes (listeners are notified under it)"""
+        return self._lock
+
+    def add_listener(self, listener):
+        """
+        Register an object notified of every change (e.g. an ANN index).
+        It must implement add(file_id, vector), remove(file_id) and reset().
+        """
+        self._listeners.append(listener)
+
+    # ---------------------------
+    # dict interface
+    # ---------------------------
+    def __setitem__(self, file_id, data):
+        data = dict(data)
+        embedding = to_embedding_row(data.pop("embedding"), self.dim)
+        with self._lock:
+            row = self._rows.get(file_id)
+            if row is None:
+                row = len(self._ids)
+                self._ensure_capacity(row + 1)
+                self._ids.append(file_id)
+                self._rows[file_id] = row
+                self._ocr_texts.append("")
+            else:
+                self._unpost_labels(file_id, row)
+            self._matrix[row] = embedding
+            self._write_columns(row, data)
+            super().__setitem__(file_id, data)
+            for listener in self._listeners:
+                listener.add(file_id, embedding)
+
+    def __delitem__(self, file_id):
+        with self._lock:
+            super().__delitem__(file_id)
+            row = self._rows.pop(file_id)
+            self._unpost_labels(file_id, row)
+            last = len(self._ids) - 1
+            if row != last:
+                moved_id = self._ids[last]
+                self._matrix[row] = self._matrix[last]
+                self._folder_codes[row] = self._folder_codes[last]
+                self._room_codes[row] = self._room_codes[last]
+                self._label_bits[row] = self._label_bits[last]
+                self._colors[row] = self._colors[last]
+                self._color_counts[row] = self._color_counts[last]
+                self._ocr_texts[row] = self._ocr_texts[last]
+                self._ids[row] = moved_id
+                self._rows[moved_id] = row
+            self._label_bits[last] = 0
+            self._ids.pop()
+            self._ocr_texts.pop()
+            for listener in self._listeners:
+                listener.remove(file_id)
+
+    def pop(self, file_id, *default):
+        with self._lock:
+            if file_id not in self:
+                if default:
+                    return default[0]
+                raise KeyError(file_id)
+            value = dict.__getitem__(self, file_id)
+            del self[file_id]
+            return value
+
+    def popitem(self):
+        with self._lock:
+            if not self:
+                raise KeyError("popitem(): index is empty")
+            file_id = self._ids[-1]
+            return file_id, self.pop(file_id)
+
+    def setdefault(self, file_id, default=None):
+        if file_id not in self:
+            self[file_id] = default
+        return dict.__getitem__(self, file_id)
+
+    def update(self, *args, **kwargs):
+        for file_id, data in dict(*args, **kwargs).items():
+            self[file_id] = data
+
+    def clear(self):
+        with self._lock:
+            super().clear()
+            self._ids = []
+            self._rows = {}
+            self._label_bits = np.zeros((self._capacity, 1), dtype=np.uint64)
+            self._label_postings = {}
+            self._ocr_texts = []
+            self.folders = _Vocabulary()
+            self.rooms = _Vocabulary()
+            self.labels = _Vocabulary()
+            for listener in self._listeners:
+                listener.reset()
+
+    def copy(self):
+        return {file_id: dict(data) for file_id, data in self.items()}
+
+    # ---------------------------
+    # bulk load / export (snapshots)
+    # ---------------------------
+    def load_bulk(self, file_ids: List[str], entries: List[dict], matrix: np.ndarray):
+        """
+        Replace the whole index with `entries` (metadata without embeddings) whose
+        embeddings are the rows of `matrix`. A float32 matrix - e.g. a copy-on-write
+        memmap of a snapshot - is adopted as-is, so rows are only paged in when
+        touched; it is copied into RAM once the index outgrows it.
+        """
+        if matrix.dtype != np.float32 or matrix.ndim != 2 or matrix.shape[1] != self.dim:
+            matrix = np.ascontiguousarray(matrix, dtype=np.float32).reshape(-1, self.dim)
+        n = len(file_ids)
+        if len(entries) != n or matrix.shape[0] != n or len(set(file_ids)) != n:
+            raise ValueError(f"Inconsistent bulk load: {n} ids, {len(entries)} entries, {matrix.shape[0]} rows")
+        with self._lock:
+            dict.clear(self)
+            self._capacity = max(1, n)
+            self._matrix = matrix if n else np.zeros((1, self.dim), dtype=np.float32)
+            self._folder_codes = np.zeros(self._capacity, dtype=np.int32)
+            self._room_codes = np.zeros(self._capacity, dtype=np.int32)
+            self._label_bits = np.zeros((self._capacity, 1), dtype=np.uint64)
+            self._colors = np.zeros((self._capacity,) + self._colors.shape[1:], dtype=np.float32)
+            self._color_counts = np.zeros(self._capacity, dtype=np.int32)
+            self._ids = list(file_ids)
+            self._rows = {file_id: row for row, file_id in enumerate(self._ids)}
+            self._label_postings = {}
+            self._ocr_texts = [""] * n
+            self.folders = _Vocabulary()
+            self.rooms = _Vocabulary()
+            self.labels = _Vocabulary()
+            for row, (file_id, data) in enumerate(zip(self._ids, entries)):
+                data = dict(data)
+                data.pop("embedding", None)
+                self._write_columns(row, data)
+                dict.__setitem__(self, file_id, data)
+            for listener in self._listeners:
+                if hasattr(listener, "rebuild"):
+                    listener.rebuild()
+                else:
+                    listener.reset()
+                    for row, file_id in enumerate(self._ids):
+                        listener.add(file_id, self._matrix[row])
+
+    def export(self, include=None):
+        """
+        Consistent copy of (file_ids, metadata dicts, N x dim matrix), optionally
+        only for entries where `include(metadata)` is true.
+        """
+        with self._lock:
+            rows = [row for row, file_id in enumerate(self._ids)
+                    if include is None or include(dict.__getitem__(self, file_id))]
+            file_ids = [self._ids[row] for row in rows]
+            entries = [dict(dict.__getitem__(self, file_id)) for file_id in file_ids]
+            matrix = self._matrix[np.asarray(rows, dtype=np.int64)]
+        return file_ids, entries, matrix
+
+    # ---------------------------
+    # columnar views
+    # ---------------------------
+    @property
+    def matrix(self) -> np.ndarray:
+        """N x dim float32 view of all embeddings, row i belongs to ids[i]"""
+        return self._matrix[:len(self._ids)]
+
+    @property
+    def ids(self) -> List[str]:
+        return self._ids
+
+    @property
+    def folder_codes(self) -> np.ndarray:
+        return self._folder_codes[:len(self._ids)]
+
+    @property
+    def room_codes(self) -> np.ndarray:
+        return self._room_codes[:len(self._ids)]
+
+    @property
+    def label_bits(self) -> np.ndarray:
+        """N x words uint64 matrix, bit `labels.codes[label]` set if the image has that label"""
+        return self._label_bits[:len(self._ids)]
+
+    def row_of(self, file_id: str) -> Optional[int]:
+        return self._rows.get(file_id)
+
+    def rows_of(self, file_ids: Iterable[str]) -> np.ndarray:
+        """Rows of the given file ids, silently skipping unknown ids"""
+        rows = [self._rows[fid] for fid in file_ids if fid in self._rows]
+        return np.asarray(rows, dtype=np.int64)
+
+    def embedding_of(self, file_id: str) -> np.ndarray:
+        return self._matrix[self._rows[file_id]].copy()
+
+    def embedding_row(self, embedding) -> np.ndarray:
+        """Normalize a query embedding (tensor, list, ...) to a float32 row"""
+        return to_embedding_row(embedding, self.dim)
+
+    def column(self, key: str, default=None, rows=None) -> list:
+        """Row-ordered list of a metadata field (e.g. 'colors'), optionally for given rows only"""
+        ids = self._ids if rows is None else [self._ids[row] for row in rows]
+        return [dict.__getitem__(self, fid).get(key, default) for fid in ids]
+
+    def label_mask(self, labels: Iterable[str]) -> np.ndarray:
+        """Bitset of the given labels; labels that no image has are ignored"""
+        mask = np.zeros(self._label_bits.shape[1], dtype=np.uint64)
+        for label in labels:
+            code = self.labels.lookup(label)
+            if code >= 0:
+                mask[code >> 6] |= np.uint64(1) << np.uint64(code & 63)
+        return mask
+
+    def label_overlap(self, labels: Iterable[str], rows=None) -> np.ndarray:
+        """Per-row |objects & labels| computed as a popcount, optionally for given rows only"""
+        with self._lock:
+            bits = self.label_bits if rows is None else self._label_bits[rows]
+            return popcount_rows(bits & self.label_mask(labels))
+
+    def label_counts(self, rows=None) -> np.ndarray:
+        """Per-row number of distinct labels"""
+        with self._lock:
+            bits = self.label_bits if rows is None else self._label_bits[rows]
+            return popcount_rows(bits)
+
+    def rows_with_labels(self, labels: Iterable[str], match_all: bool = True) -> np.ndarray:
+        """Sorted rows of images having all (or any) of the labels, via the inverted index"""
+        with self._lock:
+            postings = [self._label_postings.get(self.labels.lookup(label), set()) for label in set(labels)]
+            if not postings:
+                return np.empty(0, dtype=np.int64)
+            file_ids = set.intersection(*postings) if match_all else set.union(*postings)
+            return np.sort(self.rows_of(file_ids))
+
+    def color_scores(self, targets, rows=None) -> np.ndarray:
+        """
+        Vectorized color_match_score: for every row, the mean over target RGB
+        colours of 1 - (distance to the closest dominant colour) / max distance.
+        Rows without colours score 1.0, as do all rows when there are no targets.
+        """
+        with self._lock:
+            colors = self._colors[:len(self._ids)] if rows is None else self._colors[rows]
+            counts = self._color_counts[:len(self._ids)] if rows is None else self._color_counts[rows]
+        targets = np.asarray(targets, dtype=np.float32).reshape(-1, 3)
+        if len(targets) == 0:
+            return np.ones(len(counts), dtype=np.float32)
+        # rows x slots x targets distances, unused slots pushed to +inf
+        distances = np.linalg.norm(colors[:, :, None, :] - targets[None, None, :, :], axis=-1)
+        valid = np.arange(colors.shape[1])[None, :] < counts[:, None]
+        distances = np.where(valid[:, :, None], distances, np.inf)
+        similarity = np.maximum(0.0, 1.0 - distances.min(axis=1) / MAX_RGB_DISTANCE)
+        scores = similarity.mean(axis=1).astype(np.float32)
+        scores[counts == 0] = 1.0
+        return scores
+
+    def ocr_rows(self):
+        """Yield (row, lowercased OCR text) for rows that have OCR text"""
+        for row, text in enumerate(self._ocr_texts):
+            if text:
+                yield row, text
+
+    def similarities(self, query) -> np.ndarray:
+        """Dot product of a (normalized) query embedding against every row (one entry per row)"""
+        query = self.embedding_row(query)
+        with self._lock:
+            matrix = self.matrix
+        return matrix @ query
+
+    # ---------------------------
+    # internals
+    # ---------------------------
+    def _ensure_capacity(self, size: int):
+        if size <= self._capacity:
+            return
+        new_capacity = max(size, self._capacity * 2)
+        matrix = np.zeros((new_capacity, self.dim), dtype=np.float32)
+        matrix[:len(self._ids)] = self._matrix[:len(self._ids)]
+        self._matrix = matrix
+        self._folder_codes = np.resize(self._folder_codes, new_capacity)
+        self._room_codes = np.resize(self._room_codes, new_capacity)
+        label_bits = np.zeros((new_capacity, self._label_bits.shape[1]), dtype=np.uint64)
+        label_bits[:len(self._ids)] = self._label_bits[:len(self._ids)]
+        self._label_bits = label_bits
+        colors = np.zeros((new_capacity,) + self._colors.shape[1:], dtype=np.float32)
+        colors[:len(self._ids)] = self._colors[:len(self._ids)]
+        self._colors = colors
+        self._color_counts = np.resize(self._color_counts, new_capacity)
+        self._capacity = new_capacity
+
+    def _unpost_labels(self, file_id: str, row: int):
+        """Drop file_id from the inverted index entries of the labels set in `row`"""
+        bits = np.unpackbits(self._label_bits[row].view(np.uint8), bitorder="little")
+        for code in np.flatnonzero(bits):
+            self._label_postings[int(code)].discard(file_id)
+
+    def _write_columns(self, row: int, data: dict):
+        self._folder_codes[row] = self.folders.encode(data.get("folder") or "Root")
+        self._room_codes[row] = self.rooms.encode(data.get("room_type") or "unknown")
+        codes = {self.labels.encode(label) for label in data.get("objects") or []}
+        if codes and max(codes) >= self._label_bits.shape[1] * 64:
+            extra_words = max(codes) // 64 + 1 - self._label_bits.shape[1]
+            self._label_bits = np.hstack([self._label_bits, np.zeros((self._capacity, extra_words), dtype=np.uint64)])
+        self._label_bits[row] = 0
+        for code in codes:
+            self._label_bits[row, code >> 6] |= np.uint64(1) << np.uint64(code & 63)
+            self._label_postings.setdefault(code, set()).add(self._ids[row])
+        self._ocr_texts[row] = (data.get("ocr_text") or "").lower()
+        self._write_colors(row, data.get("colors"))
+
+    def _write_colors(self, row: int, colors):
+        try:
+            packed = np.asarray(colors if colors else [], dtype=np.float32).reshape(-1, 3)
+        except (TypeError, ValueError):
+            packed = np.zeros((0, 3), dtype=np.float32)  # malformed colours are treated as "no colours"
+        if len(packed) > self._colors.shape[1]:
+            extra = len(packed) - self._colors.shape[1]
+            self._colors = np.concatenate([self._colors, np.zeros((self._capacity, extra, 3), dtype=np.float32)], axis=1)
+        self._colors[row, :len(packed)] = packed
+        self._color_counts[row] = len(packed)
+
+
+def top_k_rows(scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    Indices of the k highest finite scores, best first.
+
+    Uses argpartition so the cost is O(N) + O(k log k) instead of a full sort.
+    Rows scored -inf (filtered out) are never returned.
+    """
+    n = scores.shape[0]
+    if k <= 0 or n == 0:
+        return np.empty(0, dtype=np.int64)
+    if k < n:
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(n)
+    order = np.lexsort((candidates, -scores[candidates]))
+    ranked = candidates[order]
+    return ranked[np.isfinite(scores[ranked])]
+
+
+def diverse_top_k_rows(scores: np.ndarray, k: int, groups: np.ndarray, max_per_group: int) -> np.ndarray:
+    """
+    Best k rows taking at most `max_per_group` rows from each group (folder).
+
+    Equivalent to ranking everything and walking the list greedily, but only
+    ranks a growing prefix of candidates so the common case stays O(N).
+    """
+    n = scores.shape[0]
+    window = min(n, max(4 * k, 64))
+    while True:
+        ranked = top_k_rows(scores, window)
+        picked = []
+        per_group: Dict[int, int] = {}
+        for row in ranked:
+            group = int(groups[row])
+            if per_group.get(group, 0) < max_per_group:
+                per_group[group] = per_group.get(group, 0) + 1
+                picked.append(row)
+                if len(picked) == k:
+                    return np.asarray(picked, dtype=np.int64)
+        if window >= n or len(ranked) < window:
+            return np.asarray(picked, dtype=np.int64)
+        window = min(n, window * 4)